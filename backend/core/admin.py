@@ -18,6 +18,7 @@ from .models import (
     BattleVote,
     SpecialRoundScoreLog,
     BGDScore,
+    ContestStanding,
 )
 
 admin.site.register(SpecialRoundPair)
@@ -218,6 +219,13 @@ class BGDScoreAdmin(admin.ModelAdmin):
     list_display = ("bgd", "cuocThi", "vongThi", "thiSinh", "diem", "created_at", "updated_at")
     list_filter = ("cuocThi", "bgd")
     search_fields = ("bgd__maBGD", "cuocThi__ma", "thiSinh__maNV", "thiSinh__hoTen")
+@admin.register(ContestStanding)
+class ContestStandingAdmin(admin.ModelAdmin):
+    list_display = ("cuocThi", "thiSinh", "total", "total_time", "done", "updated_at")
+    list_filter = ("cuocThi",)
+    search_fields = ("thiSinh__maNV", "thiSinh__hoTen")
+    readonly_fields = ("per_test", "total", "total_time", "done", "updated_at")
+
 from .models import ThiSinhVoting, VotingRecord  # <-- THÊM import
 
 @admin.register(ThiSinhVoting)
@@ -0,0 +1,233 @@
+# core/bgd_score.py
+"""
+Đường ghi điểm Ban Giám Đốc: mỗi lượt chấm là 1 số câu lệnh cố định.
+
+- BGDScore giữ điểm thô của từng BGD; BGDScoreTotal giữ tổng + số lượt chấm chạy theo
+  (cuộc thi, vòng, thí sinh), cộng phần chênh lệch trong cùng transaction (khoá dòng
+  total) -> điểm trung bình đọc từ 1 dòng, không gom lại BGDScore.
+- Phiếu đại diện (giám khảo đại diện, bài "BGD - <vòng>") = điểm trung bình, ghi 1 lần
+  bằng upsert_sheets (ON CONFLICT); bảng xếp hạng / cache cập nhật sau commit.
+- Ghi bằng upsert / update() nên không bắn signal của BGDScore (sync_phieu_cham_from_bgdscore
+  chỉ còn cho chỗ sửa ngoài luồng như admin); màn hình nhận thay đổi qua sự kiện "score"
+  của bảng xếp hạng (phiếu đại diện đổi).
+- record_scores(): mọi điểm của 1 BGD trong 1 lần gửi (trang chấm sao) -> upsert hàng loạt,
+  tính lại TB các thí sinh liên quan bằng 1 câu GROUP BY; số câu lệnh không tăng theo số thí sinh.
+- recompute(): dựng lại total + phiếu đại diện từ BGDScore bằng 1 câu GROUP BY.
+
+Thứ tự khoá: dòng total (theo mã thí sinh) trước, rồi mới ghi BGDScore -> chấm lẻ và
+chấm hàng loạt chồng nhau không deadlock.
+"""
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from .models import BaiThi, BGDScore, BGDScoreTotal, GiamKhao, PhieuChamDiem, ScoreWriteContext, ThiSinh
+from .score_write import upsert_sheets
+
+BGD_TEST_PREFIX = "BGD - "
+BGD_SCORE_UNIQUE_FIELDS = ["bgd", "cuocThi", "vongThi", "thiSinh"]
+TOTAL_UNIQUE_FIELDS = ["cuocThi", "vongThi", "thiSinh"]
+
+
+def normalize_score(score_val, mode):
+    """Điểm gửi lên (đã kẹp 0..100) -> điểm lưu theo mode: "stars" = nấc 20, "score" = làm tròn."""
+    if mode == "stars":
+        # Map 1–5 sao => 20–100 (nấc 20 điểm); 0 điểm = chưa chấm
+        if score_val <= 0:
+            return 0
+        star = min(5, max(1, int(round(score_val / 20.0))))
+        return star * 20
+    # mode "score": giữ nguyên 0..100 (chấm slider)
+    return int(round(score_val))
+
+
+def bgd_test(vt):
+    """Bài thi gắn điểm BGD của vòng (tạo lần đầu cần)."""
+    bt, _ = BaiThi.objects.get_or_create(
+        vongThi=vt,
+        tenBaiThi=f"{BGD_TEST_PREFIX}{vt.tenVongThi}",
+        defaults={"cachChamDiem": 100, "phuongThucCham": "POINTS"},
+    )
+    bt.vongThi = vt  # upsert_sheets đọc bt.vongThi
+    return bt
+
+
+def representative_judge():
+    """Giám khảo ĐẠI DIỆN CỐ ĐỊNH của phiếu BGD: ADMIN mã nhỏ nhất, không có thì giám khảo mã nhỏ nhất."""
+    return (
+        GiamKhao.objects.filter(role="ADMIN").order_by("maNV").first()
+        or GiamKhao.objects.order_by("maNV").first()
+    )
+
+
+def _locked_total(ct, vt, ts_id):
+    total, created = BGDScoreTotal.objects.get_or_create(cuocThi=ct, vongThi=vt, thiSinh_id=ts_id)
+    if created:
+        return total
+    return BGDScoreTotal.objects.select_for_update().get(pk=total.pk)
+
+
+def _write_sheets(ct, vt, bt, judge, averages):
+    """
+    averages: {thiSinh_id: điểm TB} -> upsert phiếu đại diện. -> {thiSinh_id: "created" | "updated"}
+    Phiếu mới tạo: xoá phiếu BGD của giám khảo khác (đại diện cũ) để chỉ còn 1 phiếu.
+    """
+    statuses = upsert_sheets(ct, judge, [
+        (ThiSinh(pk=ts_id), bt, round(avg, 2), 0) for ts_id, avg in averages.items()
+    ], rules=ScoreWriteContext(judge, representative=True))
+    statuses = {ts_id: st for (ts_id, _), st in statuses.items()}
+    created = [ts_id for ts_id, st in statuses.items() if st == "created"]
+    if created:
+        PhieuChamDiem.objects.filter(
+            cuocThi=ct, vongThi=vt, baiThi=bt, thiSinh_id__in=created,
+        ).exclude(giamKhao=judge).delete()
+    return statuses
+
+
+def record_score(ct, vt, bt, judge, bgd, thi_sinh, diem):
+    """
+    1 lượt chấm của 1 BGD cho 1 thí sinh (bt = bgd_test(vt), judge = representative_judge()).
+    -> (BGDScore mới tạo?, điểm TB, số BGD đã chấm, "created" | "updated" của phiếu đại diện)
+    """
+    with transaction.atomic():
+        # khoá total trước: 2 lượt chấm cùng thí sinh chạy lần lượt, chênh lệch không lệch nhau
+        total = _locked_total(ct, vt, thi_sinh.pk)
+        old = (
+            BGDScore.objects.filter(bgd=bgd, cuocThi=ct, vongThi=vt, thiSinh=thi_sinh)
+            .values_list("diem", flat=True)
+            .first()
+        )
+        BGDScore.objects.bulk_create(
+            [BGDScore(bgd=bgd, cuocThi=ct, vongThi=vt, thiSinh=thi_sinh, diem=diem)],
+            update_conflicts=True,
+            unique_fields=BGD_SCORE_UNIQUE_FIELDS,
+            update_fields=["diem", "updated_at"],
+        )
+        total.score_sum += diem - (old or 0)
+        total.score_count += 1 if old is None else 0
+        total.save(update_fields=["score_sum", "score_count", "updated_at"])
+
+        statuses = _write_sheets(ct, vt, bt, judge, {thi_sinh.pk: total.average})
+    return old is None, total.average, total.score_count, statuses[thi_sinh.pk]
+
+
+def _lock_totals(ct, vt, ts_ids):
+    """Khoá dòng total của ts_ids (tạo nếu chưa có) theo thứ tự mã thí sinh."""
+    BGDScoreTotal.objects.bulk_create(
+        [BGDScoreTotal(cuocThi=ct, vongThi=vt, thiSinh_id=ts_id) for ts_id in sorted(ts_ids)],
+        ignore_conflicts=True,
+    )
+    list(
+        BGDScoreTotal.objects.filter(cuocThi=ct, vongThi=vt, thiSinh_id__in=ts_ids)
+        .select_for_update()
+        .order_by("thiSinh_id")
+        .values_list("pk", flat=True)
+    )
+
+
+def _regroup(ct, vt, ts_ids):
+    """
+    Trong transaction, sau _lock_totals: tổng + số lượt chấm của ts_ids từ BGDScore (1 câu GROUP BY)
+    -> ghi đè total. Thí sinh không còn điểm -> xoá total. -> ({thiSinh_id: (tổng, số lượt)}, {thiSinh_id bị bỏ})
+    """
+    grouped = {
+        g["thiSinh_id"]: (int(g["total"] or 0), g["cnt"])
+        for g in BGDScore.objects.filter(cuocThi=ct, vongThi=vt, thiSinh_id__in=ts_ids)
+        .values("thiSinh_id")
+        .annotate(total=Sum("diem"), cnt=Count("pk"))
+    }
+    now = timezone.now()
+    BGDScoreTotal.objects.bulk_create(
+        [
+            BGDScoreTotal(
+                cuocThi=ct, vongThi=vt, thiSinh_id=ts_id,
+                score_sum=total, score_count=cnt, updated_at=now,
+            )
+            for ts_id, (total, cnt) in sorted(grouped.items())
+        ],
+        update_conflicts=True,
+        unique_fields=TOTAL_UNIQUE_FIELDS,
+        update_fields=["score_sum", "score_count", "updated_at"],
+    )
+    gone = set(ts_ids) - set(grouped)
+    if gone:
+        BGDScoreTotal.objects.filter(cuocThi=ct, vongThi=vt, thiSinh_id__in=gone).delete()
+    return grouped, gone
+
+
+def record_scores(ct, vt, bt, judge, bgd, scores):
+    """
+    Nhiều điểm của 1 BGD cùng lúc: scores = {thiSinh_id: điểm đã chuẩn hoá}.
+    -> {thiSinh_id: (BGDScore mới tạo?, điểm TB, số BGD đã chấm, "created" | "updated" của phiếu đại diện)}
+    """
+    if not scores:
+        return {}
+
+    with transaction.atomic():
+        _lock_totals(ct, vt, scores)
+        had = set(
+            BGDScore.objects.filter(bgd=bgd, cuocThi=ct, vongThi=vt, thiSinh_id__in=scores)
+            .values_list("thiSinh_id", flat=True)
+        )
+        BGDScore.objects.bulk_create(
+            [
+                BGDScore(bgd=bgd, cuocThi=ct, vongThi=vt, thiSinh_id=ts_id, diem=diem)
+                for ts_id, diem in sorted(scores.items())
+            ],
+            update_conflicts=True,
+            unique_fields=BGD_SCORE_UNIQUE_FIELDS,
+            update_fields=["diem", "updated_at"],
+        )
+        grouped, _ = _regroup(ct, vt, list(scores))
+
+        averages = {ts_id: total / cnt for ts_id, (total, cnt) in grouped.items()}
+        statuses = _write_sheets(ct, vt, bt, judge, averages)
+    return {
+        ts_id: (ts_id not in had, averages[ts_id], grouped[ts_id][1], statuses[ts_id])
+        for ts_id in scores
+    }
+
+
+def recompute(ct, vt, ts_ids=None, create_sheets=True):
+    """
+    Dựng lại BGDScoreTotal và phiếu đại diện từ BGDScore (1 câu GROUP BY) cho các thí sinh
+    ts_ids (None = cả vòng). Thí sinh không còn điểm BGD nào -> bỏ total và phiếu đại diện.
+    create_sheets=False (BGDScore sửa ngoài luồng: admin, shell): chỉ cập nhật phiếu đại diện
+    ĐÃ CÓ, không tạo phiếu / bài BGD mới cho thí sinh chưa từng chấm qua trang BGD.
+    -> {thiSinh_id: điểm TB}
+    """
+    if ts_ids is None:
+        ts_ids = set(
+            BGDScore.objects.filter(cuocThi=ct, vongThi=vt).values_list("thiSinh_id", flat=True)
+        ) | set(
+            BGDScoreTotal.objects.filter(cuocThi=ct, vongThi=vt).values_list("thiSinh_id", flat=True)
+        )
+    if not ts_ids:
+        return {}
+
+    if create_sheets:
+        bt = bgd_test(vt)
+    else:
+        bt = BaiThi.objects.filter(vongThi=vt, tenBaiThi=f"{BGD_TEST_PREFIX}{vt.tenVongThi}").first()
+        if bt:
+            bt.vongThi = vt
+    judge = representative_judge()
+    with transaction.atomic():
+        _lock_totals(ct, vt, ts_ids)
+        grouped, gone = _regroup(ct, vt, ts_ids)
+        if gone and bt:
+            PhieuChamDiem.objects.filter(
+                cuocThi=ct, vongThi=vt, baiThi=bt, thiSinh_id__in=gone,
+            ).delete()
+
+        averages = {ts_id: total / cnt for ts_id, (total, cnt) in grouped.items()}
+        sheets = averages
+        if bt and not create_sheets:
+            has_sheet = set(
+                PhieuChamDiem.objects.filter(cuocThi=ct, vongThi=vt, baiThi=bt, thiSinh_id__in=averages)
+                .values_list("thiSinh_id", flat=True)
+            )
+            sheets = {ts_id: avg for ts_id, avg in averages.items() if ts_id in has_sheet}
+        if judge and bt and sheets:
+            _write_sheets(ct, vt, bt, judge, sheets)
+    return averages
@@ -0,0 +1,111 @@
+# core/bgd_top.py
+"""
+Top X của vòng BGD: tính 1 lần, chốt thành danh sách có thứ tự (BGDTopEntry), trang BGD
+(bgd_go / bgd_go_stars) đọc lại danh sách đã chốt bằng 1 truy vấn.
+
+- compute_top(): chọn Top X từ ma trận điểm của cả cuộc thi (ContestScoreMatrix).
+- lock_top(): tính lại và thay danh sách đã chốt — nút "Bắt đầu lấy Top" / "Tính lại Top"
+  ở /organize/ và lệnh `manage.py lock_bgd_top`.
+- locked_top(): danh sách đã chốt; vòng chưa chốt (cấu hình từ trước khi có snapshot)
+  -> chốt ngay ở lần mở đầu tiên, các lần sau không tính lại.
+"""
+from django.db import transaction
+
+from .models import BGDTopEntry, ThiSinh, VongThi
+from .score_matrix import ContestScoreMatrix
+
+
+def compute_top(ct, vt_bgd):
+    """
+    Chọn danh sách thí sinh cho vòng BGD hiện tại (vt_bgd) theo cấu hình Top X.
+
+    Nếu có vòng BGD liền trước (ví dụ Top10 trước Top5):
+      - Dùng vòng BGD trước để LỌC danh sách (chỉ lấy những thí sinh đã có điểm ở vòng đó)
+      - Nhưng XẾP HẠNG để lấy Top X vòng hiện tại theo TỔNG ĐIỂM TOÀN CUỘC THI (total_diem)
+    Nếu không có vòng BGD trước:
+      - Fallback: lấy tổng điểm các vòng KHÔNG phải BGD
+    -> [thiSinh_id] theo thứ tự.
+    """
+    if not (ct and vt_bgd and vt_bgd.bgd_top_limit):
+        return []
+
+    prev_bgd_round = (
+        VongThi.objects.filter(cuocThi=ct, is_bgd_round=True, id__lt=vt_bgd.id)
+        .order_by("-id")
+        .first()
+    )
+
+    prev_special_round = (
+        VongThi.objects.filter(cuocThi=ct, is_special_bonus_round=True, id__lt=vt_bgd.id)
+        .order_by("-id")
+        .first()
+    )
+
+    # Tổng điểm / tổng thời gian là SUM thô trên phiếu (không lấy TB theo bài)
+    matrix = ContestScoreMatrix.for_contest(ct)
+    if prev_bgd_round:
+        # Tính trên toàn bộ phiếu, chỉ lấy nhóm Top trước (đã có điểm ở vòng BGD trước)
+        base_cols = matrix.columns()
+    else:
+        # Fallback: tổng điểm các vòng KHÔNG phải BGD
+        base_cols = matrix.columns(bgd=False)
+
+    candidates = matrix.has_scores(base_cols)
+    if prev_bgd_round:
+        prev_cols = matrix.columns(rounds=[prev_bgd_round.id])
+        candidates &= matrix.totals("sum", prev_cols) > 0  # ✅ lọc nhóm Top10
+    if prev_special_round:
+        special_cols = base_cols & matrix.columns(rounds=[prev_special_round.id])
+        candidates &= matrix.totals("sum", special_cols) > 0
+
+    # ✅ lấy Top theo tổng điểm, KHÔNG theo điểm vòng Top10: tổng ↓, thời gian ↑, mã NV ↑
+    order = matrix.order(
+        matrix.totals("sum", base_cols),
+        matrix.totals("t_sum", base_cols),
+        rows=candidates,
+    )[: vt_bgd.bgd_top_limit]
+    return [matrix.ts_ids[i] for i in order]
+
+
+def _store(vt_bgd, ts_ids):
+    BGDTopEntry.objects.bulk_create(
+        [BGDTopEntry(vongThi=vt_bgd, thiSinh_id=ts_id, rank=i) for i, ts_id in enumerate(ts_ids, 1)],
+        ignore_conflicts=True,  # 2 request cùng chốt lần đầu: bản nào vào trước thắng
+    )
+
+
+def lock_top(ct, vt_bgd):
+    """Tính lại Top X và thay danh sách đã chốt của vòng. -> số thí sinh đã chốt."""
+    ts_ids = compute_top(ct, vt_bgd)
+    with transaction.atomic():
+        BGDTopEntry.objects.filter(vongThi=vt_bgd).delete()
+        _store(vt_bgd, ts_ids)
+    return len(ts_ids)
+
+
+def clear_top(vt_bgd):
+    """Bỏ danh sách đã chốt (tắt chế độ BGD của vòng)."""
+    BGDTopEntry.objects.filter(vongThi=vt_bgd).delete()
+
+
+def _ordered(vt_bgd):
+    return list(ThiSinh.objects.filter(bgd_top_entries__vongThi=vt_bgd).order_by("bgd_top_entries__rank"))
+
+
+def locked_top(ct, vt_bgd):
+    """
+    -> [ThiSinh] theo thứ tự đã chốt (1 truy vấn).
+    Chưa chốt: tính và chốt luôn (chưa có điểm -> [] và không chốt, lần sau tính lại).
+    """
+    if not (ct and vt_bgd and vt_bgd.bgd_top_limit):
+        return []
+
+    contestants = _ordered(vt_bgd)
+    if contestants:
+        return contestants
+
+    ts_ids = compute_top(ct, vt_bgd)
+    if not ts_ids:
+        return []
+    _store(vt_bgd, ts_ids)
+    return _ordered(vt_bgd)
@@ -0,0 +1,146 @@
+# core/contest_schema.py
+"""
+Cấu trúc chấm điểm đã "biên dịch" của 1 cuộc thi: vòng → bài → cách chấm,
+điểm tối đa, rule thời gian, mẫu chấm (mục lớn / mục con).
+
+Dựng bằng vài câu prefetch cho cả cuộc thi, giữ trong tiến trình (LocalCache)
+tới khi bus báo structure_key của cuộc thi đổi: sửa VongThi / BaiThi / rule
+thời gian / mẫu chấm (signal trong models.py, bulk_create trong views_organize
+tự bump). Form chấm, kiểm tra POST và API mẫu chấm đều đọc từ đây.
+
+digest = sha1 của nội dung -> ETag của /score/schema/<ct_id>/, giống nhau giữa
+các worker vì chỉ phụ thuộc dữ liệu.
+"""
+import hashlib
+import json
+
+from django.db.models import Prefetch
+
+from .invalidation import LocalCache, bus, structure_key
+from .time_rules import TIME_MAX as TIME_FORM_MAX, TimeRuleIndex
+
+
+def score_type(value) -> str:
+    """POINTS / TEMPLATE / TIME (nhận cả mã số cũ 0/1/2)."""
+    s = str(value if value is not None else "").strip().upper()
+    if s in {"TIME", "2"}:
+        return "TIME"
+    if s in {"TEMPLATE", "1"}:
+        return "TEMPLATE"
+    return "POINTS"
+
+
+class ContestSchema:
+    def __init__(self, ct_id, rounds):
+        self.ct_id = ct_id
+        self.rounds = rounds
+        self.tests = {t["id"]: t for r in rounds for t in r["tests"]}
+        # thang thời gian đã biên dịch (không nằm trong as_dict / digest)
+        self.time_indexes = {
+            t["id"]: TimeRuleIndex(t["rules"]) for t in self.tests.values() if t["type"] == "TIME"
+        }
+        payload = json.dumps(self.as_dict(), sort_keys=True, ensure_ascii=False)
+        self.digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()[:16]
+
+    @classmethod
+    def load(cls, ct_id):
+        from .models import BaiThi, BaiThiTemplateSection, BaiThiTemplateItem, VongThi  # tránh import vòng
+
+        tests = (
+            BaiThi.objects.filter(vongThi__cuocThi_id=ct_id)
+            .order_by("id")
+            .prefetch_related(
+                "time_rules",
+                Prefetch(
+                    "template_sections",
+                    queryset=BaiThiTemplateSection.objects.order_by("stt", "id").prefetch_related(
+                        Prefetch("items", queryset=BaiThiTemplateItem.objects.order_by("stt", "id"))
+                    ),
+                ),
+            )
+        )
+        by_round = {}
+        for bt in tests:
+            by_round.setdefault(bt.vongThi_id, []).append(cls._compile_test(bt))
+
+        rounds = [
+            {
+                "id": vt.id,
+                "ma": vt.ma,
+                "tenVongThi": vt.tenVongThi,
+                "is_bgd_round": bool(vt.is_bgd_round),
+                "is_special_bonus_round": bool(vt.is_special_bonus_round),
+                "tests": by_round.get(vt.id, []),
+            }
+            for vt in VongThi.objects.filter(cuocThi_id=ct_id).order_by("id")
+        ]
+        return cls(ct_id, rounds)
+
+    @staticmethod
+    def _compile_test(bt):
+        kind = score_type(bt.phuongThucCham)
+        rules = [[r.start_seconds, r.end_seconds, r.score] for r in bt.time_rules.all()]
+        sections = [
+            {
+                "id": s.id,
+                "stt": s.stt,
+                "title": s.title,
+                "note": s.note or "",
+                "items": [
+                    {
+                        "id": i.id,
+                        "stt": i.stt,
+                        "content": i.content,
+                        "max": int(i.max_score or 0),
+                        "note": i.note or "",
+                    }
+                    for i in s.items.all()
+                ],
+            }
+            for s in bt.template_sections.all()
+        ]
+        template_max = sum(i["max"] for s in sections for i in s["items"])
+        if kind == "TIME":
+            form_max = TIME_FORM_MAX
+        elif kind == "TEMPLATE":
+            form_max = template_max
+        else:
+            form_max = bt.cachChamDiem
+        return {
+            "id": bt.id,
+            "ma": bt.ma,
+            "tenBaiThi": bt.tenBaiThi,
+            "vongThi_id": bt.vongThi_id,
+            "type": kind,
+            "cachChamDiem": bt.cachChamDiem,
+            "max": form_max,
+            "rules": rules,  # [[start, end, score]] theo start ↑
+            "rules_max_end": max((r[1] for r in rules), default=0),
+            "sections": sections,
+        }
+
+    def test(self, bt_id):
+        return self.tests.get(int(bt_id)) if str(bt_id).isdigit() else None
+
+    def time_index(self, bt_id) -> TimeRuleIndex:
+        return self.time_indexes.get(int(bt_id)) or TimeRuleIndex([])
+
+    def round(self, vt_id):
+        for r in self.rounds:
+            if str(r["id"]) == str(vt_id):
+                return r
+        return None
+
+    def as_dict(self):
+        return {"ct": self.ct_id, "rounds": self.rounds}
+
+
+_schemas = LocalCache(bus, max_entries=16)
+
+
+def contest_schema(ct) -> ContestSchema:
+    ct_id = getattr(ct, "pk", ct)
+    return _schemas.get(
+        f"schema:{ct_id}", [structure_key(ct_id)],
+        lambda: ContestSchema.load(ct_id),
+    )
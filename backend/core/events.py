@@ -0,0 +1,120 @@
+# core/events.py
+"""
+Sự kiện thời gian thực (SSE) theo cuộc thi: điểm (bảng xếp hạng), cặp đấu đối kháng.
+
+EventHub là bộ fan-out NGAY TRONG TIẾN TRÌNH, không cần broker ngoài:
+  - Mỗi kết nối SSE (view async chạy trên ASGI) đăng ký 1 hàng đợi asyncio.
+  - publish() gọi được từ bất kỳ thread nào (view sync, transaction.on_commit)
+    và chuyển tin sang event loop của từng subscriber bằng call_soon_threadsafe.
+  - Hàng đợi có giới hạn: màn hình đọc chậm chỉ mất tin cũ nhất, không làm
+    phình bộ nhớ server. Tin chỉ là "tín hiệu có thay đổi", client tự đồng bộ
+    lại qua API (vd. /ranking/api/?since=) nên mất tin không sai dữ liệu.
+
+Chỉ phủ các màn hình nối vào CÙNG tiến trình với nơi ghi dữ liệu. Chạy nhiều
+worker thì màn hình vẫn còn cơ chế đồng bộ định kỳ sẵn có: SSE chỉ làm màn hình
+gọi sớm hơn, không thay vòng đồng bộ (ranking.js vẫn gọi ?since= theo vòng quay).
+"""
+import asyncio
+import itertools
+import json
+import threading
+
+from django.db import transaction
+
+
+class Subscription:
+    """1 kết nối đang nghe 1 kênh. Dùng: `with hub.subscribe(ch) as sub: msg = await sub.get()`."""
+
+    def __init__(self, hub, channel, loop, maxsize):
+        self.hub = hub
+        self.channel = channel
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+
+    def push(self, msg):
+        # Gọi từ thread bất kỳ
+        try:
+            self.loop.call_soon_threadsafe(self._put, msg)
+        except RuntimeError:
+            # event loop đã đóng (client ngắt) -> tự huỷ đăng ký
+            self.close()
+
+    def _put(self, msg):
+        # Chạy trên event loop của subscriber
+        if self.queue.full():
+            self.queue.get_nowait()  # bỏ tin cũ nhất
+        self.queue.put_nowait(msg)
+
+    async def get(self, timeout=None):
+        """Chờ tin kế tiếp; hết timeout -> asyncio.TimeoutError."""
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.hub._remove(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class EventHub:
+    def __init__(self, max_queue=256):
+        self.max_queue = max_queue
+        self._lock = threading.Lock()
+        self._subs = {}  # channel -> set[Subscription]
+        self._ids = itertools.count(1)
+
+    def subscribe(self, channel) -> Subscription:
+        """Phải gọi bên trong coroutine (cần event loop đang chạy)."""
+        sub = Subscription(self, channel, asyncio.get_running_loop(), self.max_queue)
+        with self._lock:
+            self._subs.setdefault(channel, set()).add(sub)
+        return sub
+
+    def _remove(self, sub):
+        with self._lock:
+            subs = self._subs.get(sub.channel)
+            if subs is None:
+                return
+            subs.discard(sub)
+            if not subs:
+                del self._subs[sub.channel]
+
+    def publish(self, channel, event, data=None) -> int:
+        """Đẩy tin tới mọi subscriber của kênh. Trả về số subscriber nhận."""
+        msg = {"id": next(self._ids), "event": event, "data": data or {}}
+        with self._lock:
+            subs = list(self._subs.get(channel, ()))
+        for sub in subs:
+            sub.push(msg)
+        return len(subs)
+
+    def subscriber_count(self, channel=None) -> int:
+        with self._lock:
+            if channel is not None:
+                return len(self._subs.get(channel, ()))
+            return sum(len(s) for s in self._subs.values())
+
+
+hub = EventHub()
+
+
+def contest_channel(ct_id) -> str:
+    return f"ct:{ct_id}"
+
+
+def publish_contest_event(ct_id, event, data=None):
+    """
+    Phát sự kiện cho 1 cuộc thi SAU khi transaction hiện tại commit
+    (màn hình nhận tin rồi đọc lại phải thấy dữ liệu mới).
+    """
+    if not ct_id:
+        return
+    transaction.on_commit(lambda: hub.publish(contest_channel(ct_id), event, data))
+
+
+def format_sse(msg) -> str:
+    data = json.dumps(msg.get("data") or {}, ensure_ascii=False, default=str)
+    return f"id: {msg['id']}\nevent: {msg['event']}\ndata: {data}\n\n"
@@ -0,0 +1,275 @@
+# core/invalidation.py
+"""
+Bus báo huỷ cache trong tiến trình, dùng chung cho mọi worker gunicorn / mọi node.
+
+- Signal trong models.py gọi bus.bump(key) khi PhieuChamDiem, GiamKhaoBaiThi,
+  BaiThi, VongThi, CuocThi... đổi. Sau commit, mỗi key được ghi 1 dòng
+  InvalidationEvent; id của dòng là version mới của key.
+- Mỗi tiến trình giữ {key: version} đã biết. bus.sync() đọc các event có
+  id > event cuối đã thấy, cộng các event ghi trong INVALIDATION_RESCAN_S giây gần nhất
+  (1 câu, tối đa mỗi INVALIDATION_POLL_MS 1 lần), nên cache cục bộ biết mình cũ mà
+  không phải chờ TTL. id cấp lúc INSERT chứ không theo thứ tự commit: event id nhỏ
+  commit sau event id lớn vẫn được cửa sổ quét lại bắt được; id đã áp thì bỏ qua.
+  version của key là bộ đếm cục bộ tăng mỗi event mới áp vào (không phải id), nên
+  event đến muộn với id nhỏ hơn vẫn làm cache build lại.
+- INVALIDATION_TRANSPORT = "pg": thêm LISTEN/NOTIFY của PostgreSQL. Thread nền
+  nghe kênh, có NOTIFY là lần sync() kế tiếp đọc ngay, không chờ chu kỳ poll.
+  Bảng event vẫn là nguồn chuẩn; NOTIFY chỉ là tín hiệu "đọc ngay".
+
+Cache cục bộ dùng LocalCache: lưu kèm version của các key phụ thuộc lúc build,
+lần đọc sau so lại version hiện tại -> khác thì build lại.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max, Min, Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "btv_invalidate"
+
+
+def contest_key(ct_id) -> str:
+    """Dữ liệu điểm / thành viên của 1 cuộc thi."""
+    return f"contest:{ct_id}"
+
+
+def structure_key(ct_id) -> str:
+    """Cấu trúc cuộc thi: vòng, bài, cách chấm."""
+    return f"structure:{ct_id}"
+
+
+def judge_key(gk_id) -> str:
+    """Phân công bài thi của 1 giám khảo."""
+    return f"judge:{gk_id}"
+
+
+def roster_key(ct_id=None) -> str:
+    """Danh sách thí sinh của 1 cuộc thi; None = thông tin thí sinh (mọi cuộc thi)."""
+    return f"roster:{ct_id if ct_id is not None else '*'}"
+
+
+class InvalidationBus:
+    def __init__(self, poll_ms=200, retention=timedelta(hours=1), transport="db", rescan=timedelta(seconds=10)):
+        self.poll_interval = poll_ms / 1000.0
+        self.retention = retention
+        self.transport = transport
+        self.rescan = rescan
+        self._lock = threading.Lock()
+        self._versions = {}      # key -> version cục bộ (self._tick lúc áp event mới nhất)
+        self._tick = 0
+        self._seen = {}          # id event đã áp -> created_at, chỉ giữ trong cửa sổ quét lại
+        self._last_id = None     # None = chưa đồng bộ lần nào
+        self._epoch = 0          # tăng khi lỡ mất event -> coi mọi thứ là cũ
+        self._next_poll = 0.0
+        self._next_prune = 0.0
+        self._listener = None
+        self._pending = threading.local()  # key chờ commit của thread hiện tại
+
+    # ---------- phát ----------
+    def bump(self, *keys):
+        """
+        Báo các key đã đổi; ghi thật sự sau khi transaction hiện tại commit.
+        Trong 1 transaction, mỗi key chỉ ghi 1 event dù bị bump nhiều lần
+        (import hàng nghìn dòng -> vài event).
+        """
+        keys = [k for k in keys if k]
+        if not keys:
+            return
+        pending = getattr(self._pending, "keys", None)
+        if pending is None:
+            pending = self._pending.keys = set()
+        pending.update(keys)
+        transaction.on_commit(self._flush_pending)
+
+    def _flush_pending(self):
+        # Callback đầu tiên sau commit ghi hết; các callback sau thấy rỗng -> bỏ qua.
+        # (Transaction rollback để lại key thừa: chỉ làm cache build lại sớm, vô hại.)
+        keys = getattr(self._pending, "keys", None)
+        if not keys:
+            return
+        self._pending.keys = set()
+        self._emit(sorted(keys))
+
+    def _emit(self, keys):
+        from .models import InvalidationEvent  # tránh import vòng
+
+        events = InvalidationEvent.objects.bulk_create(
+            [InvalidationEvent(key=k) for k in keys]
+        )
+        with self._lock:
+            for ev in events:
+                if ev.id is not None:
+                    self._apply(ev.id, ev.key, ev.created_at)
+                else:
+                    # backend không trả id khi bulk_create -> để lần sync sau đọc
+                    self._next_poll = 0.0
+
+        if self.transport == "pg" and connection.vendor == "postgresql":
+            with connection.cursor() as cur:
+                for k in keys:
+                    cur.execute("SELECT pg_notify(%s, %s)", [NOTIFY_CHANNEL, k])
+
+    # ---------- nhận ----------
+    def sync(self, force=False):
+        """Đọc event mới (tôn trọng chu kỳ poll, trừ khi force / vừa có NOTIFY)."""
+        from .models import InvalidationEvent
+
+        now = time.monotonic()
+        if not force and now < self._next_poll:
+            return
+        self._ensure_listener()
+
+        with self._lock:
+            last_id = self._last_id
+            self._next_poll = now + self.poll_interval
+
+        cutoff = timezone.now() - self.rescan
+        if last_id is None:
+            # Lần đầu: mọi cache trong tiến trình đều build sau thời điểm này;
+            # event trong cửa sổ coi như đã áp (lần quét lại sau không build lại vô ích)
+            start = InvalidationEvent.objects.aggregate(m=Max("id"))["m"] or 0
+            recent = InvalidationEvent.objects.filter(created_at__gte=cutoff, id__lte=start)
+            with self._lock:
+                if self._last_id is None:
+                    self._last_id = start
+                    self._seen.update(recent.values_list("id", "created_at"))
+            return
+
+        rows = list(
+            InvalidationEvent.objects.filter(Q(id__gt=last_id) | Q(created_at__gte=cutoff))
+            .order_by("id")
+            .values_list("id", "key", "created_at")
+        )
+        with self._lock:
+            new_ids = [ev_id for ev_id, key, created_at in rows if self._apply(ev_id, key, created_at)]
+            if rows:
+                self._last_id = max(self._last_id or 0, rows[-1][0])
+            # id đã ra khỏi cửa sổ sẽ không được đọc lại -> khỏi nhớ
+            self._seen = {ev_id: at for ev_id, at in self._seen.items() if at >= cutoff}
+        # Event mới đầu tiên không nối tiếp event cuối đã thấy -> có thể đã bị prune
+        # (tiến trình ngủ quá lâu): không tin được version nào nữa.
+        first_new = min((ev_id for ev_id in new_ids if ev_id > last_id), default=None)
+        if first_new is not None and first_new > last_id + 1 and self._gap_lost(last_id, first_new):
+            with self._lock:
+                self._epoch += 1
+
+        self._maybe_prune(now)
+
+    def _apply(self, ev_id, key, created_at):
+        # Gọi khi đang giữ self._lock. -> True nếu event chưa áp lần nào.
+        if ev_id in self._seen:
+            return False
+        self._seen[ev_id] = created_at
+        self._tick += 1
+        self._versions[key] = self._tick
+        return True
+
+    def _gap_lost(self, last_id, first_new_id):
+        # Khoảng trống id có thể do sequence nhảy (rollback), chỉ coi là mất
+        # khi các event cũ hơn first_new_id đã bị xoá hết.
+        from .models import InvalidationEvent
+
+        oldest = InvalidationEvent.objects.aggregate(m=Min("id"))["m"]
+        return oldest is not None and oldest == first_new_id and last_id > 0
+
+    def _maybe_prune(self, now):
+        if now < self._next_prune:
+            return
+        self._next_prune = now + 600
+        from .models import InvalidationEvent
+
+        InvalidationEvent.objects.filter(created_at__lt=timezone.now() - self.retention).delete()
+
+    def version(self, *keys):
+        """Version hiện tại của 1 hay nhiều key (so sánh được bằng ==)."""
+        with self._lock:
+            return (self._epoch,) + tuple(self._versions.get(k, 0) for k in keys)
+
+    def wake(self):
+        """Gọi từ thread LISTEN khi có NOTIFY: lần sync() kế tiếp đọc ngay."""
+        self._next_poll = 0.0
+
+    # ---------- LISTEN/NOTIFY (PostgreSQL) ----------
+    def _ensure_listener(self):
+        if self.transport != "pg" or self._listener is not None:
+            return
+        if connection.vendor != "postgresql":
+            return
+        self._listener = threading.Thread(target=self._listen_forever, name="btv-invalidation", daemon=True)
+        self._listener.start()
+
+    def _listen_forever(self):
+        try:
+            import psycopg
+        except ImportError:  # chỉ có psycopg2 -> dùng poll thường
+            logger.warning("psycopg (v3) chưa cài, bỏ LISTEN/NOTIFY, dùng poll định kỳ.")
+            return
+
+        params = settings.DATABASES["default"]
+        delay = 1
+        while True:
+            try:
+                conn = psycopg.connect(
+                    dbname=params.get("NAME"),
+                    user=params.get("USER"),
+                    password=params.get("PASSWORD"),
+                    host=params.get("HOST") or None,
+                    port=params.get("PORT") or None,
+                    autocommit=True,
+                )
+                with conn:
+                    conn.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                    delay = 1
+                    self.wake()  # có thể đã lỡ NOTIFY lúc mất kết nối
+                    for _ in conn.notifies():
+                        self.wake()
+            except Exception:
+                logger.exception("Mất kết nối LISTEN %s, thử lại sau %ss", NOTIFY_CHANNEL, delay)
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+
+class LocalCache:
+    """
+    Cache trong tiến trình, tự bỏ entry khi key phụ thuộc có event mới trên bus.
+        cache.get(name, deps=[contest_key(1)], builder=lambda: ...)
+    """
+
+    def __init__(self, bus, max_entries=64):
+        self.bus = bus
+        self.max_entries = max_entries
+        self._data = {}  # name -> (version, value)
+        self._lock = threading.Lock()
+
+    def get(self, name, deps, builder):
+        self.bus.sync()
+        version = self.bus.version(*deps)  # đọc TRƯỚC khi build: event đến giữa chừng -> lần sau build lại
+        with self._lock:
+            hit = self._data.get(name)
+            if hit is not None and hit[0] == version:
+                return hit[1]
+
+        value = builder()
+        with self._lock:
+            self._data.pop(name, None)
+            self._data[name] = (version, value)
+            while len(self._data) > self.max_entries:
+                self._data.pop(next(iter(self._data)))
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+bus = InvalidationBus(
+    poll_ms=getattr(settings, "INVALIDATION_POLL_MS", 200),
+    transport=getattr(settings, "INVALIDATION_TRANSPORT", "db"),
+    rescan=timedelta(seconds=getattr(settings, "INVALIDATION_RESCAN_S", 10)),
+)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bgd_top import lock_top
+from core.models import VongThi
+
+
+class Command(BaseCommand):
+    help = "Tính lại và chốt danh sách Top X của vòng BGD (trang BGD đọc danh sách đã chốt)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("vt_ids", nargs="*", type=int, help="ID vòng thi (bỏ trống = mọi vòng BGD)")
+
+    def handle(self, *args, **options):
+        qs = VongThi.objects.filter(is_bgd_round=True).select_related("cuocThi").order_by("id")
+        if options["vt_ids"]:
+            qs = qs.filter(id__in=options["vt_ids"])
+            if not qs.exists():
+                raise CommandError("Không tìm thấy vòng BGD nào.")
+
+        for vt in qs:
+            n = lock_top(vt.cuocThi, vt)
+            self.stdout.write(f"{vt.ma}: đã chốt {n}/{vt.bgd_top_limit or 0} thí sinh")
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import CuocThi
+from core.standings import rebuild_contest_standings
+
+
+class Command(BaseCommand):
+    help = "Dựng lại bảng xếp hạng tính sẵn (ContestStanding) từ phiếu chấm."
+
+    def add_arguments(self, parser):
+        parser.add_argument("ct_ids", nargs="*", type=int, help="ID cuộc thi (bỏ trống = tất cả)")
+
+    def handle(self, *args, **options):
+        qs = CuocThi.objects.order_by("id")
+        if options["ct_ids"]:
+            qs = qs.filter(id__in=options["ct_ids"])
+            if not qs.exists():
+                raise CommandError("Không tìm thấy cuộc thi nào.")
+
+        for ct in qs:
+            n = rebuild_contest_standings(ct)
+            self.stdout.write(f"{ct.ma}: {n} dòng xếp hạng")
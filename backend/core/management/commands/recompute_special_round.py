@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import VongThi
+from core.special_round import recompute_round
+
+
+class Command(BaseCommand):
+    help = "Dựng lại tổng hợp cặp (SpecialRoundPairState) của vòng đặc biệt từ log và áp kết quả 100/0."
+
+    def add_arguments(self, parser):
+        parser.add_argument("vt_ids", nargs="*", type=int, help="ID vòng thi (bỏ trống = mọi vòng đặc biệt)")
+
+    def handle(self, *args, **options):
+        qs = VongThi.objects.filter(is_special_bonus_round=True).order_by("id")
+        if options["vt_ids"]:
+            qs = qs.filter(id__in=options["vt_ids"])
+            if not qs.exists():
+                raise CommandError("Không tìm thấy vòng đặc biệt nào.")
+
+        for vt in qs:
+            n = recompute_round(vt)
+            self.stdout.write(f"{vt.ma}: {n} cặp·bài đã có kết quả")
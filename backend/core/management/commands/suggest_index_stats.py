@@ -0,0 +1,49 @@
+import random
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import CuocThi
+from core.search import SuggestIndex, build_suggest_index
+
+HO = ["Nguyễn", "Trần", "Lê", "Phạm", "Hoàng", "Huỳnh", "Phan", "Vũ", "Võ", "Đặng", "Bùi", "Đỗ"]
+DEM = ["Văn", "Thị", "Hữu", "Minh", "Ngọc", "Thanh", "Đức", "Quốc", "Gia", "Hoài"]
+TEN = ["An", "Bình", "Châu", "Dũng", "Giang", "Hà", "Khoa", "Linh", "Nam", "Phúc", "Quân", "Trang", "Vy"]
+
+
+class Command(BaseCommand):
+    help = "Báo cáo kích thước chỉ mục gợi ý thí sinh (SuggestIndex) trong bộ nhớ."
+
+    def add_arguments(self, parser):
+        parser.add_argument("ct_ids", nargs="*", type=int, help="ID cuộc thi (bỏ trống = tất cả)")
+        parser.add_argument(
+            "--synthetic", type=int, default=0,
+            help="Dựng chỉ mục giả lập N thí sinh (không cần dữ liệu thật)",
+        )
+
+    def _report(self, label, index):
+        n = len(index)
+        size = index.footprint()
+        per_10k = size * 10000 / n if n else 0
+        self.stdout.write(
+            f"{label}: {n} thí sinh, {len(index.word_rows)} từ khoá, "
+            f"{size / 1024:.0f} KiB (~{per_10k / 1024 / 1024:.2f} MiB / 10k thí sinh)"
+        )
+
+    def handle(self, *args, **options):
+        if options["synthetic"]:
+            rnd = random.Random(0)
+            rows = [
+                (f"NV{i:06d}", f"{rnd.choice(HO)} {rnd.choice(DEM)} {rnd.choice(TEN)}")
+                for i in range(options["synthetic"])
+            ]
+            self._report("Giả lập", SuggestIndex(rows))
+            return
+
+        qs = CuocThi.objects.order_by("id")
+        if options["ct_ids"]:
+            qs = qs.filter(id__in=options["ct_ids"])
+            if not qs.exists():
+                raise CommandError("Không tìm thấy cuộc thi nào.")
+
+        for ct in qs:
+            self._report(ct.ma, build_suggest_index(ct.id))
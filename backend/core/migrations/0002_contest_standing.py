@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContestStanding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('per_test', models.JSONField(blank=True, default=dict)),
+                ('total', models.FloatField(default=0)),
+                ('total_time', models.FloatField(blank=True, help_text='Tổng TB thời gian các bài TIME (giây)', null=True)),
+                ('done', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('cuocThi', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standings', to='core.cuocthi')),
+                ('thiSinh', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standings', to='core.thisinh')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['cuocThi', '-total', 'total_time', 'thiSinh'], name='standing_rank_idx')],
+                'unique_together': {('cuocThi', 'thiSinh')},
+            },
+        ),
+    ]
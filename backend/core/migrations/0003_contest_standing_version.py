@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:37
+
+from django.db import migrations, models
+from django.db.models import Avg, F
+
+
+def backfill_standings(apps, schema_editor):
+    # Dựng sẵn bảng xếp hạng cho mọi cuộc thi đã có dữ liệu (giống rebuild_contest_standings).
+    # Không dựng ở đây thì lần ghi điểm đầu tiên sau deploy tạo 1 dòng và mọi thí sinh cũ
+    # mất khỏi bảng. version = 1 để client gửi ?since=0 nhận đủ các dòng này.
+    Phieu = apps.get_model("core", "PhieuChamDiem")
+    Member = apps.get_model("core", "ThiSinhCuocThi")
+    Standing = apps.get_model("core", "ContestStanding")
+
+    rows = {}
+    for m in Member.objects.values("cuocThi_id", "thiSinh_id"):
+        rows.setdefault((m["cuocThi_id"], m["thiSinh_id"]), {})
+    times = {}
+    grouped = (
+        Phieu.objects
+        .values("cuocThi_id", "thiSinh_id", "baiThi_id", method=F("baiThi__phuongThucCham"))
+        .annotate(avg=Avg("diem"), t_avg=Avg("thoiGian"))
+    )
+    for g in grouped:
+        key = (g["cuocThi_id"], g["thiSinh_id"])
+        rows.setdefault(key, {})[str(g["baiThi_id"])] = float(g["avg"] or 0.0)
+        if str(g["method"] or "").strip().upper() in {"TIME", "2"} and g["t_avg"] is not None:
+            times[key] = times.get(key, 0.0) + float(g["t_avg"])
+
+    built = set(Standing.objects.values_list("cuocThi_id", flat=True).distinct())
+    Standing.objects.bulk_create(
+        [
+            Standing(
+                cuocThi_id=ct_id, thiSinh_id=ts_id, per_test=per_test, version=1,
+                total=sum(per_test.values()), total_time=times.get((ct_id, ts_id)), done=len(per_test),
+            )
+            for (ct_id, ts_id), per_test in rows.items()
+            if ct_id not in built
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_contest_standing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conteststanding',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='conteststanding',
+            index=models.Index(fields=['cuocThi', 'version'], name='standing_version_idx'),
+        ),
+        migrations.RunPython(backfill_standings, migrations.RunPython.noop),
+    ]
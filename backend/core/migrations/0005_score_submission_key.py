@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_invalidation_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreSubmissionKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('result', models.JSONField(blank=True, default=dict)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('giamKhao', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='core.giamkhao')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('giamKhao', 'key'), name='score_submission_key_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-17 19:56
+
+import logging
+
+from django.db import migrations, models, transaction
+
+from core.search import thi_sinh_search_key
+
+logger = logging.getLogger(__name__)
+
+TRGM_INDEX = "thisinh_search_key_trgm"
+
+
+def backfill_search_key(apps, schema_editor):
+    ThiSinh = apps.get_model("core", "ThiSinh")
+    batch = []
+    for ts in ThiSinh.objects.only("maNV", "hoTen").iterator(chunk_size=2000):
+        ts.search_key = thi_sinh_search_key(ts.maNV, ts.hoTen)
+        batch.append(ts)
+        if len(batch) >= 2000:
+            ThiSinh.objects.bulk_update(batch, ["search_key"])
+            batch = []
+    if batch:
+        ThiSinh.objects.bulk_update(batch, ["search_key"])
+
+
+def create_trgm_index(apps, schema_editor):
+    # Chỉ PostgreSQL; thiếu quyền CREATE EXTENSION thì bỏ qua (vẫn còn index B-tree)
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            schema_editor.execute(
+                f"CREATE INDEX IF NOT EXISTS {TRGM_INDEX} "
+                f'ON core_thisinh USING gin (search_key gin_trgm_ops)'
+            )
+    except Exception:
+        logger.warning("Không tạo được index pg_trgm cho ThiSinh.search_key, dùng B-tree.", exc_info=True)
+
+
+def drop_trgm_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {TRGM_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_score_submission_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thisinh',
+            name='search_key',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=130),
+        ),
+        migrations.RunPython(backfill_search_key, migrations.RunPython.noop),
+        migrations.RunPython(create_trgm_index, drop_trgm_index),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def backfill_states(apps, schema_editor):
+    # Tổng hợp log hiện có thành state (không đụng PhieuChamDiem)
+    Log = apps.get_model("core", "SpecialRoundScoreLog")
+    Member = apps.get_model("core", "SpecialRoundPairMember")
+    State = apps.get_model("core", "SpecialRoundPairState")
+
+    members = {
+        (m["pair_id"], m["slot"]): m["thiSinh_id"]
+        for m in Member.objects.filter(slot__in=(1, 2)).values("pair_id", "slot", "thiSinh_id")
+    }
+    states = {}
+    grouped = (
+        Log.objects.filter(pair_member__slot__in=(1, 2))
+        .values("pair_member__pair_id", "pair_member__slot", "baiThi_id")
+        .annotate(total=Sum("raw_score"), cnt=Count("pk"), best=Min("raw_time"))
+    )
+    for g in grouped:
+        pair_id, slot, bt_id = g["pair_member__pair_id"], g["pair_member__slot"], g["baiThi_id"]
+        state = states.setdefault((pair_id, bt_id), State(
+            pair_id=pair_id, baiThi_id=bt_id,
+            thiSinh1_id=members.get((pair_id, 1)), thiSinh2_id=members.get((pair_id, 2)),
+        ))
+        setattr(state, f"score_sum{slot}", float(g["total"] or 0))
+        setattr(state, f"score_count{slot}", g["cnt"])
+        setattr(state, f"best_time{slot}", g["best"])
+    State.objects.bulk_create(states.values(), batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_thi_sinh_search_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpecialRoundPairState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score_sum1', models.FloatField(default=0)),
+                ('score_count1', models.PositiveIntegerField(default=0)),
+                ('best_time1', models.IntegerField(blank=True, null=True)),
+                ('score_sum2', models.FloatField(default=0)),
+                ('score_count2', models.PositiveIntegerField(default=0)),
+                ('best_time2', models.IntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('baiThi', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.baithi')),
+                ('pair', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='states', to='core.specialroundpair')),
+                ('thiSinh1', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.thisinh')),
+                ('thiSinh2', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.thisinh')),
+            ],
+            options={
+                'unique_together': {('pair', 'baiThi')},
+            },
+        ),
+        migrations.RunPython(backfill_states, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_special_round_pair_state'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BGDTopEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rank', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('thiSinh', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bgd_top_entries', to='core.thisinh')),
+                ('vongThi', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bgd_top', to='core.vongthi')),
+            ],
+            options={
+                'ordering': ['vongThi', 'rank'],
+                'constraints': [models.UniqueConstraint(fields=('vongThi', 'rank'), name='bgd_top_rank_uniq'), models.UniqueConstraint(fields=('vongThi', 'thiSinh'), name='bgd_top_thi_sinh_uniq')],
+            },
+        ),
+    ]
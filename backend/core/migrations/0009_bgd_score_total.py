@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_totals(apps, schema_editor):
+    # Tổng hợp BGDScore hiện có thành tổng chạy (phiếu đại diện đã đúng, không đụng tới)
+    Score = apps.get_model("core", "BGDScore")
+    Total = apps.get_model("core", "BGDScoreTotal")
+
+    grouped = (
+        Score.objects.exclude(vongThi=None)
+        .values("cuocThi_id", "vongThi_id", "thiSinh_id")
+        .annotate(total=Sum("diem"), cnt=Count("pk"))
+    )
+    Total.objects.bulk_create(
+        [
+            Total(
+                cuocThi_id=g["cuocThi_id"], vongThi_id=g["vongThi_id"], thiSinh_id=g["thiSinh_id"],
+                score_sum=int(g["total"] or 0), score_count=g["cnt"],
+            )
+            for g in grouped
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_bgd_top_entry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BGDScoreTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score_sum', models.IntegerField(default=0)),
+                ('score_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('cuocThi', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.cuocthi')),
+                ('thiSinh', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.thisinh')),
+                ('vongThi', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='bgd_totals', to='core.vongthi')),
+            ],
+            options={
+                'unique_together': {('cuocThi', 'vongThi', 'thiSinh')},
+            },
+        ),
+        migrations.RunPython(backfill_totals, migrations.RunPython.noop),
+    ]
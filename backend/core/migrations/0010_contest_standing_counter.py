@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:37
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def backfill_counters(apps, schema_editor):
+    # Bộ đếm nối tiếp version lớn nhất đang có của từng cuộc thi
+    Standing = apps.get_model("core", "ContestStanding")
+    Counter = apps.get_model("core", "ContestStandingCounter")
+    Counter.objects.bulk_create(
+        [
+            Counter(cuocThi_id=g["cuocThi_id"], version=g["v"] or 0)
+            for g in Standing.objects.values("cuocThi_id").annotate(v=Max("version"))
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_bgd_score_total'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContestStandingCounter',
+            fields=[
+                ('cuocThi', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='standing_counter', serialize=False, to='core.cuocthi')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
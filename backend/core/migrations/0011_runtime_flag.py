@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_contest_standing_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RuntimeFlag',
+            fields=[
+                ('name', models.CharField(max_length=100, primary_key=True, serialize=False)),
+                ('value', models.JSONField(blank=True, null=True)),
+                ('stamp', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
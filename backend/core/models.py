@@ -1,5 +1,6 @@
 from django.db import models
 import re
+from contextvars import ContextVar
 from urllib.parse import urlparse, parse_qs
 
 # Create your models here.
@@ -9,9 +10,11 @@ from django.db.models import Max, SET_NULL
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 from django.db.models import Avg, Count, Min
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
+from .search import fold_text, thi_sinh_search_key
+
 import secrets
 import string
 
@@ -95,6 +98,16 @@ class ThiSinh(models.Model):
         blank=True,
         help_text="URL ảnh (trên Drive) của thí sinh"
     )
+    # "<mã NV> <họ tên>" bỏ dấu, lowercase — dùng cho tìm kiếm (xem core/search.py)
+    search_key = models.CharField(max_length=130, db_index=True, editable=False, default="")
+
+    def save(self, *args, **kwargs):
+        self.search_key = thi_sinh_search_key(self.maNV, self.hoTen)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"maNV", "hoTen"} & set(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"search_key"}
+        super().save(*args, **kwargs)
+
     @property
     def display_image_url(self) -> str:
         """
@@ -258,6 +271,113 @@ class BaiThiTemplateItem(models.Model):
     def __str__(self):
         return f"{self.section.baiThi.ma} - {self.section.title} - [{self.stt}] {self.content}"
 
+_score_write_ctx = ContextVar("score_write_ctx", default=None)
+
+
+class ScoreWriteContext:
+    """
+    Luật ghi phiếu chấm của 1 giám khảo (điểm hợp lệ + quyền chấm), nạp 1 lần cho cả
+    request / lô ghi phiếu. Là bộ kiểm tra DUY NHẤT: PhieuChamDiem.save() và
+    score_write.upsert_sheets() (bulk_create không gọi save()) đều qua check().
+        with ScoreWriteContext(judge):
+            PhieuChamDiem.objects.update_or_create(...)
+    Bên trong khối with, PhieuChamDiem.save() kiểm tra BGD / phân công trong bộ nhớ
+    và dùng lại CuocThi / VongThi / BaiThi đã nạp thay vì truy vấn lại mỗi phiếu.
+    representative=True: phiếu đại diện BGD (điểm TB do hệ thống ghi dưới tên giám khảo
+    đại diện) -> chỉ kiểm tra điểm, không xét phân công.
+    """
+
+    def __init__(self, judge, representative=False):
+        self.judge = judge
+        self.representative = representative
+        self._is_bgd = None
+        self._assigned = None
+        self._objs = {}  # (tên field, pk) -> instance đã nạp
+        self._token = None
+
+    def __enter__(self):
+        self._token = _score_write_ctx.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        _score_write_ctx.reset(self._token)
+
+    @classmethod
+    def current(cls, judge_id):
+        ctx = _score_write_ctx.get()
+        if ctx is not None and ctx.judge is not None and ctx.judge.pk == judge_id:
+            return ctx
+        return None
+
+    @property
+    def is_bgd(self):
+        if self._is_bgd is None:
+            self._is_bgd = is_bgd_member(self.judge)
+        return self._is_bgd
+
+    def is_assigned(self, bt_id):
+        if self._assigned is None:
+            self._assigned = set(
+                GiamKhaoBaiThi.objects.filter(giamKhao=self.judge).values_list("baiThi_id", flat=True)
+            )
+        return bt_id in self._assigned
+
+    def check(self, ct, vt, bt, diem):
+        """
+        1 phiếu (cuộc thi, vòng, bài, điểm) của giám khảo này:
+          - điểm < 0 / bài POINTS vượt cachChamDiem -> ValueError
+            (TIME / TEMPLATE quy đổi, kiểm tra ở bước chấm)
+          - ADMIN chấm mọi bài; người khác phải được phân công, trừ BGD ở cuộc thi
+            "Chung Kết" hoặc vòng BGD -> PermissionError
+        """
+        if diem is None or diem < 0:
+            raise ValueError("Điểm không hợp lệ!")
+        if getattr(bt, "phuongThucCham", "POINTS") == "POINTS" and diem > bt.cachChamDiem:
+            raise ValueError("Điểm vượt quá điểm tối đa của bài thi!")
+
+        if self.representative or getattr(self.judge, "role", "JUDGE") == "ADMIN":
+            return
+        # BGD (maBGD trùng maNV, ten trùng hoTen) được bỏ qua phân công nếu
+        # cuộc thi là "Chung Kết" hoặc vòng đó là vòng BGD
+        if (is_chung_ket(ct) or bool(getattr(vt, "is_bgd_round", False))) and self.is_bgd:
+            return
+        if not self.is_assigned(bt.pk):
+            raise PermissionError("Giám khảo chưa được admin chỉ định cho bài thi này.")
+
+    def attach(self, phieu):
+        """Gắn sẵn các FK đã nạp vào phiếu (mỗi object chỉ nạp 1 lần cho cả lô)."""
+        for name in ("cuocThi", "vongThi", "baiThi"):
+            field = phieu._meta.get_field(name)
+            key = (name, getattr(phieu, field.attname))
+            if field.is_cached(phieu):
+                self._objs.setdefault(key, getattr(phieu, name))
+            elif key in self._objs:
+                field.set_cached_value(phieu, self._objs[key])
+            else:
+                self._objs[key] = getattr(phieu, name)
+        field = phieu._meta.get_field("giamKhao")
+        if not field.is_cached(phieu):
+            field.set_cached_value(phieu, self.judge)
+
+
+def is_bgd_member(judge):
+    """Giám khảo đồng thời là BGD: có BanGiamDoc maBGD = maNV VÀ ten trùng hoTen (không phân biệt hoa/thường)."""
+    if not judge:
+        return False
+    try:
+        return BanGiamDoc.objects.filter(
+            maBGD=judge.maNV,
+            ten__iexact=judge.hoTen,
+        ).exists()
+    except Exception:
+        return False
+
+
+def is_chung_ket(ct):
+    """Cuộc thi "Chung Kết" / "Chung Ket" (không phân biệt hoa/thường, có/không dấu)."""
+    return bool(ct) and fold_text(getattr(ct, "tenCuocThi", "")) == "chung ket"
+
+
 class PhieuChamDiem(models.Model):
     maPhieu = models.AutoField(primary_key=True)
     thiSinh = models.ForeignKey(ThiSinh, on_delete=models.CASCADE)
@@ -274,63 +394,62 @@ class PhieuChamDiem(models.Model):
         unique_together = ("thiSinh", "giamKhao", "baiThi")
 
     def save(self, *args, **kwargs):
+        ctx = ScoreWriteContext.current(self.giamKhao_id)
+        if ctx is not None:
+            ctx.attach(self)
+
         # đồng bộ mã cuộc thi từ FK (lưu CTxxx để báo cáo/search nhanh)
         self.maCuocThi = self.cuocThi.ma
 
-        # kiểm tra điểm hợp lệ theo phương thức chấm
-        method = getattr(self.baiThi, "phuongThucCham", "POINTS")
-        if self.diem is None or self.diem < 0:
-            raise ValueError("Điểm không hợp lệ!")
+        # điểm hợp lệ + quyền chấm: cùng bộ kiểm tra với score_write.upsert_sheets
+        (ctx or ScoreWriteContext(self.giamKhao)).check(self.cuocThi, self.vongThi, self.baiThi, self.diem)
 
-        if method == "POINTS":
-            # chỉ áp trần khi là thang điểm
-            if self.diem > self.baiThi.cachChamDiem:
-                raise ValueError("Điểm vượt quá điểm tối đa của bài thi!")
-            
-        # BGD (maBGD trùng maNV, ten trùng hoTen) luôn được chấm tự do
-        # cho cuộc thi "Chung Kết" (không cần phân công từng bài).
-        is_bgd = False
-        try:
-            is_bgd = BanGiamDoc.objects.filter(
-                maBGD=self.giamKhao.maNV,
-                ten__iexact=self.giamKhao.hoTen,
-            ).exists()
-        except Exception:
-            is_bgd = False
+        self.updated_at = timezone.now()
+        super().save(*args, **kwargs)
 
-        is_chung_ket = False
-        try:
-            tn = (self.cuocThi.tenCuocThi or "").strip().lower()
-            is_chung_ket = tn in ("chung kết", "chung ket")
-        except Exception:
-            is_chung_ket = False
 
-        # Cho phép BGD chấm tự do ở vòng được bật chế độ BGD
-        is_bgd_round = False
-        try:
-            is_bgd_round = bool(getattr(self.vongThi, "is_bgd_round", False))
-        except Exception:
-            is_bgd_round = False
+class ContestStanding(models.Model):
+    """
+    Bảng xếp hạng tính sẵn (read model) cho trang Ranking.
+    Mỗi dòng = 1 thí sinh trong 1 cuộc thi; được cập nhật lại mỗi khi
+    phiếu chấm của thí sinh đó thay đổi (xem core/standings.py).
+    """
+    cuocThi = models.ForeignKey(CuocThi, on_delete=models.CASCADE, related_name="standings")
+    thiSinh = models.ForeignKey(ThiSinh, on_delete=models.CASCADE, related_name="standings")
+    per_test = models.JSONField(default=dict, blank=True)  # {"<baiThi_id>": điểm TB}
+    total = models.FloatField(default=0)
+    total_time = models.FloatField(null=True, blank=True, help_text="Tổng TB thời gian các bài TIME (giây)")
+    done = models.PositiveIntegerField(default=0)
+    # Số phiên bản tăng dần trong phạm vi 1 cuộc thi: client gửi ?since=<version>
+    # để chỉ nhận các dòng đã đổi (xem ranking_api_view)
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
-        # BGD được bỏ qua phân công nếu:
-        #   - là BGD, và
-        #   - cuộc thi là "Chung Kết" hoặc vòng đó là vòng BGD
-        allow_without_assign = is_bgd and (is_chung_ket or is_bgd_round)
+    class Meta:
+        unique_together = ("cuocThi", "thiSinh")
+        indexes = [
+            models.Index(fields=["cuocThi", "-total", "total_time", "thiSinh"], name="standing_rank_idx"),
+            models.Index(fields=["cuocThi", "version"], name="standing_version_idx"),
+        ]
 
-        if getattr(self.giamKhao, "role", "JUDGE") != "ADMIN" and not allow_without_assign:
-            from .models import GiamKhaoBaiThi
-            allowed = GiamKhaoBaiThi.objects.filter(
-                giamKhao=self.giamKhao,
-                baiThi=self.baiThi
-            ).exists()
-            if not allowed:
-                raise PermissionError("Giám khảo chưa được admin chỉ định cho bài thi này.")
+    def __str__(self):
+        return f"{self.cuocThi_id} · {self.thiSinh_id}: {self.total}"
+
+
+class ContestStandingCounter(models.Model):
+    """
+    Bộ đếm version bảng xếp hạng của 1 cuộc thi: tăng bằng 1 câu UPDATE (F + 1),
+    không khoá dòng CuocThi, không MAX(version) (xem core/standings.py).
+    """
+    cuocThi = models.OneToOneField(
+        CuocThi, on_delete=models.CASCADE, primary_key=True, related_name="standing_counter"
+    )
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.cuocThi_id}: v{self.version}"
 
 
-        # (TIME/TEMPLATE sẽ được quy đổi/validate ở bước 3B)
-        self.updated_at = timezone.now()
-        super().save(*args, **kwargs)
-        
 class SpecialRoundPair(models.Model):
     cuocThi = models.ForeignKey(CuocThi, on_delete=models.CASCADE)
     vongThi = models.ForeignKey(VongThi, on_delete=models.CASCADE)
@@ -405,77 +524,70 @@ class SpecialRoundScoreLog(models.Model):
         pair_id = getattr(self.pair_member.pair, "id", None)
         return f"{ts} – {self.raw_score}đ (cặp {pair_id})"
 
-def compute_special_round_pair_result(cuocThi, vongThi, baiThi, special_pair):
+class SpecialRoundPairState(models.Model):
     """
-    Tính kết quả 100/0 cho 1 cặp vòng đặc biệt, BỎ QUA giamKhao.
-    - Gom tất cả SpecialRoundScoreLog của pair đó (mọi giám khảo).
-    - Mỗi thí sinh: tính avg(raw_score), min(raw_time).
-    - So sánh 2 bên → winner = 100, loser = 0.
-    Trả về dict: {thiSinh_id: 100 hoặc 0}
-    """
-    from .models import SpecialRoundScoreLog, SpecialRoundPairMember  # tránh import vòng
-
-    # 1) Lấy tất cả log thuộc đúng cuộc thi / vòng / bài / cặp
-    logs = (
-        SpecialRoundScoreLog.objects
-        .filter(
-            cuocThi=cuocThi,
-            vongThi=vongThi,
-            baiThi=baiThi,
-            pair_member__pair=special_pair,
-        )
-    )
+    Tổng hợp chạy của 1 cặp vòng đặc biệt cho 1 bài thi (slot 1 / 2 = SpecialRoundPairMember.slot).
+    Cập nhật cùng transaction với mỗi lần ghi SpecialRoundScoreLog (core/special_round.py)
+    nên kết quả 100/0 đọc từ 1 dòng, không gom lại toàn bộ log của cặp.
+    """
+    pair = models.ForeignKey(SpecialRoundPair, on_delete=models.CASCADE, related_name="states")
+    baiThi = models.ForeignKey(BaiThi, on_delete=models.CASCADE)
+
+    thiSinh1 = models.ForeignKey(ThiSinh, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    score_sum1 = models.FloatField(default=0)
+    score_count1 = models.PositiveIntegerField(default=0)
+    best_time1 = models.IntegerField(null=True, blank=True)
+
+    thiSinh2 = models.ForeignKey(ThiSinh, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    score_sum2 = models.FloatField(default=0)
+    score_count2 = models.PositiveIntegerField(default=0)
+    best_time2 = models.IntegerField(null=True, blank=True)
 
-    # Nếu chưa đủ hai thí sinh có log thì chưa làm gì
-    agg = (
-        logs.values("pair_member_id")
-        .annotate(
-            avg_score=Avg("raw_score"),
-            best_time=Min("raw_time"),
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("pair", "baiThi")
+
+    def __str__(self):
+        return f"Cặp {self.pair_id} · bài {self.baiThi_id}"
+
+    def side(self, slot):
+        """-> (thiSinh_id, tổng điểm, số log, thời gian tốt nhất) của 1 slot."""
+        n = 1 if slot == 1 else 2
+        return (
+            getattr(self, f"thiSinh{n}_id"),
+            getattr(self, f"score_sum{n}"),
+            getattr(self, f"score_count{n}"),
+            getattr(self, f"best_time{n}"),
         )
-    )
 
-    data = list(agg)
-    if len(data) < 2:
-        # Mới có 1 bên được chấm → chưa kết luận
-        return {}
-
-    # Giả sử 1vs1: lấy 2 entry đầu
-    m1, m2 = data[0], data[1]
-
-    # Map pair_member_id -> thiSinh_id (để trả kết quả)
-    member_qs = SpecialRoundPairMember.objects.filter(id__in=[m1["pair_member_id"], m2["pair_member_id"]])
-    member_map = {m.id: m.thiSinh_id for m in member_qs}
-
-    # Helper lấy số liệu
-    def key(m):
-        score = m["avg_score"] or 0.0
-        time_ = m["best_time"]
-        # Nếu không có thời gian → coi như rất lớn (bất lợi trong tie-break)
-        if time_ is None:
-            time_ = 10**9
-        return score, -time_  # score ↑, time ↓ (dùng -time để sort desc theo score, asc theo time)
-
-    s1, s2 = key(m1), key(m2)
-
-    # Mặc định 0 điểm
-    result = {
-        member_map.get(m1["pair_member_id"]): 0,
-        member_map.get(m2["pair_member_id"]): 0,
-    }
-
-    # So sánh:
-    if s1 > s2:
-        # m1 thắng
-        result[member_map[m1["pair_member_id"]]] = 100
-    elif s2 > s1:
-        # m2 thắng
-        result[member_map[m2["pair_member_id"]]] = 100
-    else:
-        # Hoà tuyệt đối: cả hai 0 (hoặc tuỳ bạn muốn chia 50/50 thì chỉnh ở đây)
-        pass
+    def result(self):
+        """
+        {thiSinh_id: 100 | 0} khi cả 2 bên đã có log, {} nếu chưa đủ.
+        So TB điểm ↓ rồi thời gian tốt nhất ↑ (không có thời gian = bất lợi); hoà tuyệt đối: cả 2 = 0.
+        """
+        sides = [self.side(1), self.side(2)]
+        if any(cnt == 0 or ts is None for ts, _, cnt, _ in sides):
+            return {}
+
+        def key(side):
+            _, total, cnt, best = side
+            return total / cnt, -(best if best is not None else 10**9)
+
+        (ts1, *_), (ts2, *_) = sides
+        k1, k2 = key(sides[0]), key(sides[1])
+        return {ts1: 100 if k1 > k2 else 0, ts2: 100 if k2 > k1 else 0}
+
 
-    return result
+def compute_special_round_pair_result(cuocThi, vongThi, baiThi, special_pair):
+    """
+    Kết quả 100/0 của 1 cặp vòng đặc biệt cho 1 bài, BỎ QUA giamKhao
+    (TB raw_score, thời gian nhỏ nhất của mọi giám khảo).
+    Đọc từ SpecialRoundPairState (đã cộng dồn khi ghi log) -> 1 câu.
+    Trả về dict: {thiSinh_id: 100 hoặc 0}; {} nếu chưa đủ 2 bên.
+    """
+    state = SpecialRoundPairState.objects.filter(pair=special_pair, baiThi=baiThi).first()
+    return state.result() if state else {}
 
 class CapThiDau(models.Model):
     """
@@ -665,48 +777,209 @@ class BGDScore(models.Model):
         vt = getattr(self.vongThi, "ma", None) or "N/A"
         return f"{self.bgd.maBGD} - {self.cuocThi.ma} - {vt} - {self.thiSinh.maNV}: {self.diem}"
     
+class BGDTopEntry(models.Model):
+    """
+    Danh sách Top X đã chốt của 1 vòng BGD (rank 1 = đầu bảng), xem core/bgd_top.py.
+    Trang BGD đọc thẳng danh sách này; chỉ tính lại khi người tổ chức yêu cầu.
+    """
+    vongThi = models.ForeignKey(VongThi, on_delete=models.CASCADE, related_name="bgd_top")
+    thiSinh = models.ForeignKey(ThiSinh, on_delete=models.CASCADE, related_name="bgd_top_entries")
+    rank = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["vongThi", "rank"]
+        constraints = [
+            models.UniqueConstraint(fields=["vongThi", "rank"], name="bgd_top_rank_uniq"),
+            models.UniqueConstraint(fields=["vongThi", "thiSinh"], name="bgd_top_thi_sinh_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.vongThi_id} #{self.rank}: {self.thiSinh_id}"
+
+
+class BGDScoreTotal(models.Model):
+    """
+    Tổng điểm chạy của các BGD cho 1 thí sinh trong 1 vòng BGD (core/bgd_score.py).
+    Cập nhật cùng transaction với mỗi lượt chấm (khoá dòng) -> điểm trung bình đọc từ 1 dòng,
+    không gom lại BGDScore mỗi lần chấm.
+    """
+    cuocThi = models.ForeignKey(CuocThi, on_delete=models.CASCADE, related_name="+")
+    vongThi = models.ForeignKey(VongThi, on_delete=models.CASCADE, related_name="bgd_totals")
+    thiSinh = models.ForeignKey(ThiSinh, on_delete=models.CASCADE, related_name="+")
+    score_sum = models.IntegerField(default=0)
+    score_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("cuocThi", "vongThi", "thiSinh")
+
+    def __str__(self):
+        return f"{self.vongThi_id} · {self.thiSinh_id}: {self.score_sum}/{self.score_count}"
+
+    @property
+    def average(self):
+        return self.score_sum / self.score_count if self.score_count else 0.0
+
+
 @receiver(post_save, sender=BGDScore)
 def sync_phieu_cham_from_bgdscore(sender, instance, **kwargs):
     """
-    Khi một record BGDScore được lưu (kể cả sửa trong admin),
-    tự động tính lại điểm trung bình và cập nhật các Phiếu chấm BGD tương ứng.
+    BGDScore sửa NGOÀI đường chấm BGD (admin, shell...): dựng lại tổng điểm chạy và cập nhật
+    phiếu đại diện của thí sinh đó. Đường chấm BGD (core/bgd_score.py) không bắn signal.
+    Chưa từng có phiếu (chưa chấm qua trang BGD) thì không tự tạo mới ở đây.
     """
-    ct = getattr(instance, "cuocThi", None)
-    vt = getattr(instance, "vongThi", None)
-    ts = getattr(instance, "thiSinh", None)
-
     # Thiếu dữ liệu cơ bản thì bỏ qua
-    if not ct or not vt or not ts:
+    if not instance.cuocThi_id or not instance.vongThi_id or not instance.thiSinh_id:
         return
 
-    # Tính trung bình điểm các BGD cho thí sinh này trong đúng cuộc thi + vòng thi
-    qs = BGDScore.objects.filter(cuocThi=ct, vongThi=vt, thiSinh=ts)
-    agg = qs.aggregate(avg=Avg("diem"))
-    avg_val = agg.get("avg")
+    from .bgd_score import recompute  # tránh import vòng
+    recompute(instance.cuocThi, instance.vongThi, [instance.thiSinh_id], create_sheets=False)
 
-    if avg_val is None:
-        return
+class InvalidationEvent(models.Model):
+    """
+    Nhật ký "key cache X vừa đổi" để các worker/node bỏ cache trong tiến trình
+    (xem core/invalidation.py). id tăng dần = version toàn cục của key.
+    Chỉ giữ trong thời gian ngắn, bus tự xoá bản ghi cũ.
+    """
+    id = models.BigAutoField(primary_key=True)
+    key = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
-    avg_score = int(round(avg_val))
+    def __str__(self):
+        return f"#{self.id} {self.key}"
 
-    # Tìm các phiếu chấm BGD của thí sinh này trong vòng này
-    # (những phiếu có BaiThi tên bắt đầu bằng "BGD - ")
-    phieu_qs = PhieuChamDiem.objects.filter(
-        thiSinh=ts,
-        cuocThi=ct,
-        vongThi=vt,
-        baiThi__tenBaiThi__startswith="BGD - ",
+
+class RuntimeFlag(models.Model):
+    """
+    Cờ runtime bền (vd ranking_enabled), xem core/shared_cache.py: cache dùng chung chỉ là
+    bản sao để đọc nhanh, cache cull / evict mất key thì đọc lại từ bảng này.
+    """
+    name = models.CharField(max_length=100, primary_key=True)
+    value = models.JSONField(null=True, blank=True)
+    stamp = models.BigIntegerField(default=0)  # đổi mỗi lần set, dùng làm ETag
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name}={self.value!r}"
+
+
+class ScoreSubmissionKey(models.Model):
+    """
+    Khoá idempotency của các lần gửi điểm từ hàng đợi offline (score.js).
+    Trình duyệt sinh key cho từng mục; gửi lại cùng key -> trả kết quả cũ,
+    không ghi lại. Chỉ cần giữ tới khi hết hạn, /score/bulk/ tự dọn bản ghi cũ.
+    """
+    giamKhao = models.ForeignKey(GiamKhao, on_delete=models.CASCADE, db_index=False)
+    key = models.CharField(max_length=64)
+    result = models.JSONField(default=dict, blank=True)  # {"status", "diem", "thoiGian"}
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["giamKhao", "key"], name="score_submission_key_uniq"),
+        ]
+
+    def __str__(self):
+        return f"{self.giamKhao_id}:{self.key}"
+
+
+@receiver(post_save, sender=PhieuChamDiem)
+@receiver(post_delete, sender=PhieuChamDiem)
+def refresh_standing_on_phieu_change(sender, instance, **kwargs):
+    """Mọi đường ghi phiếu (chấm điểm, template, BGD, admin) đều cập nhật lại bảng xếp hạng."""
+    from .standings import schedule_refresh  # tránh import vòng
+    schedule_refresh(instance.cuocThi_id, instance.thiSinh_id)
+
+
+@receiver(post_save, sender=ThiSinhCuocThi)
+@receiver(post_delete, sender=ThiSinhCuocThi)
+def refresh_standing_on_membership_change(sender, instance, **kwargs):
+    from .standings import schedule_refresh
+    schedule_refresh(instance.cuocThi_id, instance.thiSinh_id)
+
+@receiver(post_save, sender=CapThiDau)
+@receiver(post_delete, sender=CapThiDau)
+def publish_battle_pair(sender, instance, **kwargs):
+    from .events import publish_contest_event
+    publish_contest_event(instance.cuocThi_id, "pair", {"pair_id": instance.pk})
+
+@receiver(post_save, sender=PhieuChamDiem)
+@receiver(post_delete, sender=PhieuChamDiem)
+@receiver(post_save, sender=ThiSinhCuocThi)
+@receiver(post_delete, sender=ThiSinhCuocThi)
+def invalidate_contest_scores(sender, instance, **kwargs):
+    from .invalidation import bus, contest_key  # tránh import vòng
+    bus.bump(contest_key(instance.cuocThi_id))
+
+
+@receiver(post_save, sender=ThiSinhCuocThi)
+@receiver(post_delete, sender=ThiSinhCuocThi)
+def invalidate_roster(sender, instance, **kwargs):
+    from .invalidation import bus, roster_key
+    bus.bump(roster_key(instance.cuocThi_id))
+
+
+@receiver(post_save, sender=ThiSinh)
+@receiver(post_delete, sender=ThiSinh)
+def invalidate_thi_sinh(sender, instance, **kwargs):
+    from .invalidation import bus, roster_key
+    bus.bump(roster_key())
+
+
+@receiver(post_save, sender=CuocThi)
+@receiver(post_delete, sender=CuocThi)
+def invalidate_contest(sender, instance, **kwargs):
+    from .invalidation import bus, contest_key, structure_key
+    bus.bump(contest_key(instance.pk), structure_key(instance.pk))
+
+
+@receiver(post_save, sender=VongThi)
+@receiver(post_delete, sender=VongThi)
+def invalidate_round(sender, instance, **kwargs):
+    from .invalidation import bus, contest_key, structure_key
+    bus.bump(contest_key(instance.cuocThi_id), structure_key(instance.cuocThi_id))
+
+
+@receiver(post_save, sender=BaiThi)
+@receiver(post_delete, sender=BaiThi)
+def invalidate_test(sender, instance, **kwargs):
+    from .invalidation import bus, contest_key, structure_key
+    ct_id = VongThi.objects.filter(pk=instance.vongThi_id).values_list("cuocThi_id", flat=True).first()
+    if ct_id:
+        bus.bump(contest_key(ct_id), structure_key(ct_id))
+
+
+@receiver(post_save, sender=BaiThiTimeRule)
+@receiver(post_delete, sender=BaiThiTimeRule)
+@receiver(post_save, sender=BaiThiTemplateSection)
+@receiver(post_delete, sender=BaiThiTemplateSection)
+def invalidate_test_detail(sender, instance, **kwargs):
+    """Rule thời gian / mục lớn của mẫu chấm đổi -> cấu trúc cuộc thi đổi."""
+    from .invalidation import bus, structure_key
+    ct_id = BaiThi.objects.filter(pk=instance.baiThi_id).values_list("vongThi__cuocThi_id", flat=True).first()
+    if ct_id:
+        bus.bump(structure_key(ct_id))
+
+
+@receiver(post_save, sender=BaiThiTemplateItem)
+@receiver(post_delete, sender=BaiThiTemplateItem)
+def invalidate_template_item(sender, instance, **kwargs):
+    from .invalidation import bus, structure_key
+    ct_id = (
+        BaiThiTemplateSection.objects.filter(pk=instance.section_id)
+        .values_list("baiThi__vongThi__cuocThi_id", flat=True).first()
     )
+    if ct_id:
+        bus.bump(structure_key(ct_id))
 
-    # Nếu chưa từng tạo phiếu (do chưa chấm qua UI) thì thôi, không tự tạo mới ở đây
-    if not phieu_qs.exists():
-        return
 
-    now = timezone.now()
-    for phieu in phieu_qs:
-        phieu.diem = avg_score
-        phieu.updated_at = now
-        phieu.save(update_fields=["diem", "updated_at"])
+@receiver(post_save, sender=GiamKhaoBaiThi)
+@receiver(post_delete, sender=GiamKhaoBaiThi)
+def invalidate_judge_assignment(sender, instance, **kwargs):
+    from .invalidation import bus, judge_key
+    bus.bump(judge_key(instance.giamKhao_id))
+
 # --- VOTING MODELS ---
 
 class ThiSinhVoting(models.Model):
@@ -0,0 +1,253 @@
+# core/qr_cards.py
+"""
+Vẽ thẻ QR của Ban Giám Đốc (nền trắng, QR ở giữa, chừa chỗ nhãn bên dưới), PNG hoặc SVG.
+
+render_card_png(url) chỉ phụ thuộc URL đích, không đụng Django -> chạy được trong
+process pool (spawn). render_card_svg(url) chỉ dựng path từ ma trận QR, không vẽ raster.
+iter_cards() trả nhiều thẻ theo đúng thứ tự, giữ tối đa vài thẻ trong bộ nhớ
+(cửa sổ in-flight) — đủ để stream zip.
+
+Thẻ đã vẽ được lưu trên đĩa theo hash nội dung đầu vào (card_key: phiên bản cách vẽ,
+định dạng, URL đích — URL đã gồm host, cuộc thi, vòng, token và go / go-stars):
+cùng đầu vào -> cùng file, không vẽ lại; key cũng là ETag.
+
+QR_RENDER_WORKERS (settings / env): số tiến trình vẽ; 0 = vẽ ngay trong request.
+QR_CACHE_DIR (settings / env): thư mục lưu thẻ đã vẽ.
+"""
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+# Đổi khi đổi cách vẽ -> mọi key đổi theo, file cũ không còn được dùng
+CARD_VERSION = 1
+CARD_PADDING = 40
+CARD_LABEL_HEIGHT = 80  # chừa chỗ cho 2 dòng chữ
+QR_BOX_SIZE = 10
+CARD_FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+# Ít thẻ hơn ngưỡng này: vẽ tại chỗ rẻ hơn gửi qua pool
+POOL_MIN_CARDS = 4
+# Số thẻ đang vẽ / chờ gửi tối đa cho mỗi tiến trình vẽ
+IN_FLIGHT_PER_WORKER = 2
+
+
+def _make_qr(url):
+    import qrcode
+    from qrcode.constants import ERROR_CORRECT_H
+
+    qr = qrcode.QRCode(
+        version=None,
+        error_correction=ERROR_CORRECT_H,
+        box_size=QR_BOX_SIZE,
+        border=4,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr
+
+
+def render_card_image(url):
+    """URL đích -> PIL.Image thẻ QR."""
+    from PIL import Image
+
+    qr_img = _make_qr(url).make_image(fill_color="black", back_color="white").convert("RGB")
+
+    qr_w, qr_h = qr_img.size
+    card_w = qr_w + CARD_PADDING * 2
+    card_h = qr_h + CARD_PADDING * 2 + CARD_LABEL_HEIGHT
+    card = Image.new("RGB", (card_w, card_h), "white")
+    card.paste(qr_img, ((card_w - qr_w) // 2, CARD_PADDING))
+    return card
+
+
+def render_card_png(url) -> bytes:
+    buf = BytesIO()
+    render_card_image(url).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def render_card_svg(url) -> bytes:
+    """
+    Cùng bố cục với PNG. Mỗi dải ô đen liền nhau trên 1 hàng = 1 nét ngang dày 1 ô,
+    toạ độ tương đối (m dx dy h n) -> file nhỏ, không vẽ raster.
+    """
+    matrix = _make_qr(url).get_matrix()  # đã gồm viền trắng
+    qr_size = len(matrix) * QR_BOX_SIZE
+    card_w = qr_size + CARD_PADDING * 2
+    card_h = qr_size + CARD_PADDING * 2 + CARD_LABEL_HEIGHT
+
+    parts = []
+    cx, cy = 0, 0  # điểm bút hiện tại (đơn vị ô)
+    for y, row in enumerate(matrix):
+        x, n = 0, len(row)
+        while x < n:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < n and row[x]:
+                x += 1
+            parts.append(f"m{start - cx} {y - cy}h{x - start}")
+            cx, cy = x, y
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{card_w}" height="{card_h}" '
+        f'viewBox="0 0 {card_w} {card_h}">'
+        f'<rect width="{card_w}" height="{card_h}" fill="#fff"/>'
+        f'<path transform="translate({CARD_PADDING} {CARD_PADDING}) scale({QR_BOX_SIZE})" '
+        f'stroke="#000" stroke-width="1" shape-rendering="crispEdges" '
+        f'd="M0 .5{"".join(parts)}"/>'
+        f"</svg>"
+    ).encode("utf-8")
+
+
+_RENDERERS = {"png": render_card_png, "svg": render_card_svg}
+
+
+# ---------- cache trên đĩa ----------
+def card_key(url, fmt="png") -> str:
+    return hashlib.sha256(f"v{CARD_VERSION}|{fmt}|{url}".encode("utf-8")).hexdigest()
+
+
+def _cache_path(key, fmt):
+    from django.conf import settings  # chỉ đọc ở tiến trình web, không ở worker vẽ
+
+    return os.path.join(settings.QR_CACHE_DIR, key[:2], f"{key}.{fmt}")
+
+
+def _read_cached(key, fmt):
+    try:
+        with open(_cache_path(key, fmt), "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _store(key, fmt, data):
+    """Ghi atomic (file tạm + rename): request song song không đọc phải file dở. Lỗi đĩa -> bỏ qua."""
+    path = _cache_path(key, fmt)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def load_card(url, fmt="png") -> bytes:
+    """1 thẻ: đọc từ cache, chưa có thì vẽ tại chỗ rồi lưu."""
+    key = card_key(url, fmt)
+    data = _read_cached(key, fmt)
+    if data is None:
+        data = _RENDERERS[fmt](url)
+        _store(key, fmt, data)
+    return data
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _workers():
+    from django.conf import settings  # chỉ đọc ở tiến trình web, không ở worker vẽ
+
+    return int(getattr(settings, "QR_RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+
+
+def _get_pool():
+    """Pool dùng chung của tiến trình web (tạo lần đầu cần). None = vẽ tại chỗ."""
+    global _pool
+    workers = _workers()
+    if workers <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn: không fork tiến trình web đang có thread / kết nối DB
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _reset_pool(broken):
+    """Bỏ pool hỏng (nếu chưa có request khác thay pool mới)."""
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_cards(urls, fmt="png"):
+    """
+    urls: iterable URL đích -> lần lượt bytes thẻ (fmt), cùng thứ tự.
+    Thẻ đã có trong cache đọc từ đĩa khi tới lượt; PNG chưa có vẽ song song trong pool
+    (SVG rẻ, vẽ tại chỗ). Pool hỏng / không tạo được -> vẽ nốt tại chỗ.
+    """
+    urls = list(urls)
+    keys = [card_key(url, fmt) for url in urls]
+    # Trước vòng lặp chỉ xét thẻ nào chưa có; thẻ có sẵn đọc lúc trả -> không giữ cả bộ trong bộ nhớ
+    missing = {key for key in keys if not os.path.exists(_cache_path(key, fmt))}
+    rendered = _iter_rendered([url for url, key in zip(urls, keys) if key in missing], fmt)
+    for url, key in zip(urls, keys):
+        if key in missing:
+            data = next(rendered)
+            _store(key, fmt, data)
+        else:
+            data = _read_cached(key, fmt)
+            if data is None:
+                # file mất giữa chừng (dọn cache) -> vẽ tại chỗ
+                data = _RENDERERS[fmt](url)
+                _store(key, fmt, data)
+        yield data
+
+
+def _iter_rendered(urls, fmt):
+    pool = None
+    if fmt == "png" and len(urls) >= POOL_MIN_CARDS:
+        try:
+            pool = _get_pool()
+        except (OSError, NotImplementedError):
+            pool = None
+    render = _RENDERERS[fmt]
+    if pool is None:
+        for url in urls:
+            yield render(url)
+        return
+
+    window = max(1, _workers()) * IN_FLIGHT_PER_WORKER
+    pending = deque()  # (url, future | None) theo thứ tự trả về
+    todo = iter(urls)
+    try:
+        for url in todo:
+            pending.append((url, None))
+            pending[-1] = (url, pool.submit(render, url))
+            while len(pending) >= window:
+                data = pending[0][1].result()
+                pending.popleft()
+                yield data
+        while pending:
+            data = pending[0][1].result()
+            pending.popleft()
+            yield data
+        return
+    except (BrokenProcessPool, CancelledError, RuntimeError):
+        # tiến trình vẽ chết / pool đã bị đóng -> phần còn lại vẽ tại chỗ
+        _reset_pool(pool)
+    finally:
+        for _, fut in pending:
+            if fut is not None:
+                fut.cancel()
+
+    for url, _ in pending:
+        yield render(url)
+    for url in todo:
+        yield render(url)
@@ -0,0 +1,199 @@
+# core/score_matrix.py
+"""
+Ma trận điểm của 1 cuộc thi: thí sinh × bài thi (numpy).
+
+Gom 1 lần bằng 1 câu GROUP BY trên PhieuChamDiem, mỗi ô (thí sinh, bài) giữ:
+  - cnt   : số phiếu
+  - avg   : TB điểm các phiếu        (NaN nếu chưa có phiếu)
+  - sum   : tổng điểm các phiếu
+  - t_avg : TB thời gian (giây)
+  - t_min : thời gian nhỏ nhất
+  - t_sum : tổng thời gian
+Các màn hình (xếp hạng, quản lý, export, chọn Top BGD, chia cặp vòng đặc biệt)
+chỉ việc chọn cột + chọn đại lượng, phần cộng/đếm/sắp xếp làm bằng vector.
+
+Ma trận được giữ lại trong tiến trình và chỉ nạp lại khi bus báo huỷ
+(core/invalidation.py) có event cho dữ liệu điểm hoặc cấu trúc của cuộc thi.
+"""
+import numpy as np
+from django.db.models import Avg, Count, Min, Sum
+
+from .invalidation import LocalCache, bus, contest_key, structure_key
+from .models import BaiThi, PhieuChamDiem, ThiSinhCuocThi
+
+_matrices = LocalCache(bus, max_entries=8)
+
+FIELDS = ("avg", "sum", "t_avg", "t_min", "t_sum")
+
+
+def _is_time_method(value) -> bool:
+    return str(value or "").strip().upper() in {"TIME", "2"}
+
+
+def _load_structure(ct_id):
+    return list(
+        BaiThi.objects.filter(vongThi__cuocThi_id=ct_id)
+        .order_by("vongThi_id", "id")
+        .values(
+            "id", "vongThi_id", "phuongThucCham",
+            "vongThi__is_bgd_round", "vongThi__is_special_bonus_round",
+        )
+    )
+
+
+class ContestScoreMatrix:
+    def __init__(self, ct_id, tests, member_ids, grouped):
+        self.ct_id = ct_id
+
+        # Hàng: thành viên ∪ thí sinh có phiếu, sắp theo mã NV
+        # -> chỉ số hàng cũng chính là khoá phụ "mã NV ↑" khi xếp hạng
+        ts_ids = set(member_ids)
+        ts_ids.update(r["thiSinh_id"] for r in grouped)
+        self.ts_ids = sorted(ts_ids)
+        self.ts_index = {ts: i for i, ts in enumerate(self.ts_ids)}
+        self.is_member = np.array([ts in member_ids for ts in self.ts_ids], dtype=bool)
+
+        self._set_structure(tests)
+
+        shape = (len(self.ts_ids), len(self.test_ids))
+        self.cnt = np.zeros(shape, dtype=np.int64)
+        for f in FIELDS:
+            setattr(self, f, np.full(shape, np.nan))
+
+        for r in grouped:
+            j = self.test_index.get(r["baiThi_id"])
+            if j is None:
+                continue
+            i = self.ts_index[r["thiSinh_id"]]
+            self.cnt[i, j] = r["cnt"]
+            for f in FIELDS:
+                v = r[f]
+                getattr(self, f)[i, j] = float(v) if v is not None else np.nan
+
+    def _set_structure(self, tests):
+        self.tests = tests
+        self.test_ids = [t["id"] for t in tests]
+        self.test_index = {bt: j for j, bt in enumerate(self.test_ids)}
+        self.round_ids = np.array([t["vongThi_id"] for t in tests], dtype=np.int64)
+        self.is_bgd = np.array([bool(t["vongThi__is_bgd_round"]) for t in tests], dtype=bool)
+        self.is_special = np.array([bool(t["vongThi__is_special_bonus_round"]) for t in tests], dtype=bool)
+        self.is_time = np.array([_is_time_method(t["phuongThucCham"]) for t in tests], dtype=bool)
+
+    # ---------- nạp ----------
+    @classmethod
+    def load(cls, ct, tests=None):
+        """Nạp thẳng từ DB (không qua cache)."""
+        ct_id = getattr(ct, "pk", ct)
+        grouped = list(
+            PhieuChamDiem.objects.filter(cuocThi_id=ct_id)
+            .values("thiSinh_id", "baiThi_id")
+            .annotate(
+                cnt=Count("pk"),
+                avg=Avg("diem"),
+                sum=Sum("diem"),
+                t_avg=Avg("thoiGian"),
+                t_min=Min("thoiGian"),
+                t_sum=Sum("thoiGian"),
+            )
+        )
+        member_ids = set(
+            ThiSinhCuocThi.objects.filter(cuocThi_id=ct_id).values_list("thiSinh_id", flat=True)
+        )
+        return cls(ct_id, tests if tests is not None else _load_structure(ct_id), member_ids, grouped)
+
+    @classmethod
+    def for_contest(cls, ct):
+        """Ma trận của cuộc thi, dùng lại bản đã nạp tới khi bus báo dữ liệu / cấu trúc đổi."""
+        ct_id = getattr(ct, "pk", ct)
+        return _matrices.get(
+            f"matrix:{ct_id}",
+            [contest_key(ct_id), structure_key(ct_id)],
+            lambda: cls.load(ct_id),
+        )
+
+    # ---------- chọn cột ----------
+    def columns(self, tests=None, rounds=None, bgd=None, special=None):
+        """
+        Mặt nạ cột. Các điều kiện AND với nhau:
+          tests/rounds: chỉ các bài / vòng trong danh sách
+          bgd/special : True = chỉ vòng BGD / vòng đặc biệt, False = loại bỏ
+        """
+        mask = np.ones(len(self.test_ids), dtype=bool)
+        if tests is not None:
+            mask &= np.isin(np.array(self.test_ids, dtype=np.int64), list(tests))
+        if rounds is not None:
+            mask &= np.isin(self.round_ids, list(rounds))
+        if bgd is not None:
+            mask &= self.is_bgd if bgd else ~self.is_bgd
+        if special is not None:
+            mask &= self.is_special if special else ~self.is_special
+        return mask
+
+    def _pick(self, field, cols):
+        arr = getattr(self, field)
+        return arr if cols is None else arr[:, cols]
+
+    # ---------- vector theo thí sinh ----------
+    def has_scores(self, cols=None):
+        """Thí sinh có ít nhất 1 phiếu trong các cột đã chọn."""
+        return self._pick("cnt", cols).sum(axis=1) > 0
+
+    def done(self, cols=None):
+        """Số bài đã có phiếu."""
+        return (self._pick("cnt", cols) > 0).sum(axis=1)
+
+    def totals(self, field="avg", cols=None):
+        """Tổng theo hàng, ô trống tính 0."""
+        return np.nansum(self._pick(field, cols), axis=1)
+
+    def time_totals(self, field="t_min", cols=None):
+        """Tổng thời gian theo hàng; NaN nếu thí sinh không có thời gian nào."""
+        arr = self._pick(field, cols)
+        has_any = ~np.isnan(arr).all(axis=1) if arr.shape[1] else np.zeros(arr.shape[0], dtype=bool)
+        return np.where(has_any, np.nansum(arr, axis=1), np.nan)
+
+    def order(self, totals, times=None, rows=None):
+        """
+        Chỉ số hàng theo thứ tự xếp hạng: tổng ↓, thời gian ↑ (NaN xuống cuối), mã NV ↑.
+        rows: mặt nạ / danh sách chỉ số hàng được tham gia (mặc định: tất cả).
+        """
+        idx = np.arange(len(self.ts_ids))
+        if rows is not None:
+            idx = idx[rows]
+        keys = [idx]
+        if times is not None:
+            keys.append(np.nan_to_num(np.asarray(times, dtype=float)[idx], nan=np.inf))
+        keys.append(-np.asarray(totals, dtype=float)[idx])
+        return idx[np.lexsort(keys)]
+
+    # ---------- tra từng ô ----------
+    def value(self, field, ts_id, bt_id):
+        """Giá trị 1 ô, None nếu chưa có phiếu / không có trong ma trận."""
+        i = self.ts_index.get(ts_id)
+        j = self.test_index.get(bt_id)
+        if i is None or j is None:
+            return None
+        v = getattr(self, field)[i, j]
+        return None if np.isnan(v) else float(v)
+
+    def row_values(self, field, ts_id, bt_ids, default=0.0):
+        return [
+            v if v is not None else default
+            for v in (self.value(field, ts_id, bt) for bt in bt_ids)
+        ]
+
+
+def score_bands(totals, total_max):
+    """
+    Thống kê cho trang quản lý (bỏ người tổng = 0):
+    -> (điểm TB, {"100-90": n, "89-60": n, "59-0": n})
+    """
+    valid = np.asarray(totals, dtype=float)
+    valid = valid[valid > 0]
+    avg_score = float(valid.mean()) if valid.size else 0
+    pct = valid / total_max * 100 if total_max > 0 else np.zeros_like(valid)
+    return avg_score, {
+        "100-90": int(np.count_nonzero(pct >= 90)),
+        "89-60": int(np.count_nonzero((pct >= 60) & (pct < 90))),
+        "59-0": int(np.count_nonzero(pct < 60)),
+    }
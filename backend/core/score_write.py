@@ -0,0 +1,91 @@
+# core/score_write.py
+"""
+Đường ghi phiếu chấm dùng chung: form chấm (/score/), API mẫu chấm, /score/bulk/.
+
+upsert_sheets() ghi mọi phiếu của 1 giám khảo bằng INSERT ... ON CONFLICT DO UPDATE
+trên khoá (thí sinh, giám khảo, bài thi) — đúng unique_together của PhieuChamDiem:
+  - không đọc-rồi-ghi (update_or_create) -> không có khe hở giữa SELECT và INSERT,
+    nhiều giám khảo chấm cùng thí sinh cùng lúc không đụng IntegrityError;
+  - mỗi giám khảo chỉ chạm dòng của mình -> không tranh khoá với giám khảo khác;
+  - các dòng ghi theo thứ tự khoá cố định -> 2 lô chồng nhau không deadlock;
+  - transaction chỉ gồm câu upsert; bảng xếp hạng / cache / vòng đặc biệt chạy
+    sau commit (on_commit), mỗi việc trong transaction ngắn riêng.
+
+bulk_create không gọi PhieuChamDiem.save() -> upsert_sheets tự chạy cùng bộ kiểm tra
+(ScoreWriteContext.check: điểm hợp lệ + quyền chấm) cho mọi dòng trước khi ghi; 1 dòng
+sai -> ValueError / PermissionError, không ghi dòng nào. Caller vẫn nên lọc trước
+(_assignment_index, schema) để báo lỗi theo từng mục.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .invalidation import bus, contest_key
+from .models import PhieuChamDiem, ScoreWriteContext
+from .special_round import apply_scores_after_commit
+from .standings import schedule_refresh_many
+
+SHEET_UNIQUE_FIELDS = ["thiSinh", "giamKhao", "baiThi"]
+SHEET_UPDATE_FIELDS = ["cuocThi", "maCuocThi", "vongThi", "diem", "thoiGian", "updated_at"]
+UPSERT_BATCH = 500
+
+
+def upsert_sheets(ct, judge, rows, rules=None):
+    """
+    rows: [(thi_sinh, bt, diem, thoiGian | None)] (bt đã select_related vongThi).
+    thoiGian None = giữ thời gian cũ của phiếu (phiếu mới: 0). Trùng (thí sinh, bài): dòng sau thắng.
+    -> {(ts_id, bt_id): "created" | "updated"}
+    rules: ScoreWriteContext dùng để kiểm tra (mặc định: context đang mở của judge hoặc mới).
+    Raise ValueError / PermissionError (ScoreWriteContext.check) trước khi ghi.
+    """
+    picked = {}
+    for ts, bt, diem, thoi_gian in rows:
+        picked[(ts.pk, bt.pk)] = (ts, bt, diem, thoi_gian)
+    if not picked:
+        return {}
+
+    rules = rules or ScoreWriteContext.current(judge.pk) or ScoreWriteContext(judge)
+    for ts, bt, diem, thoi_gian in picked.values():
+        rules.check(ct, bt.vongThi, bt, diem)
+
+    # Chỉ để báo created/updated (không khoá): ghi đúng dù có lô khác chen giữa
+    had = set(
+        PhieuChamDiem.objects.filter(
+            giamKhao=judge,
+            thiSinh_id__in={ts for ts, _ in picked},
+            baiThi_id__in={bt for _, bt in picked},
+        ).values_list("thiSinh_id", "baiThi_id")
+    )
+
+    now = timezone.now()
+    with_time, keep_time = [], []
+    for key in sorted(picked):  # thứ tự khoá cố định
+        ts, bt, diem, thoi_gian = picked[key]
+        (keep_time if thoi_gian is None else with_time).append(PhieuChamDiem(
+            thiSinh=ts, giamKhao=judge, cuocThi=ct, maCuocThi=ct.ma,
+            vongThi_id=bt.vongThi_id, baiThi=bt, diem=diem,
+            thoiGian=int(thoi_gian or 0), updated_at=now,
+        ))
+
+    with transaction.atomic():
+        for objs, fields in (
+            (with_time, SHEET_UPDATE_FIELDS),
+            (keep_time, [f for f in SHEET_UPDATE_FIELDS if f != "thoiGian"]),
+        ):
+            if objs:
+                PhieuChamDiem.objects.bulk_create(
+                    objs,
+                    batch_size=UPSERT_BATCH,
+                    update_conflicts=True,
+                    unique_fields=SHEET_UNIQUE_FIELDS,
+                    update_fields=fields,
+                )
+        # bulk_create không bắn signal -> tự cập nhật bảng xếp hạng / cache (sau commit)
+        schedule_refresh_many(ct.id, {ts for ts, _ in picked})
+        bus.bump(contest_key(ct.id))
+        apply_scores_after_commit([
+            (bt, ts, judge, diem, int(thoi_gian or 0))
+            for ts, bt, diem, thoi_gian in picked.values()
+            if bt.vongThi.is_special_bonus_round
+        ])
+
+    return {key: "updated" if key in had else "created" for key in picked}
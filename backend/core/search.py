@@ -0,0 +1,186 @@
+# core/search.py
+"""
+Tìm thí sinh không phân biệt dấu / hoa thường.
+
+ThiSinh.search_key lưu sẵn "<mã NV> <họ tên>" đã chuẩn hoá (fold_text), nên:
+  - "nguyen" khớp "Nguyễn", "duc" khớp "Đức"
+  - so khớp chạy trên 1 cột có index thay vì icontains trên 2 cột
+Index:
+  - B-tree trên search_key (mọi DB): tiền tố "<q>..." dùng khoảng [q, q + U+FFFF)
+  - PostgreSQL: thêm GIN pg_trgm (migration 0006) cho khớp giữa chuỗi '%q%'
+
+Gợi ý khi gõ (score.js, ajax=suggest) không xuống DB: SuggestIndex giữ trong
+tiến trình cho từng cuộc thi, dựng lại khi danh sách / thông tin thí sinh đổi.
+"""
+import sys
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from .invalidation import LocalCache, bus, roster_key, structure_key
+
+# pg_trgm cần ít nhất 3 ký tự để dùng index; ngắn hơn chỉ tìm theo tiền tố
+MIN_CONTAINS_LEN = 3
+
+
+def fold_text(s) -> str:
+    """
+    Bỏ dấu + đ→d + lowercase + gộp khoảng trắng.
+    'Nguyễn  Văn Đức' -> 'nguyen van duc'
+    """
+    if not s:
+        return ""
+    s = unicodedata.normalize("NFD", str(s))
+    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
+    s = s.replace("đ", "d").replace("Đ", "D")
+    return " ".join(s.lower().split())
+
+
+def thi_sinh_search_key(maNV, hoTen) -> str:
+    return f"{fold_text(maNV)} {fold_text(hoTen)}".strip()
+
+
+def _prefix_q(field, q):
+    if connection.vendor == "postgresql":
+        # LIKE 'q%' dùng được index varchar_pattern_ops Django tạo kèm db_index
+        return Q(**{f"{field}__startswith": q})
+    # SQLite không dùng index cho LIKE ... ESCAPE -> so sánh khoảng
+    return Q(**{f"{field}__gte": q, f"{field}__lt": q + "\uffff"})
+
+
+def search_thi_sinh(qs, query):
+    """
+    Lọc queryset ThiSinh theo chuỗi người dùng gõ, xếp hạng:
+      0 = khớp đầu mã NV, 1 = khớp đầu 1 từ trong họ tên, 2 = khớp giữa chuỗi.
+    Chuỗi < MIN_CONTAINS_LEN ký tự: chỉ 0 và 1.
+    """
+    q = fold_text(query)
+    if not q:
+        return qs.none()
+
+    word = Q(search_key__contains=f" {q}")
+    if len(q) < MIN_CONTAINS_LEN:
+        cond = _prefix_q("search_key", q) | word
+    else:
+        cond = Q(search_key__contains=q)
+
+    return (
+        qs.filter(cond)
+        .annotate(match_rank=Case(
+            When(_prefix_q("search_key", q), then=Value(0)),
+            When(word, then=Value(1)),
+            default=Value(2),
+            output_field=IntegerField(),
+        ))
+        .order_by("match_rank", "maNV")
+    )
+
+
+class SuggestIndex:
+    """
+    Chỉ mục tiền tố của 1 cuộc thi (mảng đã sắp xếp + bisect, tương đương trie
+    nhưng gọn hơn nhiều trong Python):
+      - code_keys           : mã NV đã chuẩn hoá                 -> khớp hạng 0
+      - word_rows/word_offs : (hàng, vị trí) đầu mỗi từ trong họ tên đã chuẩn hoá,
+                              sắp theo phần đuôi tên từ vị trí đó -> khớp hạng 1
+                              (không lưu chuỗi đuôi, chỉ 2 mảng int)
+      - folded              : họ tên đã chuẩn hoá, quét khi cần khớp giữa chuỗi (hạng 2)
+    Thứ tự kết quả giống search_thi_sinh: hạng ↑ rồi mã NV ↑.
+    """
+
+    def __init__(self, rows, active=True):
+        rows = sorted(rows)  # [(maNV, hoTen)] theo mã NV -> chỉ số hàng = thứ tự mã
+        self.active = active
+        self.codes = [r[0] for r in rows]
+        self.names = [r[1] for r in rows]
+        self.folded = [fold_text(ten) for _, ten in rows]
+
+        codes = sorted((fold_text(ma), i) for i, ma in enumerate(self.codes))
+        self.code_keys = [k for k, _ in codes]
+        self.code_rows = array("i", (i for _, i in codes))
+
+        words = []
+        for i, name in enumerate(self.folded):
+            off = 0
+            for part in name.split(" "):
+                words.append((i, off))
+                off += len(part) + 1
+        words.sort(key=lambda w: self.folded[w[0]][w[1]:])
+        self.word_rows = array("i", (i for i, _ in words))
+        self.word_offs = array("i", (o for _, o in words))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _code_hits(self, q):
+        j = bisect_left(self.code_keys, q)
+        while j < len(self.code_keys) and self.code_keys[j].startswith(q):
+            yield self.code_rows[j]
+            j += 1
+
+    def _word_hits(self, q):
+        folded, rows, offs = self.folded, self.word_rows, self.word_offs
+        j = bisect_left(range(len(rows)), q, key=lambda k: folded[rows[k]][offs[k]:])
+        while j < len(rows) and folded[rows[j]].startswith(q, offs[j]):
+            yield rows[j]
+            j += 1
+
+    def lookup(self, query, limit=20):
+        q = fold_text(query)
+        if not q:
+            return []
+
+        seen = set()
+        out = []
+        for rank_rows in (sorted(self._code_hits(q)), sorted(set(self._word_hits(q)))):
+            for i in rank_rows:
+                if i not in seen:
+                    seen.add(i)
+                    out.append(i)
+            if len(out) >= limit:
+                break
+
+        if len(out) < limit and len(q) >= MIN_CONTAINS_LEN:
+            for i, name in enumerate(self.folded):
+                if i not in seen and (q in name or q in self.codes[i].lower()):
+                    out.append(i)
+                    if len(out) >= limit:
+                        break
+
+        return [{"maNV": self.codes[i], "hoTen": self.names[i]} for i in out[:limit]]
+
+    def footprint(self) -> int:
+        """Ước lượng bộ nhớ (byte): list + chuỗi + mảng, không tính phần dùng chung của Python."""
+        total = sys.getsizeof(self)
+        for lst in (self.codes, self.names, self.folded, self.code_keys):
+            total += sys.getsizeof(lst) + sum(sys.getsizeof(x) for x in lst)
+        for arr in (self.code_rows, self.word_rows, self.word_offs):
+            total += sys.getsizeof(arr)
+        return total
+
+
+_suggest_indexes = LocalCache(bus, max_entries=16)
+
+
+def build_suggest_index(ct_id):
+    from .models import CuocThi, ThiSinhCuocThi  # tránh import vòng
+
+    active = CuocThi.objects.filter(pk=ct_id, trangThai=True).exists()
+    rows = ThiSinhCuocThi.objects.filter(cuocThi_id=ct_id).values_list("thiSinh_id", "thiSinh__hoTen")
+    return SuggestIndex(((ma, ten or "") for ma, ten in rows), active=active)
+
+
+def contest_suggest_index(ct_id) -> SuggestIndex:
+    """
+    Chỉ mục gợi ý của cuộc thi, giữ trong tiến trình. Dựng lại khi:
+      - thêm / bớt thí sinh của cuộc thi, sửa / import thí sinh (roster_key)
+      - bật / tắt, sửa cuộc thi (structure_key)
+    """
+    return _suggest_indexes.get(
+        f"suggest:{ct_id}",
+        [roster_key(ct_id), roster_key(), structure_key(ct_id)],
+        lambda: build_suggest_index(ct_id),
+    )
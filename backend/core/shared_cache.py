@@ -0,0 +1,66 @@
+# core/shared_cache.py
+"""
+Tầng cache dùng chung giữa các worker (settings.CACHES["shared"]).
+
+Cache "default" là LocMem riêng từng tiến trình: bật/tắt ranking ở worker này
+thì worker khác không biết. Mọi thứ cần nhất quán giữa các worker đi qua đây:
+  - cờ runtime (get_flag / set_flag), kèm stamp để làm ETag cho GET có điều kiện.
+    Giá trị gốc nằm ở bảng RuntimeFlag; cache chỉ giữ bản sao (file cache cull ngẫu nhiên,
+    Redis evict) -> mất key thì đọc lại DB chứ không rơi về giá trị mặc định.
+  - dữ liệu đã tính / đã render (get_or_set), key phải chứa version dữ liệu
+"""
+import time
+
+from django.core.cache import caches
+
+RANKING_STATE_KEY = "ranking_enabled"  # True = mở, False = tắt
+
+
+def shared():
+    return caches["shared"]
+
+
+# Bản sao đọc lại từ DB khi cache trượt chỉ sống ngắn: 1 lần đọc DB chạy song song với
+# set_flag có thể mang giá trị cũ về sau bản mới -> cũ tối đa chừng này giây, không vĩnh viễn
+FLAG_FILL_TIMEOUT = 30
+
+
+def _read_flag(name):
+    from .models import RuntimeFlag  # tránh import vòng
+    # chưa từng set -> vẫn cache {"stamp": 0} để các lần đọc sau không vào DB
+    return RuntimeFlag.objects.filter(pk=name).values("value", "stamp").first() or {"stamp": 0}
+
+
+def get_flag(name, default=None):
+    """-> (value, stamp). stamp đổi mỗi lần set_flag; 0 nếu chưa từng set."""
+    key = f"flag:{name}"
+    raw = shared().get(key)
+    if not isinstance(raw, dict):
+        raw = _read_flag(name)
+        # add: set_flag chen vào giữa lúc đọc DB và lúc ghi cache thì bản của set_flag thắng
+        shared().add(key, raw, FLAG_FILL_TIMEOUT)
+    if not raw.get("stamp"):
+        return default, 0
+    return raw.get("value", default), raw["stamp"]
+
+
+def set_flag(name, value):
+    from .models import RuntimeFlag  # tránh import vòng
+    stamp = time.time_ns()
+    RuntimeFlag.objects.update_or_create(name=name, defaults={"value": value, "stamp": stamp})
+    shared().set(f"flag:{name}", {"value": value, "stamp": stamp}, None)
+    return stamp
+
+
+def ranking_enabled() -> bool:
+    return bool(get_flag(RANKING_STATE_KEY, True)[0])
+
+
+def get_or_set(key, builder, timeout=300):
+    """Đọc từ cache dùng chung; chưa có thì builder() rồi lưu lại."""
+    c = shared()
+    value = c.get(key)
+    if value is None:
+        value = builder()
+        c.set(key, value, timeout)
+    return value
@@ -0,0 +1,282 @@
+# core/sheet_import.py
+"""
+Import phiếu chấm giấy theo mẫu "mẫu chấm thi.xlsx" (static/files).
+
+Mỗi sheet là 1 phiếu chấm của 1 bài thi:
+  - Bài thi : ô tiêu đề "Phiếu chấm thi bài <mã bài | tên bài>", không có thì tên sheet,
+              không khớp nữa thì bài chọn trên form.
+  - Dòng    : dưới dòng tiêu đề "Danh Mục 1 | Danh Mục 2 | Điểm" -> mục con của mẫu chấm
+              (khớp theo tên mục lớn + mục con không dấu; lệch tên nhưng đủ số dòng thì khớp
+              theo thứ tự). Ô "Danh Mục 1" bị merge (trống) lấy theo dòng trên.
+  - Cột     : từ sau cột "Điểm" -> mỗi cột 1 thí sinh. Cột "Điểm Chấm" của mẫu gốc là thí sinh
+              ghi ở ô "Mã NV" / "Thí sinh" phía trên, không có thì tên sheet; các cột khác có
+              tiêu đề là mã NV.
+  - Bài POINTS (không có mẫu chấm): điểm = tổng các ô số trong cột thí sinh.
+
+Điểm mục con kiểm tra theo max của contest_schema (cache), quyền chấm theo tập bài được
+phân công. Chỉ lưu tổng điểm (PhieuChamDiem), giống API mẫu chấm trên trang chấm.
+build_plan() chỉ đọc + so với phiếu đang có (dry-run), apply_plan() ghi qua
+score_write.upsert_sheets.
+"""
+from openpyxl import load_workbook
+
+from .contest_schema import contest_schema
+from .models import BaiThi, PhieuChamDiem, ThiSinh, ThiSinhCuocThi
+from .score_write import upsert_sheets
+from .search import fold_text
+
+HEADER_SCAN_ROWS = 30
+TITLE_PREFIX = "phieu cham thi bai"
+SCORE_COLUMN = "diem cham"
+CODE_LABELS = {"ma nv", "manv", "ma nhan vien", "thi sinh", "ma thi sinh"}
+
+
+def _num(v):
+    """Ô điểm -> số (None nếu trống); sai định dạng -> ValueError."""
+    if v is None or (isinstance(v, str) and not v.strip()):
+        return None
+    if isinstance(v, bool):
+        raise ValueError(v)
+    if isinstance(v, (int, float)):
+        return float(v)
+    return float(str(v).strip().replace(",", "."))
+
+
+class ImportPlan:
+    """
+    Kết quả đọc workbook:
+      rows   : [{"sheet", "maNV", "bt_id", "ma", "old", "new", "status"}]
+               status = created | updated | unchanged
+      rejects: [(sheet, vị trí, lý do)]
+    """
+
+    def __init__(self, ct, judge):
+        self.ct = ct
+        self.judge = judge
+        self.rows = []
+        self.rejects = []
+
+    def reject(self, sheet, where, reason):
+        self.rejects.append((sheet, where, reason))
+
+    def counts(self):
+        out = {"created": 0, "updated": 0, "unchanged": 0}
+        for r in self.rows:
+            out[r["status"]] += 1
+        return out
+
+
+def _find_header(rows):
+    # -> (chỉ số dòng tiêu đề, cột Danh Mục 1, cột Danh Mục 2, cột Điểm) hoặc None
+    for ridx, row in enumerate(rows):
+        col_section = col_item = col_max = None
+        for cidx, v in enumerate(row):
+            t = fold_text(v)
+            if t in ("danh muc 1", "muc lon", "section"):
+                col_section = cidx
+            elif t in ("danh muc 2", "muc nho", "item", "noi dung"):
+                col_item = cidx
+        if col_section is None or col_item is None:
+            continue
+        # cột "Điểm" (max) có thể nằm ở dòng trên (mẫu gốc: dòng 2)
+        for above in rows[max(0, ridx - 2): ridx + 1]:
+            for cidx, v in enumerate(above):
+                t = fold_text(v)
+                if t == "diem" or (t.startswith("diem") and "cham" not in t and "toi da" not in t):
+                    col_max = cidx
+        if col_max is None:
+            col_max = max(col_section, col_item) + 1
+        return ridx, col_section, col_item, col_max
+    return None
+
+
+def _sheet_test(schema, title_rows, sheet_name, fallback_id):
+    by_code = {fold_text(t["ma"]): t for t in schema.tests.values()}
+    by_name = {fold_text(t["tenBaiThi"]): t for t in schema.tests.values()}
+    for row in title_rows:
+        for v in row:
+            t = fold_text(v)
+            if t.startswith(TITLE_PREFIX):
+                key = t[len(TITLE_PREFIX):].strip()
+                if key in by_code or key in by_name:
+                    return by_code.get(key) or by_name[key]
+    key = fold_text(sheet_name)
+    if key in by_code:
+        return by_code[key]
+    return schema.test(fallback_id) if fallback_id else None
+
+
+def _sheet_contestant(title_rows, sheet_name):
+    # ô nhãn "Mã NV" / "Thí sinh" -> giá trị ở ô kế bên phải
+    for row in title_rows:
+        for cidx, v in enumerate(row):
+            if fold_text(v).rstrip(":") in CODE_LABELS:
+                for nxt in row[cidx + 1:]:
+                    if nxt not in (None, ""):
+                        return str(nxt).strip()
+    return sheet_name.strip()
+
+
+def _item_rows(spec, data, col_section, col_item, sheet, plan, first_row):
+    """Dòng dữ liệu -> [(số dòng excel, item | None)]; item None với bài POINTS."""
+    if spec["type"] == "POINTS":
+        return [(first_row + k, None) for k in range(len(data))]
+
+    items = [(sec, it) for sec in spec["sections"] for it in sec["items"]]
+    by_key = {(fold_text(sec["title"]), fold_text(it["content"])): it for sec, it in items}
+
+    labelled = []
+    last_section = ""
+    for k, r in enumerate(data):
+        s = r[col_section] if col_section < len(r) else None
+        i = r[col_item] if col_item < len(r) else None
+        if s not in (None, ""):
+            last_section = s
+        if i in (None, ""):
+            continue
+        labelled.append((first_row + k, fold_text(" ".join(str(last_section).split())), fold_text(i)))
+
+    mapped = [(line, by_key.get((s, i))) for line, s, i in labelled]
+    if any(it is None for _, it in mapped) and len(labelled) == len(items):
+        # tên lệch (sửa chính tả...) nhưng đủ số dòng -> khớp theo thứ tự
+        return [(line, it) for (line, _, _), (_, it) in zip(labelled, items)]
+    for line, it in mapped:
+        if it is None:
+            plan.reject(sheet, f"dòng {line}", "Không khớp mục nào trong mẫu chấm của bài.")
+    return [(line, it) for line, it in mapped if it is not None]
+
+
+def build_plan(f, ct, judge, allowed_ids, fallback_bt_id=None):
+    """
+    Đọc workbook (read-only), kiểm tra, so với phiếu hiện có của `judge` -> ImportPlan.
+    allowed_ids: tập bài judge được chấm (_assignment_index).
+    """
+    schema = contest_schema(ct)
+    members = {
+        ts_id.lower(): ts_id
+        for ts_id in ThiSinhCuocThi.objects.filter(cuocThi=ct).values_list("thiSinh_id", flat=True)
+    }
+    plan = ImportPlan(ct, judge)
+    fallback_bt_id = int(fallback_bt_id) if str(fallback_bt_id or "").isdigit() else None
+
+    wb = load_workbook(f, read_only=True, data_only=True)
+    scores = {}  # (ts_id, bt_id) -> (sheet, tổng điểm)
+    for ws in wb.worksheets:
+        sheet = ws.title
+        rows = [tuple(r) for r in ws.iter_rows(values_only=True)]
+        header = _find_header(rows[:HEADER_SCAN_ROWS])
+        if header is None:
+            if any(any(v not in (None, "") for v in r) for r in rows):
+                plan.reject(sheet, "", "Không tìm thấy dòng tiêu đề (Danh Mục 1 / Danh Mục 2 / Điểm).")
+            continue
+        hidx, col_section, col_item, col_max = header
+        title_rows = rows[:hidx + 1]
+
+        spec = _sheet_test(schema, title_rows, sheet, fallback_bt_id)
+        if spec is None:
+            plan.reject(sheet, "", "Không xác định được bài thi của cuộc thi.")
+            continue
+        if spec["type"] == "TIME":
+            plan.reject(sheet, spec["ma"], "Bài chấm theo thời gian: dùng import kết quả bấm giờ.")
+            continue
+        if schema.round(spec["vongThi_id"])["is_special_bonus_round"]:
+            plan.reject(sheet, spec["ma"], "Bài thuộc vòng đặc biệt (chia cặp): chấm trên trang chấm điểm.")
+            continue
+        if spec["id"] not in allowed_ids:
+            plan.reject(sheet, spec["ma"], "Bạn không được phân công chấm bài này.")
+            continue
+
+        # Cột thí sinh: nhãn = ô có chữ cuối cùng từ trên xuống tới dòng tiêu đề
+        width = max(len(r) for r in rows) if rows else 0
+        columns = []
+        for cidx in range(col_max + 1, width):
+            label = None
+            for r in title_rows:
+                if cidx < len(r) and r[cidx] not in (None, ""):
+                    label = str(r[cidx]).strip()
+            if label is None:
+                continue
+            code = _sheet_contestant(title_rows, sheet) if fold_text(label) == SCORE_COLUMN else label
+            ts_id = members.get(code.lower())
+            if ts_id is None:
+                if fold_text(label) == SCORE_COLUMN or any(
+                    cidx < len(r) and isinstance(r[cidx], (int, float)) for r in rows[hidx + 1:]
+                ):
+                    plan.reject(sheet, code, "Không thuộc cuộc thi.")
+                continue
+            columns.append((cidx, ts_id))
+
+        data = rows[hidx + 1:]
+        lines = _item_rows(spec, data, col_section, col_item, sheet, plan, first_row=hidx + 2)
+
+        for cidx, ts_id in columns:
+            total = 0
+            seen = False
+            bad = False
+            for line, item in lines:
+                r = data[line - hidx - 2]
+                try:
+                    v = _num(r[cidx] if cidx < len(r) else None)
+                except ValueError:
+                    plan.reject(sheet, f"{ts_id} dòng {line}", "Điểm không hợp lệ.")
+                    bad = True
+                    continue
+                if v is None:
+                    continue
+                seen = True
+                if item is not None and not (0 <= v <= item["max"]):
+                    plan.reject(sheet, f"{ts_id} dòng {line}", f"Chỉ cho phép 0..{item['max']}.")
+                    bad = True
+                total += v
+            if bad or not seen:
+                continue
+            total = int(round(total))
+            if not (0 <= total <= spec["max"]):
+                plan.reject(sheet, ts_id, f"Tổng {total} ngoài 0..{spec['max']}.")
+                continue
+            key = (ts_id, spec["id"])
+            if key in scores:
+                plan.reject(scores[key][0], ts_id, f"Bị thay bởi sheet {sheet} ({spec['ma']}).")
+            scores[key] = (sheet, total)
+    wb.close()
+
+    if not scores:
+        return plan
+
+    existing = {
+        (r[0], r[1]): r[2]
+        for r in PhieuChamDiem.objects.filter(
+            cuocThi=ct, giamKhao=judge,
+            thiSinh_id__in={ts for ts, _ in scores}, baiThi_id__in={bt for _, bt in scores},
+        ).values_list("thiSinh_id", "baiThi_id", "diem")
+    }
+    for (ts_id, bt_id), (sheet, total) in sorted(scores.items()):
+        old = existing.get((ts_id, bt_id))
+        old = float(old) if old is not None else None
+        plan.rows.append({
+            "sheet": sheet,
+            "maNV": ts_id,
+            "bt_id": bt_id,
+            "ma": schema.tests[bt_id]["ma"],
+            "vongThi_id": schema.tests[bt_id]["vongThi_id"],
+            "old": old,
+            "new": total,
+            "status": "created" if old is None else ("unchanged" if old == total else "updated"),
+        })
+    return plan
+
+
+def apply_plan(plan):
+    """
+    Ghi các dòng created/updated của plan qua upsert_sheets (1 transaction, cùng đường ghi
+    với form chấm). Phiếu giấy không ghi thời gian -> giữ thời gian cũ. -> số phiếu đã ghi.
+    """
+    todo = [r for r in plan.rows if r["status"] != "unchanged"]
+    if not todo:
+        return 0
+
+    tests = BaiThi.objects.select_related("vongThi").in_bulk({r["bt_id"] for r in todo})
+    upsert_sheets(plan.ct, plan.judge, [
+        (ThiSinh(pk=r["maNV"]), tests[r["bt_id"]], r["new"], None) for r in todo
+    ])
+    return len(todo)
@@ -0,0 +1,174 @@
+# core/special_round.py
+"""
+Vòng đặc biệt (chia cặp): ghi log raw + giữ tổng hợp chạy theo cặp.
+
+- record_log(): ghi / thay SpecialRoundScoreLog của 1 giám khảo và cộng phần chênh lệch
+  vào SpecialRoundPairState trong cùng transaction (khoá dòng state) -> kết quả 100/0
+  của cặp đọc từ 1 dòng.
+- apply_score(): sau khi phiếu của 1 thí sinh được lưu -> ghi log, đủ 2 bên thì đặt 0
+  cho bên thua. Đường ghi phiếu gọi qua apply_scores_after_commit (chạy sau commit,
+  mỗi lần chấm 1 transaction ngắn riêng; lỡ hỏng giữa chừng -> recompute_round sửa).
+- recompute_round(): dựng lại state của mọi cặp trong vòng từ 1 câu GROUP BY trên log,
+  rồi đặt 0 cho bên thua của mọi cặp đã đủ 2 bên (sửa dữ liệu lệch / sau khi xoá log).
+"""
+from django.db import transaction
+from django.db.models import Count, Min, Q, Sum
+
+from .invalidation import bus, contest_key
+from .models import (
+    PhieuChamDiem,
+    SpecialRoundPairMember,
+    SpecialRoundPairState,
+    SpecialRoundScoreLog,
+)
+from .standings import schedule_refresh_many
+
+
+def _locked_state(pair, bt):
+    state, created = SpecialRoundPairState.objects.get_or_create(pair=pair, baiThi=bt)
+    if created:
+        for m in SpecialRoundPairMember.objects.filter(pair=pair, slot__in=(1, 2)):
+            setattr(state, f"thiSinh{m.slot}_id", m.thiSinh_id)
+        return state
+    return SpecialRoundPairState.objects.select_for_update().get(pk=state.pk)
+
+
+def record_log(ct, vt, bt, pair_member, judge, raw_score, raw_time):
+    """Ghi log 1 lần chấm và cập nhật state của cặp. -> SpecialRoundPairState."""
+    n = 1 if pair_member.slot == 1 else 2
+    with transaction.atomic():
+        state = _locked_state(pair_member.pair, bt)
+
+        log = SpecialRoundScoreLog.objects.filter(
+            cuocThi=ct, vongThi=vt, baiThi=bt, pair_member=pair_member, giamKhao=judge,
+        ).first()
+        old_score, old_time = (log.raw_score, log.raw_time) if log else (None, None)
+        if log:
+            log.raw_score, log.raw_time = raw_score, raw_time
+            log.save(update_fields=["raw_score", "raw_time"])
+        else:
+            SpecialRoundScoreLog.objects.create(
+                cuocThi=ct, vongThi=vt, baiThi=bt, pair_member=pair_member, giamKhao=judge,
+                raw_score=raw_score, raw_time=raw_time,
+            )
+
+        total = getattr(state, f"score_sum{n}") + float(raw_score) - float(old_score or 0)
+        count = getattr(state, f"score_count{n}") + (0 if log else 1)
+        best = getattr(state, f"best_time{n}")
+        if log and old_time is not None and old_time == best and (raw_time is None or raw_time > old_time):
+            # thời gian tốt nhất vừa bị thay bằng thời gian tệ hơn -> đọc lại min của bên này
+            best = SpecialRoundScoreLog.objects.filter(
+                baiThi=bt, pair_member=pair_member,
+            ).aggregate(m=Min("raw_time"))["m"]
+        elif raw_time is not None:
+            best = raw_time if best is None else min(best, raw_time)
+
+        setattr(state, f"score_sum{n}", total)
+        setattr(state, f"score_count{n}", count)
+        setattr(state, f"best_time{n}", best)
+        state.save()
+    return state
+
+
+def zero_losers(ct_id, vt_id, outcomes):
+    """
+    outcomes: {baiThi_id: {thiSinh_id: 100 | 0}} -> phiếu của bên thua = 0 (1 câu UPDATE).
+    Bên thắng giữ nguyên điểm raw đã chấm.
+    """
+    cond = Q()
+    touched = set()
+    for bt_id, result in outcomes.items():
+        losers = [ts for ts, v in result.items() if v != 100]
+        if losers:
+            cond |= Q(baiThi_id=bt_id, thiSinh_id__in=losers)
+            touched.update(losers)
+    if not touched:
+        return 0
+
+    with transaction.atomic():
+        n = PhieuChamDiem.objects.filter(cond, cuocThi_id=ct_id, vongThi_id=vt_id).update(diem=0)
+        # update() không bắn signal -> tự cập nhật bảng xếp hạng / cache
+        schedule_refresh_many(ct_id, touched)
+        bus.bump(contest_key(ct_id))
+    return n
+
+
+def apply_score(bt, thi_sinh, judge, raw_total, raw_time):
+    """
+    Vòng đặc biệt (pair), gọi sau khi phiếu của thí sinh đã lưu:
+    - Chỉ chạy nếu vongThi.is_special_bonus_round == True.
+    - Ghi log (SpecialRoundScoreLog) mỗi lần chấm, cộng dồn vào SpecialRoundPairState.
+    - Đủ dữ liệu cả 2 bên: Winner GIỮ NGUYÊN điểm raw; Loser = 0 cho mọi phiếu của bài đó.
+    """
+    vt = getattr(bt, "vongThi", None)
+    if not vt or not getattr(vt, "is_special_bonus_round", False):
+        return
+
+    ct = getattr(vt, "cuocThi", None)
+    if not ct or not thi_sinh:
+        return
+
+    pair_member = SpecialRoundPairMember.objects.filter(
+        pair__vongThi=vt, pair__cuocThi=ct, thiSinh=thi_sinh
+    ).select_related("pair").first()
+    if not pair_member:
+        return
+
+    with transaction.atomic():
+        state = record_log(ct, vt, bt, pair_member, judge, raw_total, raw_time)
+        # CHỐT: chưa đủ dữ liệu để kết luận thì KHÔNG set 0 cho ai cả
+        result_map = state.result()
+        if len(result_map) == 2:
+            zero_losers(ct.id, vt.id, {bt.id: result_map})
+
+
+def apply_scores_after_commit(entries):
+    """entries: [(bt, thi_sinh, judge, raw_total, raw_time)] -> apply_score từng mục sau commit."""
+    entries = list(entries)
+    if not entries:
+        return
+
+    def run():
+        for entry in entries:
+            apply_score(*entry)
+
+    transaction.on_commit(run, robust=True)
+
+
+def recompute_round(vt):
+    """Dựng lại state mọi cặp của vòng (1 câu GROUP BY trên log) rồi áp kết quả. -> số cặp·bài đã có kết quả."""
+    members = {
+        (m["pair_id"], m["slot"]): m["thiSinh_id"]
+        for m in SpecialRoundPairMember.objects.filter(pair__vongThi=vt, slot__in=(1, 2))
+        .values("pair_id", "slot", "thiSinh_id")
+    }
+
+    states = {}
+    grouped = (
+        SpecialRoundScoreLog.objects.filter(vongThi=vt, pair_member__slot__in=(1, 2))
+        .values("pair_member__pair_id", "pair_member__slot", "baiThi_id")
+        .annotate(total=Sum("raw_score"), cnt=Count("pk"), best=Min("raw_time"))
+    )
+    for g in grouped:
+        pair_id, slot, bt_id = g["pair_member__pair_id"], g["pair_member__slot"], g["baiThi_id"]
+        state = states.get((pair_id, bt_id))
+        if state is None:
+            state = states[(pair_id, bt_id)] = SpecialRoundPairState(
+                pair_id=pair_id, baiThi_id=bt_id,
+                thiSinh1_id=members.get((pair_id, 1)), thiSinh2_id=members.get((pair_id, 2)),
+            )
+        setattr(state, f"score_sum{slot}", float(g["total"] or 0))
+        setattr(state, f"score_count{slot}", g["cnt"])
+        setattr(state, f"best_time{slot}", g["best"])
+
+    outcomes = {}
+    for (_, bt_id), state in states.items():
+        result = state.result()
+        if result:
+            outcomes.setdefault(bt_id, {}).update(result)
+
+    with transaction.atomic():
+        SpecialRoundPairState.objects.filter(pair__vongThi=vt).delete()
+        SpecialRoundPairState.objects.bulk_create(states.values(), batch_size=500)
+        zero_losers(vt.cuocThi_id, vt.id, outcomes)
+    return sum(len(r) // 2 for r in outcomes.values())
@@ -0,0 +1,350 @@
+# core/standings.py
+"""
+Bảng xếp hạng vật lý hoá (read model) cho từng cuộc thi.
+
+Mỗi dòng ContestStanding = 1 thí sinh trong 1 cuộc thi, lưu sẵn:
+  - per_test  : {"<baiThi_id>": điểm trung bình các phiếu}
+  - total     : tổng điểm trung bình theo bài
+  - total_time: tổng thời gian trung bình của các bài TIME (None nếu chưa có)
+  - done      : số bài thi đã có phiếu
+
+Dòng được tính lại cho ĐÚNG 1 thí sinh mỗi khi PhieuChamDiem của thí sinh đó
+thay đổi (signal trong models.py), nên trang xếp hạng chỉ cần 1 câu đọc có index.
+"""
+import base64
+import json
+import logging
+import threading
+
+from django.db import transaction
+from django.db.models import Avg, Count, F, Max, Q, Value, Window
+from django.db.models.functions import Rank, RowNumber, StrIndex, Substr
+
+from .events import publish_contest_event
+from .models import ContestStanding, ContestStandingCounter, PhieuChamDiem, ThiSinhCuocThi
+
+logger = logging.getLogger(__name__)
+
+
+def _is_time_method(value) -> bool:
+    # giống _score_type(...) == "TIME" ở views_ranking
+    return str(value or "").strip().upper() in {"TIME", "2"}
+
+
+def _summarize(rows):
+    """
+    rows: các dict {baiThi_id, method, avg, t_avg} của 1 thí sinh.
+    Trả về dict field cho ContestStanding.
+    """
+    per_test = {}
+    total = 0.0
+    total_time = None
+    for r in rows:
+        avg = float(r["avg"] or 0.0)
+        per_test[str(r["baiThi_id"])] = avg
+        total += avg
+        if _is_time_method(r["method"]) and r["t_avg"] is not None:
+            total_time = (total_time or 0.0) + float(r["t_avg"])
+    return {
+        "per_test": per_test,
+        "total": total,
+        "total_time": total_time,
+        "done": len(per_test),
+    }
+
+
+def _grouped_scores(qs):
+    # TB điểm / TB thời gian theo (thí sinh, bài thi), kèm phương thức chấm của bài
+    return (
+        qs.values("thiSinh_id", "baiThi_id", method=F("baiThi__phuongThucCham"))
+        .annotate(avg=Avg("diem"), t_avg=Avg("thoiGian"))
+    )
+
+
+def refresh_standing(ct_id, ts_id):
+    """
+    Tính lại dòng xếp hạng của 1 thí sinh trong 1 cuộc thi.
+    - Có phiếu hoặc là thành viên cuộc thi -> upsert.
+    - Không còn gì -> xoá dòng.
+    """
+    if not ct_id or not ts_id:
+        return None
+
+    rows = list(_grouped_scores(
+        PhieuChamDiem.objects.filter(cuocThi_id=ct_id, thiSinh_id=ts_id)
+    ))
+
+    if not rows and not ThiSinhCuocThi.objects.filter(cuocThi_id=ct_id, thiSinh_id=ts_id).exists():
+        deleted, _ = ContestStanding.objects.filter(cuocThi_id=ct_id, thiSinh_id=ts_id).delete()
+        if deleted:
+            publish_contest_event(ct_id, "score", {"maNV": ts_id, "removed": True})
+        return None
+
+    with transaction.atomic():
+        obj, _ = ContestStanding.objects.update_or_create(
+            cuocThi_id=ct_id,
+            thiSinh_id=ts_id,
+            defaults=_summarize(rows),
+        )
+        # cấp version cuối cùng: dòng đếm chỉ bị khoá từ đây tới commit
+        obj.version = _next_version(ct_id)
+        ContestStanding.objects.filter(pk=obj.pk).update(version=obj.version)
+    version = obj.version
+    publish_contest_event(ct_id, "score", {"maNV": ts_id, "version": version})
+    return obj
+
+
+def _next_version(ct_id) -> int:
+    """
+    Cấp version kế tiếp cho cuộc thi: UPDATE ... SET version = version + 1 trên dòng đếm
+    rồi đọc lại trong cùng transaction. Gọi ở CUỐI transaction: khoá dòng đếm giữ tới
+    commit nên version vẫn commit theo thứ tự tăng dần (client dùng since < version),
+    còn phần đọc phiếu / tính toán của các lượt ghi khác chạy song song.
+    """
+    counter = ContestStandingCounter.objects.filter(pk=ct_id)
+    if not counter.update(version=F("version") + 1):
+        # cuộc thi chưa có dòng đếm: tạo (nối tiếp version đang có), 2 request cùng tạo thì 1 bản thắng
+        cur = ContestStanding.objects.filter(cuocThi_id=ct_id).aggregate(v=Max("version"))["v"]
+        ContestStandingCounter.objects.bulk_create(
+            [ContestStandingCounter(cuocThi_id=ct_id, version=cur or 0)], ignore_conflicts=True
+        )
+        counter.update(version=F("version") + 1)
+    return counter.values_list("version", flat=True).get()
+
+
+def contest_version(ct) -> int:
+    """Version lớn nhất hiện có của bảng xếp hạng 1 cuộc thi (0 nếu chưa có)."""
+    return standings_signature(ct)[0]
+
+
+def standings_signature(ct):
+    """
+    (version lớn nhất, số dòng) — 1 câu aggregate. Xoá dòng không tăng version
+    nên dùng cả số dòng khi làm khoá cache cho dữ liệu xếp hạng.
+    """
+    agg = ContestStanding.objects.filter(cuocThi=ct).aggregate(v=Max("version"), n=Count("pk"))
+    return agg["v"] or 0, agg["n"] or 0
+
+
+def schedule_refresh(ct_id, ts_id):
+    """
+    Tính lại sau khi transaction hiện tại commit (chạy ngay nếu không ở trong atomic).
+    robust: phiếu đã commit thì lỗi khi tính lại chỉ ghi log, không làm hỏng request
+    (rebuild_standings sửa lại sau).
+    """
+    schedule_refresh_many(ct_id, [ts_id])
+
+
+# Từ ngưỡng này, dựng lại cả cuộc thi (vài câu) rẻ hơn tính lại từng thí sinh
+REFRESH_MANY_REBUILD_AT = 200
+
+class _RefreshBatch:
+    """Thí sinh chờ tính lại của 1 transaction, theo cuộc thi; tính 1 lần sau commit."""
+
+    def __init__(self, hooks):
+        self.hooks = hooks  # danh sách on_commit của transaction đang mở lúc tạo lô
+        self.ids = {}  # {ct_id: {thiSinh_id}}
+        self.done = False
+
+    def flush(self):
+        if self.done:
+            return
+        self.done = True
+        for ct_id, ts_ids in self.ids.items():
+            try:
+                if len(ts_ids) >= REFRESH_MANY_REBUILD_AT:
+                    rebuild_contest_standings(ct_id)
+                else:
+                    for ts_id in sorted(ts_ids):
+                        refresh_standing(ct_id, ts_id)
+            except Exception:
+                # 1 cuộc thi lỗi không chặn các cuộc thi khác
+                logger.exception("Tính lại bảng xếp hạng cuộc thi %s thất bại", ct_id)
+
+
+_batch = threading.local()  # lô đang gom của thread hiện tại
+
+
+def schedule_refresh_many(ct_id, ts_ids):
+    """
+    Như schedule_refresh cho nhiều thí sinh. Mọi signal (phiếu, thành viên) trong 1
+    transaction dồn vào 1 lô theo cuộc thi, tính lại 1 lần sau commit -> import 5k dòng
+    = 1 lần dựng lại cả cuộc thi, không 5k lần tính lại.
+    """
+    ts_ids = {ts_id for ts_id in ts_ids if ts_id}
+    if not ct_id or not ts_ids:
+        return
+    conn = transaction.get_connection()
+    batch = getattr(_batch, "current", None)
+    # Commit / rollback thay danh sách on_commit -> lô của transaction trước (đã chạy
+    # hoặc bị bỏ cùng rollback) không được dùng lại, id của nó không lọt sang lô mới
+    if batch is None or batch.done or not conn.in_atomic_block or batch.hooks is not conn.run_on_commit:
+        batch = _batch.current = _RefreshBatch(conn.run_on_commit)
+    batch.ids.setdefault(ct_id, set()).update(ts_ids)
+    # như bus.bump: đăng ký mỗi lần, callback đầu tiên tính cả lô, các callback sau bỏ qua
+    transaction.on_commit(batch.flush, robust=True)
+
+
+def rebuild_contest_standings(ct):
+    """
+    Dựng lại toàn bộ bảng xếp hạng của 1 cuộc thi (backfill / sửa dữ liệu lệch).
+    1 câu GROUP BY cho toàn bộ phiếu + 1 câu lấy thành viên.
+    """
+    ct_id = getattr(ct, "pk", ct)
+
+    by_ts = {}
+    for r in _grouped_scores(PhieuChamDiem.objects.filter(cuocThi_id=ct_id)):
+        by_ts.setdefault(r["thiSinh_id"], []).append(r)
+
+    member_ids = set(
+        ThiSinhCuocThi.objects.filter(cuocThi_id=ct_id).values_list("thiSinh_id", flat=True)
+    )
+
+    objs = [
+        ContestStanding(cuocThi_id=ct_id, thiSinh_id=ts_id, **_summarize(by_ts.get(ts_id, [])))
+        for ts_id in (member_ids | set(by_ts))
+    ]
+    with transaction.atomic():
+        ContestStanding.objects.filter(cuocThi_id=ct_id).delete()
+        ContestStanding.objects.bulk_create(objs, batch_size=500)
+        version = _next_version(ct_id)
+        ContestStanding.objects.filter(cuocThi_id=ct_id).update(version=version)
+    publish_contest_event(ct_id, "score", {"version": version, "rebuild": True})
+    return len(objs)
+
+
+# Thứ tự xếp hạng: điểm ↓, tổng thời gian ↑ (None xuống cuối)
+RANK_ORDER = [F("total").desc(), F("total_time").asc(nulls_last=True)]
+
+
+def ordered_standings(ct):
+    """Queryset xếp hạng: điểm ↓, tổng thời gian ↑ (None xuống cuối), mã NV ↑."""
+    return (
+        ContestStanding.objects
+        .filter(cuocThi=ct)
+        .select_related("thiSinh")
+        .order_by(*RANK_ORDER, "thiSinh_id")
+    )
+
+
+def ranked_standings(ct, name=None, unit=None):
+    """
+    Bảng xếp hạng có hạng tính trong SQL (PostgreSQL & SQLite ≥ 3.25):
+      - rank: RANK() — cùng điểm và cùng thời gian thì cùng hạng
+      - pos : ROW_NUMBER() thêm mã NV làm khoá phụ -> vị trí duy nhất
+    name (đã fold_text) / unit: lọc theo phần họ tên của search_key / đơn vị, áp SAU khi xếp
+    hạng -> hạng vẫn là hạng toàn cuộc thi, chỉ các dòng khớp được đọc lên.
+    """
+    qs = (
+        ContestStanding.objects
+        .filter(cuocThi=ct)
+        .select_related("thiSinh")
+        .annotate(
+            rank=Window(Rank(), order_by=RANK_ORDER),
+            pos=Window(RowNumber(), order_by=RANK_ORDER + [F("thiSinh_id").asc()]),
+        )
+    )
+    cond = Q()
+    if name:
+        # search_key = "<mã NV> <họ tên>" -> chỉ so phần họ tên
+        key = F("thiSinh__search_key")
+        qs = qs.annotate(name_key=Substr(key, StrIndex(key, Value(" ")) + 1))
+        cond &= Q(name_key__contains=name)
+    if unit:
+        cond &= Q(thiSinh__donVi__icontains=unit)
+    if cond:
+        # Điều kiện OR có vế theo cột window -> Django đặt CẢ điều kiện ở truy vấn ngoài
+        # (sau RANK()); AND thường sẽ lọc trong WHERE, trước khi xếp hạng
+        qs = qs.filter((Q(rank__gte=1) & cond) | Q(rank__lt=1))
+    return qs.order_by("pos")
+
+
+def encode_cursor(st) -> str:
+    """Cursor trang = khoá sắp xếp của dòng cuối (điểm, tổng thời gian, mã NV)."""
+    raw = json.dumps([st.total, st.total_time, st.thiSinh_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """-> (total, total_time, thiSinh_id) | None (rỗng / hỏng -> đọc từ đầu)."""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        total, total_time, ts_id = json.loads(raw)
+        return float(total), None if total_time is None else float(total_time), str(ts_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def _after_q(total, total_time, ts_id):
+    """Các dòng đứng SAU khoá (total, total_time, ts_id) theo RANK_ORDER + mã NV."""
+    if total_time is None:
+        same_total = Q(total_time__isnull=True, thiSinh_id__gt=ts_id)
+    else:
+        same_total = (
+            Q(total_time__gt=total_time)
+            | Q(total_time__isnull=True)
+            | Q(total_time=total_time, thiSinh_id__gt=ts_id)
+        )
+    return Q(total__lt=total) | (Q(total=total) & same_total)
+
+
+def _tie_q(total, total_time):
+    """Cùng điểm và cùng tổng thời gian (cùng hạng)."""
+    if total_time is None:
+        return Q(total=total, total_time__isnull=True)
+    return Q(total=total, total_time=total_time)
+
+
+def _ahead_q(total, total_time):
+    """Các dòng xếp hạng TRÊN hẳn (total, total_time) — số dòng này + 1 = RANK()."""
+    better_time = Q(total_time__isnull=False) if total_time is None else Q(total_time__lt=total_time)
+    return Q(total__gt=total) | (Q(total=total) & better_time)
+
+
+def standings_page(ct, after=None, limit=50):
+    """
+    1 trang xếp hạng theo keyset trên (total ↓, total_time ↑, mã NV ↑) — đi thẳng trên
+    standing_rank_idx, không đếm lại các dòng phía trước như OFFSET / lọc ROW_NUMBER().
+    after: cursor của trang trước (encode_cursor), None = trang đầu.
+    Hạng vẫn là hạng toàn cuộc thi: 1 câu aggregate cho dòng đầu trang, các dòng sau
+    suy ra từ dòng trước. Trả về (rows kèm .rank / .pos, cursor trang sau | None).
+    """
+    qs = ordered_standings(ct)
+    key = decode_cursor(after)
+    if key:
+        qs = qs.filter(_after_q(*key))
+    rows = list(qs[: limit + 1])
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1])
+    if not rows:
+        return rows, None
+
+    first = rows[0]
+    agg = ContestStanding.objects.filter(cuocThi=ct).aggregate(
+        ahead=Count("pk", filter=_ahead_q(first.total, first.total_time)),
+        tied_before=Count(
+            "pk", filter=_tie_q(first.total, first.total_time) & Q(thiSinh_id__lt=first.thiSinh_id)
+        ),
+    )
+    start = agg["ahead"] + agg["tied_before"] + 1
+    rank = agg["ahead"] + 1
+    prev = None
+    for i, st in enumerate(rows):
+        st.pos = start + i
+        if prev is not None and (st.total, st.total_time) != (prev.total, prev.total_time):
+            rank = st.pos
+        st.rank = rank
+        prev = st
+    return rows, next_cursor
+
+
+def contest_has_data(ct) -> bool:
+    """Cuộc thi có thí sinh hoặc có phiếu chấm (để biết có cần backfill không)."""
+    return (
+        ThiSinhCuocThi.objects.filter(cuocThi=ct).exists()
+        or PhieuChamDiem.objects.filter(cuocThi=ct).exists()
+    )
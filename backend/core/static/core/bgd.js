@@ -165,39 +165,63 @@ document.addEventListener("DOMContentLoaded", function () {
         }, 3000);
     }
 
-    // --- Lưu điểm cho từng thí sinh ---
+    // --- Lưu điểm: gửi 1 lần mọi thí sinh đã đổi điểm (thí sinh của nút luôn được gửi) ---
     const saveButtons = document.querySelectorAll('button[data-role="save-score"]');
 
+    function clampScore(input) {
+        let val = parseFloat(input.value);
+        if (isNaN(val)) val = 0;
+        if (val < 0) val = 0;
+        if (val > 100) val = 100;
+        input.value = val;
+        return val;
+    }
 
+    function scoreInputOf(index) {
+        return document.querySelector(
+            'input[data-role="score-input"][data-ts-index="' + index + '"]'
+        );
+    }
+
+    // Điểm đã lưu trên server của từng ô (ban đầu = điểm render sẵn)
     saveButtons.forEach(function (btn) {
-        btn.addEventListener("click", function () {
-            const tsId = btn.getAttribute("data-ts-id");
-            const index = btn.getAttribute("data-ts-index");
-            if (!tsId) return;
+        const input = scoreInputOf(btn.getAttribute("data-ts-index"));
+        if (input) input.dataset.saved = input.value;
+    });
 
-            const input = document.querySelector(
-                'input[data-role="score-input"][data-ts-index="' + index + '"]'
-            );
-            if (!input) return;
+    function pendingScores(btn) {
+        const out = [];
+        saveButtons.forEach(function (other) {
+            const tsId = other.getAttribute("data-ts-id");
+            const input = scoreInputOf(other.getAttribute("data-ts-index"));
+            if (!tsId || !input) return;
+            const val = clampScore(input);
+            if (other === btn || String(val) !== input.dataset.saved) {
+                out.push({ thiSinh_id: tsId, score: val, input: input });
+            }
+        });
+        return out;
+    }
 
-            let val = parseFloat(input.value);
-            if (isNaN(val)) val = 0;
-            if (val < 0) val = 0;
-            if (val > 100) val = 100;
-            input.value = val;
+    saveButtons.forEach(function (btn) {
+        btn.addEventListener("click", function () {
+            if (!btn.getAttribute("data-ts-id")) return;
+            const items = pendingScores(btn);
+            if (!items.length) return;
 
             btn.disabled = true;
             const oldText = btn.textContent;
             btn.textContent = "Đang lưu...";
 
-            fetch("/bgd/api/save-score/", {
+            fetch("/bgd/api/save-scores/", {
                 method: "POST",
                 headers: {
                     "Content-Type": "application/json",
                 },
                 body: JSON.stringify({
-                    thiSinh_id: tsId,
-                    score: val,
+                    scores: items.map(function (it) {
+                        return { thiSinh_id: it.thiSinh_id, score: it.score };
+                    }),
                 }),
             })
                 .then(function (res) {
@@ -210,6 +234,9 @@ document.addEventListener("DOMContentLoaded", function () {
                     });
                 })
                 .then(function () {
+                    items.forEach(function (it) {
+                        it.input.dataset.saved = String(it.score);
+                    });
                     btn.textContent = "Đã lưu";
                     showScoreToast();
                     setTimeout(function () {
@@ -227,4 +254,3 @@ document.addEventListener("DOMContentLoaded", function () {
         });
     });
 });
-
@@ -98,7 +98,8 @@
 (function(){
   async function fetchRankingState(){
     try{
-      const r = await fetch("/management/ranking-state", {credentials:"same-origin"});
+      // no-cache: trình duyệt gửi If-None-Match, server trả 304 nếu trạng thái không đổi
+      const r = await fetch("/management/ranking-state", {credentials:"same-origin", cache:"no-cache"});
       const j = await r.json();
       return !!j.enabled;
     }catch(e){ return true; }
@@ -244,6 +244,26 @@ document.addEventListener('DOMContentLoaded', function () {
     }
 
     inputJSON.value = JSON.stringify(rows);
+
+    // Xem trước số phiếu / thứ hạng bị chấm lại theo thang mới rồi mới lưu
+    e.preventDefault();
+    const fd = new FormData(form);
+    fd.set('action', 'time_rules_preview');
+    fetch(window.location.pathname, {
+      method: 'POST',
+      headers: { 'X-CSRFToken': getCsrfToken(form) },
+      body: fd
+    })
+      .then((res) => res.json())
+      .then((data) => {
+        if (data.ok && data.changed > 0) {
+          const ask = `Thang mới sẽ chấm lại ${data.changed}/${data.rows} phiếu, `
+            + `${data.ranks_changed} thí sinh đổi hạng. Tiếp tục lưu?`;
+          if (!confirm(ask)) return;
+        }
+        form.submit();  // submit() không bắn lại sự kiện submit
+      })
+      .catch(() => form.submit());
   });
 
   // ===== Modal import TEMPLATE =====
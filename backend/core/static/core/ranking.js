@@ -3,8 +3,10 @@
   if(!table) return;
 
   const tbody = document.getElementById('rankBody');
-  const rows  = Array.from(tbody ? tbody.querySelectorAll('tr') : []);
+  let rows  = Array.from(tbody ? tbody.querySelectorAll('tr') : []);
   if(rows.length === 0) return;
+  // Mẫu để tạo dòng mới khi API trả về thí sinh chưa có trên bảng
+  const rowTemplate = rows[0].cloneNode(true);
 
   // Có đang lọc theo Tên/Đơn vị hay không
   const IS_FILTERED = table.dataset.filtered === '1';
@@ -13,7 +15,14 @@
   const pageSize     = IS_FILTERED ? rows.length : parseInt(table.dataset.pageSize || '10', 10);
   const intervalMs   = parseInt(table.dataset.intervalMs || '3000', 10);
   const colGroupSize = IS_FILTERED ? 9999 : parseInt(table.dataset.colGroupSize || '5', 10);
-  // === Auto-reload khi chạy hết danh sách và quay lại từ đầu ===
+  // === Auto-cập nhật khi chạy hết danh sách và quay lại từ đầu ===
+  // Gọi /ranking/api/ lấy các dòng đổi kể từ version đang giữ rồi vá DOM tại chỗ;
+  // chỉ reload cả trang khi cấu trúc cột đổi / ranking bị tắt / API lỗi.
+  const API_URL = table.dataset.apiUrl || '';
+  const CT_ID   = table.dataset.ct || '';
+  const SCHEMA  = table.dataset.schema || '';
+  let version   = parseInt(table.dataset.version || '0', 10) || 0;
+  let _syncing  = false;
   const RELOAD_ON_LOOP = !IS_FILTERED;     // nếu đang lọc thì tắt reload
   const RELOAD_DELAY_MS = 600;             // chờ 0.6s cho mượt
   let _didLoopReload = false;              // chặn reload nhiều lần trong cùng vòng
@@ -159,7 +168,7 @@
   }
   const totalColGroups = colGroups.length;
 
-  const totalRowPages  = Math.max(1, Math.ceil(rows.length / pageSize));
+  let totalRowPages  = Math.max(1, Math.ceil(rows.length / pageSize));
   let rowPage = 0;
   let colGroup = 0;
 
@@ -269,7 +278,7 @@
       (prevRow !== 0 || prevCol !== 0)
     ) {
       _didLoopReload = true;
-      setTimeout(() => { location.reload(); }, RELOAD_DELAY_MS);
+      setTimeout(syncFromApi, RELOAD_DELAY_MS);
       return;
     }
 
@@ -279,7 +288,7 @@
       _noMoveTicks += 1;
       if (_noMoveTicks >= NO_MOVE_RELOAD_TICKS) {
         _didLoopReload = true;
-        setTimeout(() => { location.reload(); }, RELOAD_DELAY_MS);
+        setTimeout(syncFromApi, RELOAD_DELAY_MS);
       }
     } else {
       // Hễ có di chuyển thì reset bộ đếm
@@ -287,6 +296,121 @@
     }
   }
 
+  // ===== Cập nhật tại chỗ từ /ranking/api/ =====
+  function fmtScore(v){
+    // giống |floatformat:0 ở template
+    const n = Number(v);
+    return String(Math.round(isFinite(n) ? n : 0));
+  }
+
+  function fillRow(tr, r){
+    const c = tr.cells;
+    if (c[1]) c[1].textContent = r.maNV;
+    if (c[2]) c[2].textContent = r.hoTen || '';
+    if (c[3]) c[3].textContent = r.donVi || '';
+    if (c[doneBodyIndex]) c[doneBodyIndex].textContent = `${r.done}/${r.total_tests}`;
+
+    groupsMeta.forEach((meta, gi) => {
+      const g = (r.groups || [])[gi] || { scores: [], total: 0 };
+      meta.bodyTestIndexes.forEach((bi, k) => {
+        if (c[bi]) c[bi].textContent = fmtScore(g.scores[k]);
+      });
+      if (c[meta.bodyTotalIndex]) c[meta.bodyTotalIndex].textContent = fmtScore(g.total);
+    });
+
+    if (c[totalBodyIndex]) c[totalBodyIndex].textContent = fmtScore(r.total);
+  }
+
+  function findRow(ma){
+    return rows.find(tr => tr.dataset.ma === String(ma)) || null;
+  }
+
+  function patchRows(list){
+    list.forEach(r => {
+      let tr = findRow(r.maNV);
+      if (!tr) {
+        tr = rowTemplate.cloneNode(true);
+        tr.dataset.ma = r.maNV;
+        tbody.appendChild(tr);
+        rows.push(tr);
+      }
+      fillRow(tr, r);
+    });
+  }
+
+  function applyOrder(order, ranks){
+    const byMa = new Map(rows.map(tr => [tr.dataset.ma, tr]));
+    const next = [];
+    const nextRanks = [];
+    order.forEach((ma, i) => {
+      const tr = byMa.get(String(ma));
+      if (!tr) return;
+      next.push(tr);
+      // hạng do server tính (RANK(): đồng điểm & đồng thời gian -> cùng hạng)
+      nextRanks.push((ranks && ranks[i]) || (i + 1));
+      byMa.delete(String(ma));
+    });
+    // Thí sinh không còn trong bảng xếp hạng
+    byMa.forEach(tr => tr.remove());
+
+    next.forEach((tr, i) => {
+      const rank = nextRanks[i];
+      tbody.appendChild(tr);   // appendChild = di chuyển node, giữ nguyên ô
+      if (tr.cells[0]) tr.cells[0].textContent = rank;
+      tr.classList.remove('rank-1', 'rank-2', 'rank-3', 'top--1', 'top--2', 'top--3');
+      if (rank <= 3) tr.classList.add(`rank-${rank}`, `top--${rank}`);
+    });
+    rows = next;
+  }
+
+  function syncFromApi(){
+    if (!API_URL || !CT_ID) { location.reload(); return; }
+    if (_syncing) { _pending = true; return; }   // event đến trong lúc fetch -> gọi lại sau
+    _syncing = true;
+    _pending = false;
+
+    const url = `${API_URL}?ct=${encodeURIComponent(CT_ID)}&since=${version}&n=${rows.length}`;
+    fetch(url, { cache: 'no-store', headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+      .then(res => { if (!res.ok) throw new Error('HTTP ' + res.status); return res.json(); })
+      .then(data => {
+        // Ranking bị tắt / cấu trúc cột đổi -> để server render lại toàn trang
+        if (!data || !data.ok || data.enabled === false || data.schema !== SCHEMA) {
+          location.reload();
+          return;
+        }
+        if ((data.rows || []).length) patchRows(data.rows);
+        if (Array.isArray(data.order)) applyOrder(data.order, data.ranks);
+        version = data.version || version;
+
+        // Dòng mới tạo từ mẫu: áp lại trạng thái gộp vòng
+        groupsMeta.forEach(meta => setGroupCollapsed(meta, meta.collapsed));
+
+        totalRowPages = Math.max(1, Math.ceil(rows.length / pageSize));
+        if (rowPage >= totalRowPages) rowPage = 0;
+        showRowPage();
+      })
+      .catch(() => { location.reload(); })
+      .finally(() => {
+        _syncing = false;
+        _didLoopReload = false;   // cho phép cập nhật ở vòng lặp kế tiếp
+        _noMoveTicks = 0;
+        if (_pending) syncFromApi();
+      });
+  }
+
+  // ===== Nghe /events/<ct>/ (SSE): có điểm mới thì đồng bộ ngay =====
+  // SSE chỉ là tín hiệu gọi sớm: hub nằm trong từng tiến trình, phiếu ghi ở worker khác
+  // không tới stream này -> vòng quay vẫn gọi ?since= như cũ (WSGI trả 204: chỉ còn vòng quay).
+  let _pending = false;
+  let _sseTimer = null;
+  if (window.EventSource && CT_ID && !IS_FILTERED) {
+    const es = new EventSource(`/events/${encodeURIComponent(CT_ID)}/`);
+    es.addEventListener('score', () => {
+      clearTimeout(_sseTimer);   // gom nhiều phiếu chấm liên tiếp thành 1 lần gọi API
+      _sseTimer = setTimeout(syncFromApi, 1000);
+    });
+  }
+
   // Timer
   let timer = null;
   function startTimer(){ stopTimer(); timer = setInterval(advance, intervalMs); }
@@ -59,6 +59,139 @@ function confirmDialog(message, title = 'Xác nhận') {
   });
 }
 
+// === Hàng đợi offline: lưu tạm điểm khi mất mạng, gửi lại theo lô qua /score/bulk/ ===
+// Mỗi bài có key idempotency sinh ở trình duyệt TRƯỚC lần gửi đầu (ScoreQueue.assignKeys)
+// -> score_view và /score/bulk/ bỏ qua mục đã áp dụng, nên lần gửi đầu đã ghi mà mất
+// phản hồi, rồi gửi lại nhiều lần (reconnect, nhiều tab) vẫn chỉ ghi 1 lần.
+const ScoreQueue = (() => {
+  const STORAGE_KEY = 'score:queue:v1';
+  const BATCH_SIZE = 100;
+  const RETRY_MS = 15000;
+  let flushing = false;
+
+  function newKey() {
+    if (window.crypto?.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2, 12);
+  }
+
+  function load() {
+    try { return JSON.parse(localStorage.getItem(STORAGE_KEY)) || []; }
+    catch (e) { return []; }
+  }
+
+  function store(items) {
+    if (items.length) localStorage.setItem(STORAGE_KEY, JSON.stringify(items));
+    else localStorage.removeItem(STORAGE_KEY);
+  }
+
+  // payload của nút Lưu (score_view) -> các mục cho /score/bulk/
+  function toEntries(payload) {
+    const out = [];
+    Object.entries(payload.scores || {}).forEach(([id, val]) => {
+      const e = { thiSinh: payload.thiSinh, bt_id: Number(id), score: val };
+      const t = (payload.tpl_times || {})[id];
+      if (t) e.time = t;
+      out.push(e);
+    });
+    Object.entries(payload.done || {}).forEach(([id, done]) => {
+      out.push({ thiSinh: payload.thiSinh, bt_id: Number(id), done: !!done, time: (payload.times || {})[id] || '' });
+    });
+    return out;
+  }
+
+  // payload.keys = {bt_id: key} cho mọi bài trong payload (giữ key đã có)
+  function assignKeys(payload) {
+    const keys = payload.keys || (payload.keys = {});
+    [...Object.keys(payload.scores || {}), ...Object.keys(payload.done || {})].forEach(id => {
+      if (!keys[id]) keys[id] = newKey();
+    });
+    return payload;
+  }
+
+  function enqueue(payload) {
+    const items = load();
+    const keys = assignKeys(payload).keys;
+    const entries = toEntries(payload);
+    entries.forEach(entry => {
+      entry.key = keys[entry.bt_id];
+      items.push({ ct_id: payload.ct_id || null, force: !!payload.force, entry });
+    });
+    store(items);
+    return entries.length;
+  }
+
+  // Bỏ các mục đã có kết quả cuối cùng (ghi xong / bị từ chối); giữ lại mục chưa gửi được
+  function drop(keys) {
+    const gone = new Set(keys);
+    store(load().filter(it => !gone.has(it.entry.key)));
+  }
+
+  async function flush() {
+    if (flushing || !navigator.onLine) return;
+    const items = load();
+    if (!items.length) return;
+    flushing = true;
+
+    const groups = new Map();  // "ct|force" -> [item]
+    items.forEach(it => {
+      const g = `${it.ct_id || ''}|${it.force ? 1 : 0}`;
+      if (!groups.has(g)) groups.set(g, []);
+      groups.get(g).push(it);
+    });
+
+    let saved = 0;
+    const skipped = [];
+    try {
+      for (const group of groups.values()) {
+        for (let i = 0; i < group.length; i += BATCH_SIZE) {
+          const batch = group.slice(i, i + BATCH_SIZE);
+          let res;
+          try {
+            res = await fetch('/score/bulk/', {
+              method: 'POST',
+              headers: {
+                'Content-Type': 'application/json',
+                'X-Requested-With': 'XMLHttpRequest',
+                'X-CSRFToken': getCookie('csrftoken')
+              },
+              credentials: 'same-origin',
+              body: JSON.stringify({
+                ct_id: batch[0].ct_id,
+                force: batch[0].force,
+                entries: batch.map(it => it.entry),
+              }),
+            });
+          } catch (e) {
+            return;  // vẫn mất mạng -> thử lại sau
+          }
+          // Hết phiên / lỗi server: giữ nguyên để gửi lại
+          if (res.status === 401 || res.status === 403 || res.status >= 500) return;
+
+          const data = await res.json().catch(() => null);
+          (data?.results || []).forEach(r => {
+            if (r.ok) saved += 1;
+            else skipped.push(`${batch[r.i].entry.thiSinh}: ${r.message || r.status}`);
+          });
+          drop(batch.map(it => it.entry.key));
+        }
+      }
+    } finally {
+      flushing = false;
+      if (saved) showToast(`Đã gửi lại ${saved} điểm lưu tạm khi mất mạng.`);
+      if (skipped.length) showToast(`Không lưu được ${skipped.length} mục lưu tạm: ${skipped.slice(0, 3).join('; ')}`, true);
+    }
+  }
+
+  function size() { return load().length; }
+
+  window.addEventListener('online', flush);
+  document.addEventListener('visibilitychange', () => { if (!document.hidden) flush(); });
+  setInterval(flush, RETRY_MS);
+  setTimeout(flush, 0);
+
+  return { assignKeys, enqueue, flush, size };
+})();
+
 // === Debounce helper ===
 function debounce(fn, delay = 250) {
   let t;
@@ -339,9 +472,224 @@ function saveTplScores() {
 
 
 // === Page init ===
-(function initScorePage() {
-  const saveBtn = document.getElementById('saveBtn');
+// === Đổi thí sinh không tải lại trang ===
+// Cấu trúc chấm (/score/schema/<ct>/) tải 1 lần mỗi cuộc thi, trình duyệt hỏi lại bằng ETag;
+// mỗi lần đổi thí sinh chỉ lấy phiếu hiện tại (/score/sheet/, vài trăm byte) rồi dựng thẻ phiếu.
+const ScoreSheet = (() => {
+  const schemas = new Map();  // ct -> schema
+
+  function esc(v) {
+    return String(v ?? '').replace(/[&<>"']/g, c => (
+      { '&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;' }[c]
+    ));
+  }
+
+  async function loadSchema(ct, digest) {
+    const cached = schemas.get(ct);
+    if (cached && cached.digest === digest) return cached;
+    const res = await fetch(`/score/schema/${encodeURIComponent(ct)}/`, { credentials: 'same-origin' });
+    if (!res.ok) throw new Error(`schema ${res.status}`);
+    const data = await res.json();
+    schemas.set(ct, data);
+    return data;
+  }
+
+  function findTest(schema, btId) {
+    for (const r of schema.rounds || []) {
+      const t = (r.tests || []).find(x => String(x.id) === String(btId));
+      if (t) return { round: r, test: t };
+    }
+    return null;
+  }
+
+  function wheelCol(type) {
+    const items = Array.from({ length: 60 }, (_, i) => `<li class="wheel-item">${String(i).padStart(2, '0')}</li>`);
+    return `<div class="wheel-col" data-type="${type}">
+      <ul class="wheel-list"><li class="wheel-item wheel-spacer"></li>${items.join('')}<li class="wheel-item wheel-spacer"></li></ul>
+      <div class="wheel-mask"></div>
+    </div>`;
+  }
+
+  // Giống ô điểm trong score/index.html
+  function cellHTML(test, sheet) {
+    const id = test.id;
+    const current = Math.round(Number(sheet?.current ?? 0));
+    if (test.type === 'TIME') {
+      const time = sheet && sheet.time !== null && sheet.time !== undefined ? sheet.time : null;
+      const rules = JSON.stringify((test.rules || []).map(r => ({ s: r[0], e: r[1], score: r[2] })));
+      return `<label class="inline-flex items-center" style="gap:8px">
+          <input type="checkbox" name="done_${id}" class="done-toggle" data-btid="${id}" ${time !== null ? 'checked' : ''}>
+          <span>Hoàn thành</span>
+        </label>
+        <div class="time-wrap mt-2 ${time === null ? 'hidden' : ''}" data-btid="${id}" data-max="${test.max}"
+             data-rules='${esc(rules)}' data-time="${time ?? ''}" data-current="${sheet ? sheet.current : ''}">
+          <div class="wheel" data-btid="${id}">${wheelCol('min')}${wheelCol('sec')}<div class="wheel-indicator"></div></div>
+          <input type="hidden" class="time-input" name="time_${id}" value="00:00">
+          <span class="ml-2 muted">Điểm: <b class="time-score" id="preview_${id}">${test.max}</b> / ${test.max}</span>
+        </div>`;
+    }
+    if (test.type === 'TEMPLATE') {
+      return `<div style="display:flex; align-items:center; gap: 8px;">
+          <button type="button" class="btn tpl-open-btn" data-btid="${id}" data-bcode="${esc(test.ma)}">Chấm theo mẫu</button>
+          <span id="preview-total-${id}" class="ml-2 muted">Tổng: ${current}</span>
+          <input type="hidden" name="score_${id}" id="score-input-${id}" data-max="${test.max}" value="${current}">
+          <input type="hidden" name="tpl_time_${id}" id="tpl-time-${id}" value="">
+        </div>`;
+    }
+    return `<input class="score-input" type="number" min="0" max="${test.max}" step="1" name="score_${id}" value="${current}">`;
+  }
+
+  function cardHTML(ct, ts, round, test, sheet) {
+    const body = test.max > 0
+      ? `<table class="table">
+          <thead><tr><th style="width:40%">Vòng thi – Bài thi</th><th>Điểm (0..Max)</th><th>Max</th></tr></thead>
+          <tbody><tr>
+            <td>${esc(round.tenVongThi)} – ${esc(test.tenBaiThi)}</td>
+            <td>${cellHTML(test, sheet)}</td>
+            <td>${test.max}</td>
+          </tr></tbody>
+        </table>
+        <div class="row" style="margin-top:10px">
+          <button class="btn" id="saveBtn" type="button" data-ct="${esc(ct)}" data-ts="${esc(ts.maNV)}">Lưu điểm</button>
+        </div>`
+      : `<div class="muted">Cuộc thi hiện chưa có Vòng/Bài thi.
+          <a href="/organize/" style="color:#93c5fd">Thêm Vòng/Bài</a></div>`;
+    return `<div id="scoreCard" class="card">
+      <div class="row" style="justify-content:space-between">
+        <div>
+          <div><b>Thí sinh:</b> ${esc(ts.maNV)} — ${esc(ts.hoTen)}</div>
+          <div class="muted">Đơn vị: ${esc(ts.donVi)} | Chi nhánh: ${esc(ts.chiNhanh)}</div>
+        </div>
+        <div>Tổng tối đa: <span class="badge">${test.max}</span></div>
+      </div>
+      ${body}
+    </div>`;
+  }
+
+  function mount(html) {
+    const tpl = document.createElement('template');
+    tpl.innerHTML = html.trim();
+    const card = tpl.content.firstElementChild;
+    const old = document.getElementById('scoreCard');
+    if (old) old.replaceWith(card);
+    else document.getElementById('searchHintCard')?.after(card);
+    return card;
+  }
 
+  // -> {ok: true} | {ok: false, message} | null (lỗi mạng / server: để trang tự tải lại)
+  async function open({ ct, vt, bt, q }) {
+    let data, schema;
+    try {
+      const params = new URLSearchParams({ ct, q });
+      const res = await fetch(`/score/sheet/?${params}`, { credentials: 'same-origin' });
+      if (res.status >= 500 || res.status === 401 || res.status === 403) return null;
+      data = await res.json();
+      if (!data.ok) return { ok: false, message: data.message };
+      schema = await loadSchema(ct, data.digest);
+    } catch (err) {
+      return null;
+    }
+    const found = findTest(schema, bt);
+    if (!found) return null;
+
+    const card = mount(cardHTML(ct, data.ts, found.round, found.test, data.sheets[String(bt)]));
+    bindScoreCard(card);
+
+    // Modal chấm theo mẫu dùng thí sinh đang mở
+    const tplTs = document.getElementById('tplThiSinh');
+    if (tplTs) tplTs.value = data.ts.maNV;
+    const tplSave = document.getElementById('tplSaveBtn');
+    if (tplSave) { tplSave.disabled = false; tplSave.removeAttribute('title'); }
+
+    // URL khớp trang server render -> tải lại / chia sẻ link vẫn mở đúng thí sinh
+    history.replaceState(null, '', `${location.pathname}?${new URLSearchParams({ ct, vt, bt, ts: data.ts.maNV })}`);
+    return { ok: true };
+  }
+
+  function hide() {
+    const card = document.getElementById('scoreCard');
+    if (card) card.style.display = 'none';
+  }
+
+  // Sau khi lưu: ẩn phiếu, xoá ô tìm, giữ cuộc thi / vòng / bài
+  function clear(url) {
+    document.getElementById('scoreCard')?.remove();
+    const input = document.getElementById('searchInput');
+    if (input) { input.value = ''; input.focus(); }
+    const tplTs = document.getElementById('tplThiSinh');
+    if (tplTs) tplTs.value = '';
+    history.replaceState(null, '', url);
+  }
+
+  return { open, hide, clear };
+})();
+
+// === Gắn sự kiện cho thẻ phiếu điểm (lúc tải trang và mỗi lần đổi thí sinh) ===
+function bindScoreCard(root) {
+  // Toggle TIME enable/disable input (show wheel & default 00:00 + 10đ)
+  if (root.querySelector('.done-toggle')) {
+    root.querySelectorAll('.done-toggle').forEach(cb => {
+      const id   = cb.dataset.btid;
+      const wrap = root.querySelector(`.time-wrap[data-btid="${id}"]`);
+      const input   = wrap ? wrap.querySelector('.time-input')  : null;
+      const preview = wrap ? wrap.querySelector('.time-score')  : null;
+      const wheel   = wrap ? wrap.querySelector('.wheel')       : null;
+      const minCol  = wheel ? wheel.querySelector('[data-type="min"]') : null;
+      const secCol  = wheel ? wheel.querySelector('[data-type="sec"]') : null;
+
+      const hasSaved = !!(wrap && wrap.dataset && wrap.dataset.time && wrap.dataset.time !== "");
+      if (hasSaved) cb.checked = true;
+
+      const update = () => {
+        if (!wrap || !input) return;
+        if (cb.checked) {
+          wrap.classList.remove('hidden');
+          input.removeAttribute('disabled');
+
+          // default: 00:00 + 10 điểm
+          if (!hasSaved) {
+            if (minCol) minCol.scrollTop = 0;
+            if (secCol) secCol.scrollTop = 0;
+            input.value = '00:00';
+            if (preview) preview.textContent = '10';
+          }
+          // focus vào cột phút cho UX
+          if (minCol) minCol.focus?.();
+        } else {
+          wrap.classList.add('hidden');
+          input.setAttribute('disabled', 'disabled');
+          input.value = '';
+          if (preview) preview.textContent = '0';
+        }
+      };
+
+      cb.addEventListener('change', update);
+      update();
+    });
+  }
+  // TIME preview by rules
+  if (root.querySelector('.time-wrap')) {
+    root.querySelectorAll('.time-wrap').forEach(wrap => {
+        const rules = JSON.parse(wrap.dataset.rules || '[]');
+        const input = wrap.querySelector('.time-input');
+        const out = wrap.querySelector('.time-score');
+        if (!input || !out) return;
+        input.addEventListener('input', () => {
+          const sec = parseSeconds(input.value);
+          let bonus = 0;
+          if (sec !== null) {
+              for (const r of rules) {
+                if (sec >= r.s && sec <= r.e) { bonus = Number(r.bonus ?? r.score ?? 0); break; }
+              }
+          }
+          out.textContent = String(Math.min(20, 10 + bonus));
+      });
+    });
+  }
+  initTimeWheels(root);
+}
+
+(function initScorePage() {
   // --- SUGGEST: gợi ý theo ký tự gõ ---
   const input = document.getElementById('searchInput');
   const box = document.getElementById('suggestBox');
@@ -396,7 +744,6 @@ function saveTplScores() {
   const btSelect = document.getElementById('btSelect');
   const hintCard = document.getElementById('searchHintCard');
   const hintText = document.getElementById('searchHintText');
-  const scoreCard = document.getElementById('scoreCard');
 
   if (!form || !btn || !input) return;
 
@@ -430,7 +777,7 @@ function saveTplScores() {
     if (!vt) {
       e.preventDefault();
       showHint('Vui lòng chọn <b>Vòng thi</b> trước khi chấm điểm.');
-      if (scoreCard) scoreCard.style.display = 'none';
+      ScoreSheet.hide();
       vtSelect && vtSelect.focus();
       return;
     }
@@ -439,7 +786,7 @@ function saveTplScores() {
     if (!bt) {
       e.preventDefault();
       showHint('Vui lòng chọn <b>Bài thi</b> (mỗi lần chỉ chấm 1 bài) trước khi chấm điểm.');
-      if (scoreCard) scoreCard.style.display = 'none';
+      ScoreSheet.hide();
       btSelect && btSelect.focus();
       return;
     }
@@ -448,23 +795,23 @@ function saveTplScores() {
       e.preventDefault();
       showHint('Vui lòng nhập <b>Mã NV</b> hoặc <b>họ tên</b> để tìm thí sinh.');
       input.focus();
-      if (scoreCard) scoreCard.style.display = 'none';
+      ScoreSheet.hide();
       return;
     }
 
-    // vẫn giữ phần kiểm tra thí sinh thuộc cuộc thi như cũ
-    try {
-      const url = `/score/?ajax=suggest&q=${encodeURIComponent(q)}&ct=${encodeURIComponent(ct)}`;
-      const res = await fetch(url, { credentials: 'same-origin' });
-      const list = await res.json();
-
-      if (Array.isArray(list) && list.length > 0) {
-        hideHint();
-        return;
-      }
-    } catch (err) {
-      e.preventDefault();
-      showHint('Không thể kiểm tra thí sinh lúc này. Vui lòng thử lại sau.');
+    // Chế độ BGD: trang do server render (danh sách Chung Kết) -> submit như cũ
+    if (window.BGD_MODE) return;
+
+    // Đổi thí sinh bằng JSON (schema cache + phiếu hiện tại), không render lại trang
+    e.preventDefault();
+    const shown = await ScoreSheet.open({ ct, vt, bt, q });
+    if (shown === null) {
+      form.submit();  // lỗi mạng / server -> tải trang như cũ
+    } else if (!shown.ok) {
+      ScoreSheet.hide();
+      showHint(shown.message || 'Không tìm thấy thí sinh.');
+    } else {
+      hideHint();
     }
   });
 })();
@@ -475,7 +822,6 @@ function saveTplScores() {
     const vtSelect = document.getElementById('vtSelect');
     const btSelect = document.getElementById('btSelect');
     const hintCard = document.getElementById('searchHintCard');
-    const scoreCard = document.getElementById('scoreCard');
     
 
     if (ctSelect && vtSelect && btSelect) {
@@ -484,7 +830,7 @@ function saveTplScores() {
 
           // 1) Reset UI nhẹ
           hintCard && (hintCard.style.display = 'none');
-          scoreCard && (scoreCard.style.display = 'none');
+          ScoreSheet.hide();
           const input = document.getElementById('searchInput');
           const box = document.getElementById('suggestBox');
           const resultCard = document.querySelector('.card[data-type="result"]');
@@ -551,71 +897,10 @@ function saveTplScores() {
     });
 
 
-    // Toggle TIME enable/disable input (show wheel & default 00:00 + 10đ)
-    if (document.querySelector('.done-toggle')) {
-      document.querySelectorAll('.done-toggle').forEach(cb => {
-        const id   = cb.dataset.btid;
-        const wrap = document.querySelector(`.time-wrap[data-btid="${id}"]`);
-        const input   = wrap ? wrap.querySelector('.time-input')  : null;
-        const preview = wrap ? wrap.querySelector('.time-score')  : null;
-        const wheel   = wrap ? wrap.querySelector('.wheel')       : null;
-        const minCol  = wheel ? wheel.querySelector('[data-type="min"]') : null;
-        const secCol  = wheel ? wheel.querySelector('[data-type="sec"]') : null;
-
-        const hasSaved = !!(wrap && wrap.dataset && wrap.dataset.time && wrap.dataset.time !== "");
-        if (hasSaved) cb.checked = true;
-
-        const update = () => {
-          if (!wrap || !input) return;
-          if (cb.checked) {
-            wrap.classList.remove('hidden');
-            input.removeAttribute('disabled');
-
-            // default: 00:00 + 10 điểm
-            if (!hasSaved) {
-              if (minCol) minCol.scrollTop = 0;
-              if (secCol) secCol.scrollTop = 0;
-              input.value = '00:00';
-              if (preview) preview.textContent = '10';
-            }
-            // focus vào cột phút cho UX
-            if (minCol) minCol.focus?.();
-          } else {
-            wrap.classList.add('hidden');
-            input.setAttribute('disabled', 'disabled');
-            input.value = '';
-            if (preview) preview.textContent = '0';
-          }
-        };
-
-        cb.addEventListener('change', update);
-        update();
-      });
-    }
-    // TIME preview by rules
-    if (document.querySelector('.time-wrap')) {
-      document.querySelectorAll('.time-wrap').forEach(wrap => {
-          const rules = JSON.parse(wrap.dataset.rules || '[]');
-          const input = wrap.querySelector('.time-input');
-          const out = wrap.querySelector('.time-score');
-          if (!input || !out) return;
-          input.addEventListener('input', () => {
-            const sec = parseSeconds(input.value);
-            let bonus = 0;
-            if (sec !== null) {
-                for (const r of rules) {
-                  if (sec >= r.s && sec <= r.e) { bonus = Number(r.bonus ?? r.score ?? 0); break; }
-                }
-            }
-            out.textContent = String(Math.min(20, 10 + bonus));
-        });
-      });
-    }
-
-
-    // Save (AJAX)
-    if (saveBtn) {
-saveBtn.addEventListener('click', async () => {
+    // Save (AJAX) — delegate vì thẻ phiếu được dựng lại khi đổi thí sinh
+    document.addEventListener('click', async (e) => {
+  const saveBtn = e.target.closest('#saveBtn');
+  if (!saveBtn) return;
   const thiSinh = saveBtn.dataset.ts || '';
   if (!thiSinh) {
     showToast('Không có thông tin thí sinh để lưu.', true);
@@ -711,6 +996,8 @@ saveBtn.addEventListener('click', async () => {
               return { res, data };
             }
 
+            // key sinh trước lần gửi đầu: request này có thể đã ghi dù không nhận được phản hồi
+            ScoreQueue.assignKeys(payload);
             let { res, data } = await postScores(payload);
 
             // Nếu server báo đã có điểm → hỏi xác nhận
@@ -763,20 +1050,30 @@ saveBtn.addEventListener('click', async () => {
 
               const base = location.pathname.startsWith('/score/bgd') ? '/score/bgd/' : '/score/';
               const url  = params.toString() ? `${base}?${params}` : base;
-              window.location.href = url;
+              if (window.BGD_MODE) {
+                window.location.href = url;
+                return;
+              }
+              // Chấm thường: ẩn phiếu, sẵn sàng tìm thí sinh kế tiếp (không render lại trang)
+              ScoreSheet.clear(url);
             }, 800);
             } catch (e) {
             console.error(e);
-            showToast('Không thể kết nối server.', true);
+            // Mất mạng / server không trả lời: lưu tạm, tự gửi lại khi có mạng
+            const n = ScoreQueue.enqueue(payload);
+            if (n) {
+              showToast(`Mất kết nối — đã lưu tạm ${n} điểm trên máy, sẽ tự gửi lại khi có mạng.`, true);
+            } else {
+              showToast('Không thể kết nối server.', true);
+            }
             }
         });
-    }
-  initTimeWheels();
+  bindScoreCard(document);
 })();
 
 // === Wheel Picker 2-column (phút / giây) ===
-function initTimeWheels() {
-  document.querySelectorAll('.time-wrap').forEach((wrap) => {
+function initTimeWheels(root = document) {
+  root.querySelectorAll('.time-wrap').forEach((wrap) => {
     const wheel = wrap.querySelector('.wheel');
     if (!wheel) return;
     const minCol = wheel.querySelector('[data-type="min"]');
@@ -0,0 +1,257 @@
+# core/time_rules.py
+"""
+Chấm bài TIME theo thang thời gian (BaiThiTimeRule).
+
+TimeRuleIndex "biên dịch" các rule của 1 bài thành các khoảng rời nhau đã sắp
+theo mốc bắt đầu -> tra bonus bằng bisect (1 thời gian) hoặc np.searchsorted
+(cả mảng thời gian). Rule chồng nhau: rule đứng trước theo thứ tự của model
+(start ↑, end ↑, score ↑) thắng, giống vòng lặp tuyến tính trước đây.
+
+Quy tắc điểm (giống form chấm):
+  - Không hoàn thành / quá mốc cuối + 30s: 0 điểm, thời gian = mốc cuối + 31s.
+  - Hoàn thành: 10 + bonus theo rule (kẹp TIME_MAX), lưu thời gian thật.
+
+rescore_time_test: đổi thang -> tính lại mọi phiếu của bài trong 1 lượt vector,
+xem trước số phiếu / số thí sinh đổi hạng, ghi bằng 1 bulk_update.
+import_time_results: nạp kết quả từ máy bấm giờ (maNV, thời gian) cho cả bài, ghi qua
+score_write.upsert_sheets như form chấm.
+"""
+from bisect import bisect_right
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+
+from .invalidation import bus, contest_key
+from .models import PhieuChamDiem, ThiSinh, ThiSinhCuocThi
+from .score_matrix import ContestScoreMatrix
+from .score_write import upsert_sheets
+from .standings import schedule_refresh_many
+
+TIME_BASE = 10   # điểm hoàn thành
+TIME_MAX = 20    # 10 điểm hoàn thành + tối đa 10 điểm thưởng
+TIME_GRACE = 30  # giây được phép quá mốc cuối
+
+# Ô thời gian của máy bấm giờ nghĩa là "không hoàn thành"
+NOT_FINISHED = {"", "-", "x", "dnf", "dns", "dq", "khong hoan thanh", "khonghoanthanh"}
+
+
+def parse_seconds(v):
+    """
+    "75" / "75.4" / "1:15" / "1:15.40" / "0:01:15" -> 75 (giây, làm tròn xuống).
+    Rỗng / sai định dạng -> None.
+    """
+    if v is None:
+        return None
+    s = str(v).strip().replace(",", ".")
+    if not s:
+        return None
+    try:
+        parts = [float(p) for p in s.split(":")]
+    except ValueError:
+        return None
+    if len(parts) > 3 or any(p < 0 for p in parts):
+        return None
+    total = 0.0
+    for p in parts:
+        total = total * 60 + p
+    return int(total)
+
+
+class TimeRuleIndex:
+    def __init__(self, rules):
+        """rules: [(start, end, score)] (giây, 2 đầu đều tính)."""
+        rules = sorted((int(s), int(e), int(sc)) for s, e, sc in rules)
+        self.max_end = max((e for _, e, _ in rules), default=0)
+        rules = [r for r in rules if r[1] >= r[0]]
+        self.allowed_max = self.max_end + TIME_GRACE
+        self.capped_time = self.allowed_max + 1
+
+        # Cắt phần đã bị rule trước phủ -> các khoảng rời nhau
+        segments = []
+        for s, e, sc in rules:
+            pieces = [(s, e)]
+            for cs, ce, _ in segments:
+                pieces = [
+                    part
+                    for ps, pe in pieces
+                    for part in ((ps, min(pe, cs - 1)), (max(ps, ce + 1), pe))
+                    if part[0] <= part[1]
+                ]
+            segments.extend((ps, pe, sc) for ps, pe in pieces)
+        segments.sort()
+
+        self.starts = [s for s, _, _ in segments]
+        self.ends = [e for _, e, _ in segments]
+        self.scores = [sc for _, _, sc in segments]
+        self._starts = np.array(self.starts, dtype=np.int64)
+        self._ends = np.array(self.ends, dtype=np.int64)
+        self._scores = np.array(self.scores, dtype=np.int64)
+
+    def bonus(self, seconds) -> int:
+        j = bisect_right(self.starts, seconds) - 1
+        if j >= 0 and seconds <= self.ends[j]:
+            return self.scores[j]
+        return 0
+
+    def result(self, is_done, seconds):
+        """1 lần chấm -> (diem, thoiGian lưu). seconds đã là số giây hợp lệ."""
+        if not is_done or seconds > self.allowed_max:
+            return 0, int(self.capped_time)
+        return min(TIME_MAX, TIME_BASE + self.bonus(seconds)), int(seconds)
+
+    def score_many(self, seconds, done):
+        """Bản vector của result(): seconds, done là mảng cùng độ dài."""
+        seconds = np.asarray(seconds, dtype=np.int64)
+        ok = np.asarray(done, dtype=bool) & (seconds <= self.allowed_max)
+
+        bonus = np.zeros(len(seconds), dtype=np.int64)
+        if len(self._starts):
+            j = np.searchsorted(self._starts, seconds, side="right") - 1
+            jj = np.clip(j, 0, None)
+            hit = (j >= 0) & (seconds <= self._ends[jj])
+            bonus = np.where(hit, self._scores[jj], 0)
+
+        diem = np.where(ok, np.minimum(TIME_MAX, TIME_BASE + bonus), 0)
+        stored = np.where(ok, seconds, self.capped_time)
+        return diem, stored
+
+
+def _rank_positions(matrix, avg, t_avg):
+    # Hạng giống bảng xếp hạng: tổng TB điểm ↓, tổng TB thời gian bài TIME ↑, mã NV ↑
+    totals = np.nansum(avg, axis=1)
+    times = t_avg[:, matrix.is_time]
+    has_time = ~np.isnan(times).all(axis=1) if times.shape[1] else np.zeros(len(totals), dtype=bool)
+    times = np.where(has_time, np.nansum(times, axis=1), np.nan)
+
+    pos = np.full(len(totals), -1, dtype=np.int64)
+    order = matrix.order(totals, times, rows=matrix.is_member)
+    pos[order] = np.arange(len(order))
+    return pos
+
+
+def rescore_time_test(bt, rules, apply=False):
+    """
+    Tính lại điểm mọi phiếu của bài TIME `bt` theo thang `rules`.
+    Phiếu 0 điểm = không hoàn thành (hoàn thành luôn >= 10) -> giữ không hoàn thành.
+    -> {"rows": số phiếu, "changed": số phiếu đổi, "ranks_changed": số thí sinh đổi hạng}
+    apply=True: ghi các phiếu đổi bằng 1 bulk_update (trong transaction của caller nếu có).
+    """
+    index = rules if isinstance(rules, TimeRuleIndex) else TimeRuleIndex(rules)
+    ct_id = bt.vongThi.cuocThi_id
+
+    rows = list(
+        PhieuChamDiem.objects.filter(baiThi=bt)
+        .order_by("pk")
+        .values_list("pk", "thiSinh_id", "diem", "thoiGian")
+    )
+    summary = {"rows": len(rows), "changed": 0, "ranks_changed": 0}
+    if not rows:
+        return summary
+
+    ids = np.array([r[0] for r in rows], dtype=np.int64)
+    ts_ids = [r[1] for r in rows]
+    old_diem = np.array([float(r[2] or 0) for r in rows])
+    old_time = np.array([int(r[3] or 0) for r in rows], dtype=np.int64)
+
+    new_diem, new_time = index.score_many(old_time, old_diem > 0)
+    changed = (new_diem != old_diem) | (new_time != old_time)
+    summary["changed"] = int(changed.sum())
+    if not summary["changed"]:
+        return summary
+
+    # Xem trước thứ hạng: thay cột của bài này trong ma trận bằng TB mới
+    matrix = ContestScoreMatrix.for_contest(ct_id)
+    j = matrix.test_index.get(bt.id)
+    if j is not None:
+        row_idx = np.array([matrix.ts_index.get(ts, -1) for ts in ts_ids], dtype=np.int64)
+        known = row_idx >= 0
+        n = len(matrix.ts_ids)
+        cnt = np.bincount(row_idx[known], minlength=n)
+        has = cnt > 0
+
+        avg = matrix.avg.copy()
+        t_avg = matrix.t_avg.copy()
+        avg[has, j] = np.bincount(row_idx[known], weights=new_diem[known], minlength=n)[has] / cnt[has]
+        t_avg[has, j] = np.bincount(row_idx[known], weights=new_time[known], minlength=n)[has] / cnt[has]
+
+        before = _rank_positions(matrix, matrix.avg, matrix.t_avg)
+        after = _rank_positions(matrix, avg, t_avg)
+        summary["ranks_changed"] = int(np.count_nonzero(before != after))
+
+    if apply:
+        now = timezone.now()
+        objs = [
+            PhieuChamDiem(pk=int(pk), diem=int(d), thoiGian=int(t), updated_at=now)
+            for pk, d, t in zip(ids[changed], new_diem[changed], new_time[changed])
+        ]
+        with transaction.atomic():
+            PhieuChamDiem.objects.bulk_update(objs, ["diem", "thoiGian", "updated_at"])
+            # bulk_update không bắn signal -> tự cập nhật bảng xếp hạng / cache
+            schedule_refresh_many(ct_id, (ts for ts, c in zip(ts_ids, changed) if c))
+            bus.bump(contest_key(ct_id))
+
+    return summary
+
+
+
+def import_time_results(bt, judge, rows):
+    """
+    Nạp kết quả bài TIME `bt` dưới tên giám khảo `judge`.
+    rows: iterable (số dòng, maNV, thời gian thô), đọc lần lượt (không cần cả file trong RAM).
+    Thời gian rỗng / DNF -> không hoàn thành. Dòng sau cùng 1 thí sinh thay dòng trước.
+    -> {"created", "updated", "rejects": [(dòng, maNV, lý do)]}
+    """
+    from .models import BaiThiTimeRule  # tránh import vòng
+
+    ct = bt.vongThi.cuocThi
+    members = {
+        ts_id.lower(): ts_id
+        for ts_id in ThiSinhCuocThi.objects.filter(cuocThi=ct).values_list("thiSinh_id", flat=True)
+    }
+
+    rejects = []
+    picked = {}  # ts_id -> (dòng, giây, hoàn thành)
+    for line, code, raw in rows:
+        code = str(code or "").strip()
+        if not code:
+            if str(raw or "").strip():
+                rejects.append((line, "", "Thiếu mã NV."))
+            continue
+        ts_id = members.get(code.lower())
+        if ts_id is None:
+            rejects.append((line, code, "Không thuộc cuộc thi."))
+            continue
+        text = str(raw if raw is not None else "").strip()
+        if text.lower() in NOT_FINISHED:
+            seconds, done = 0, False
+        else:
+            seconds, done = parse_seconds(text), True
+            if seconds is None:
+                rejects.append((line, code, f"Thời gian không hợp lệ: {text}"))
+                continue
+        if ts_id in picked:
+            rejects.append((picked[ts_id][0], code, f"Bị thay bởi dòng {line}."))
+        picked[ts_id] = (line, seconds, done)
+
+    summary = {"created": 0, "updated": 0, "rejects": sorted(rejects)}
+    if not picked:
+        return summary
+
+    # Chấm cả cột trong 1 lượt
+    index = TimeRuleIndex(
+        BaiThiTimeRule.objects.filter(baiThi=bt).values_list("start_seconds", "end_seconds", "score")
+    )
+    ts_ids = list(picked)
+    diem, stored = index.score_many(
+        [picked[ts][1] for ts in ts_ids],
+        [picked[ts][2] for ts in ts_ids],
+    )
+
+    # Cùng đường ghi với form chấm / bulk: upsert theo thứ tự khoá, bảng xếp hạng + cache sau commit
+    statuses = upsert_sheets(ct, judge, [
+        (ThiSinh(pk=ts_id), bt, int(d), int(t)) for ts_id, d, t in zip(ts_ids, diem, stored)
+    ])
+    summary["updated"] = sum(1 for st in statuses.values() if st == "updated")
+    summary["created"] = len(statuses) - summary["updated"]
+    return summary
@@ -26,7 +26,11 @@ from .models import (
     GiamKhao,
     CuocThi,
     ThiSinhCuocThi,
+    GiamKhaoBaiThi,
 )
+from .sheet_import import apply_plan, build_plan
+from .time_rules import import_time_results
+from .views_score import _assignment_index, _current_judge
 
 # ============================================================
 # CẤU HÌNH CỘT HỖ TRỢ IMPORT
@@ -36,6 +40,8 @@ REQUIRED_COLUMNS = {
     "thisinh": ["maNV", "hoTen", "chiNhanh", "vung", "donVi", "email", "nhom", "image_url"],
     "giamkhao": ["maNV", "hoTen", "email"],
     "voting":  ["maNV", "hoTen", "chiNhanh", "vung", "donVi", "email", "nhom", "image_url"],
+    "thoigian": ["maNV", "thoiGian"],  # kết quả máy bấm giờ cho 1 bài TIME
+    "phieucham": [],  # phiếu chấm giấy theo "mẫu chấm thi.xlsx" (core/sheet_import.py)
 }
 
 def _normalize(s: str) -> str:
@@ -63,6 +69,9 @@ HEADER_ALIASES = {
     # image_url
     "imageurl": "image_url", "image_url": "image_url", "hinhanh": "image_url",
     "hinh_anh": "image_url", "hinhanh": "image_url", "anh": "image_url", "img": "image_url",
+    # thoiGian (kết quả bấm giờ: giây hoặc mm:ss)
+    "thoigian": "thoiGian", "time": "thoiGian", "seconds": "thoiGian", "giay": "thoiGian",
+    "sogiay": "thoiGian", "ketqua": "thoiGian", "result": "thoiGian",
 }
 
 def _map_header_list(header, expected_cols):
@@ -137,6 +146,117 @@ def _read_csv(file, expected_cols):
         data.append(out)
     return data
 
+REJECTS_SHOWN = 20  # số dòng lỗi hiện chi tiết sau khi import kết quả / phiếu chấm
+
+
+def _import_score_sheets(request, cuocthi_obj, f):
+    """Phiếu chấm giấy: dry_run -> trả plan để hiện bảng so sánh, ngược lại ghi luôn."""
+    if not cuocthi_obj:
+        messages.error(request, "Vui lòng chọn cuộc thi.")
+        return None
+    if not f.name.lower().endswith(".xlsx"):
+        messages.error(request, "Phiếu chấm phải là tệp .xlsx theo mẫu chấm thi.")
+        return None
+    judge = _current_judge(request)
+    if not judge:
+        messages.error(request, "Bạn chưa đăng nhập giám khảo.")
+        return None
+
+    allowed_ids = _assignment_index(cuocthi_obj, judge)["test_ids"]
+    try:
+        plan = build_plan(f, cuocthi_obj, judge, allowed_ids, request.POST.get("baiThi_id"))
+    except Exception as e:
+        messages.error(request, f"Lỗi đọc tệp: {e}")
+        return None
+
+    counts = plan.counts()
+    summary = (
+        f"thêm {counts['created']}, cập nhật {counts['updated']}, "
+        f"không đổi {counts['unchanged']}, bỏ qua {len(plan.rejects)}."
+    )
+    if request.POST.get("dry_run"):
+        messages.info(request, f"Xem trước phiếu chấm (chưa lưu): {summary}")
+    else:
+        apply_plan(plan)
+        messages.success(request, f"Import phiếu chấm: {summary}")
+    for sheet, where, reason in plan.rejects[:REJECTS_SHOWN]:
+        messages.warning(request, f"Sheet {sheet}{f' ({where})' if where else ''}: {reason}")
+    if len(plan.rejects) > REJECTS_SHOWN:
+        messages.warning(request, f"... và {len(plan.rejects) - REJECTS_SHOWN} lỗi khác.")
+    return plan
+
+
+def _iter_time_rows(file):
+    """
+    Đọc lần lượt file kết quả bấm giờ (cột maNV, thoiGian) -> (số dòng, maNV, thời gian thô).
+    XLSX đọc read_only theo dòng, CSV đọc theo stream: file hàng nghìn dòng không nạp cả vào RAM.
+    """
+    expected = REQUIRED_COLUMNS["thoigian"]
+    if file.name.lower().endswith(".xlsx"):
+        wb = load_workbook(file, read_only=True, data_only=True)
+        rows = wb.active.iter_rows(values_only=True)
+    else:
+        rows = csv.reader(TextIOWrapper(file, encoding="utf-8-sig"))
+
+    header = next(rows, None)
+    if header is None:
+        return
+    _, src_idx, missing = _map_header_list(
+        [str(c).strip() if c is not None else "" for c in header], expected
+    )
+    if missing:
+        raise ValueError(f"Thiếu cột: {', '.join(missing)}")
+
+    i_ma, i_time = src_idx["maNV"], src_idx["thoiGian"]
+    for line, r in enumerate(rows, start=2):
+        if not r:
+            continue
+        ma = r[i_ma] if i_ma < len(r) else None
+        raw = r[i_time] if i_time < len(r) else None
+        if ma is None and raw is None:
+            continue
+        yield line, ma, raw
+
+
+def _import_time_results(request, cuocthi_obj, f):
+    bt = (
+        BaiThi.objects.select_related("vongThi__cuocThi")
+        .filter(pk=request.POST.get("baiThi_id") or None, phuongThucCham="TIME")
+        .first()
+    )
+    if not bt or (cuocthi_obj and bt.vongThi.cuocThi_id != cuocthi_obj.pk):
+        messages.error(request, "Vui lòng chọn bài thi chấm theo thời gian của cuộc thi.")
+        return
+    if bt.vongThi.is_special_bonus_round:
+        messages.error(request, "Bài thuộc vòng đặc biệt (chia cặp): vui lòng chấm trên trang chấm điểm.")
+        return
+
+    judge = _current_judge(request)
+    if not judge:
+        messages.error(request, "Bạn chưa đăng nhập giám khảo.")
+        return
+    if judge.role != "ADMIN" and not GiamKhaoBaiThi.objects.filter(giamKhao=judge, baiThi=bt).exists():
+        messages.error(request, f"Bạn không được phân công chấm bài {bt.ma}.")
+        return
+
+    try:
+        result = import_time_results(bt, judge, _iter_time_rows(f))
+    except Exception as e:
+        messages.error(request, f"Lỗi đọc tệp: {e}")
+        return
+
+    rejects = result["rejects"]
+    messages.success(
+        request,
+        f"Import kết quả {bt.ma}: thêm {result['created']}, cập nhật {result['updated']}, "
+        f"bỏ qua {len(rejects)}."
+    )
+    for line, ma, reason in rejects[:REJECTS_SHOWN]:
+        messages.warning(request, f"Dòng {line}{f' ({ma})' if ma else ''}: {reason}")
+    if len(rejects) > REJECTS_SHOWN:
+        messages.warning(request, f"... và {len(rejects) - REJECTS_SHOWN} dòng khác.")
+
+
 def _find_duplicate_ma_email(rows, key_ma="maNV", key_email="email"):
     seen_ma, seen_email = set(), set()
     dup_ma, dup_email = set(), set()
@@ -193,6 +313,17 @@ def import_view(request):
             messages.error(request, "Vui lòng chọn tệp CSV/XLSX.")
             return redirect(request.path)
 
+        if target == "thoigian":
+            _import_time_results(request, cuocthi_obj, f)
+            return redirect(request.path)
+
+        if target == "phieucham":
+            plan = _import_score_sheets(request, cuocthi_obj, f)
+            if plan is None or not request.POST.get("dry_run"):
+                return redirect(request.path)
+            # dry-run: hiện bảng so sánh ngay trên trang, không lưu gì
+            return render(request, "importer/index.html", _import_context(preselected_ma, plan))
+
         expected = REQUIRED_COLUMNS[target]
         try:
             if isinstance(f, (InMemoryUploadedFile, TemporaryUploadedFile)) and f.name.lower().endswith(".xlsx"):
@@ -287,15 +418,22 @@ def import_view(request):
         return redirect(request.path)
 
     # GET
-    return render(
-        request,
-        "importer/index.html",
-        {
-            "cuocthi_list": CuocThi.objects.all().values("ma", "tenCuocThi").order_by("ma"),
-            "preselected_ma": preselected_ma,
-        }
-        
-)
+    return render(request, "importer/index.html", _import_context(preselected_ma))
+
+
+def _import_context(preselected_ma, plan=None):
+    tests = (
+        BaiThi.objects.filter(vongThi__is_special_bonus_round=False)
+        .select_related("vongThi__cuocThi").order_by("vongThi__cuocThi__ma", "ma")
+    )
+    return {
+        "cuocthi_list": CuocThi.objects.all().values("ma", "tenCuocThi").order_by("ma"),
+        "preselected_ma": preselected_ma,
+        "time_tests": [b for b in tests if b.phuongThucCham == "TIME"],
+        "sheet_tests": [b for b in tests if b.phuongThucCham != "TIME"],
+        "plan": plan,
+        "plan_counts": plan.counts() if plan else None,
+    }
 def _extract_manv_from_filename_stem(stem: str) -> str | None:
     """
     Nhận vào phần tên file không có đuôi (stem) và trả về maNV nếu tìm được.
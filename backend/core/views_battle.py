@@ -231,7 +231,8 @@ def pairing_state(request):
             "right": right_members,
         })
 
-    return JsonResponse({"pairs": result})
+    # ct: để màn hình mở /events/<ct>/ nhận tín hiệu cặp đấu thay đổi
+    return JsonResponse({"ct": ct.id, "pairs": result})
 
 
 
@@ -1,15 +1,17 @@
 # core/views_bgd.py
-from io import BytesIO
 import zipfile
 import json
 
-from django.http import HttpResponse, Http404, JsonResponse, HttpResponseBadRequest
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, Http404, JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import render, redirect
 from django.urls import reverse
 from django.conf import settings
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, condition
+from django.utils.cache import patch_cache_control
 from django.views.decorators.csrf import csrf_exempt
-from django.db.models import Sum, Q, Avg, Count, Max
+from django.db.models import Sum, Q, Max
 
 from .models import (
     BanGiamDoc,
@@ -18,104 +20,18 @@ from .models import (
     ThiSinh,
     BGDScore,
     VongThi,
-    PhieuChamDiem,
-    BaiThi,
 )
 from .views_score import score_view  # tái dùng view chấm hiện có
+from .bgd_top import locked_top
+from .bgd_score import bgd_test, normalize_score, record_score, record_scores, representative_judge
+from .qr_cards import CARD_FORMATS, card_key, iter_cards, load_card
 
 def _select_bgd_contestants(ct, vt_bgd):
     """
-    Chọn danh sách thí sinh cho vòng BGD hiện tại (vt_bgd) theo cấu hình Top X.
-
-    Nếu có vòng BGD liền trước (ví dụ Top10 trước Top5):
-      - Dùng vòng BGD trước để LỌC danh sách (chỉ lấy những thí sinh đã có điểm ở vòng đó)
-      - Nhưng XẾP HẠNG để lấy Top X vòng hiện tại theo TỔNG ĐIỂM TOÀN CUỘC THI (total_diem)
-    Nếu không có vòng BGD trước:
-      - Fallback: lấy tổng điểm các vòng KHÔNG phải BGD
+    Danh sách thí sinh của vòng BGD hiện tại (vt_bgd) theo Top X ĐÃ CHỐT (core/bgd_top.py):
+    nhiều BGD mở QR cùng lúc chỉ đọc lại danh sách, không tính lại tổng điểm cả cuộc thi.
     """
-    if not (ct and vt_bgd and vt_bgd.bgd_top_limit):
-        return []
-
-    # ✅ luôn khởi tạo để tránh UnboundLocalError
-    score_rows = []
-
-    prev_bgd_round = (
-        VongThi.objects.filter(cuocThi=ct, is_bgd_round=True, id__lt=vt_bgd.id)
-        .order_by("-id")
-        .first()
-    )
-
-    prev_special_round = (
-        VongThi.objects.filter(cuocThi=ct, is_special_bonus_round=True, id__lt=vt_bgd.id)
-        .order_by("-id")
-        .first()
-    )
-
-    if prev_bgd_round:
-        annotate_kwargs = dict(
-            prev_bgd_score=Sum("diem", filter=Q(vongThi=prev_bgd_round)),
-            total_diem=Sum("diem"),
-            total_time=Sum("thoiGian"),
-        )
-        if prev_special_round:
-            annotate_kwargs["special_score"] = Sum("diem", filter=Q(vongThi=prev_special_round))
-
-        qs = (
-            PhieuChamDiem.objects.filter(cuocThi=ct)
-            .values("thiSinh")
-            .annotate(**annotate_kwargs)
-            .filter(prev_bgd_score__gt=0)  # ✅ lọc nhóm Top10 (đã có điểm ở vòng BGD trước)
-        )
-
-        if prev_special_round:
-            qs = qs.filter(special_score__gt=0)
-
-        # ✅ FIX theo yêu cầu: lấy Top theo tổng điểm, KHÔNG theo điểm vòng Top10
-        score_rows = list(
-            qs.order_by(
-                "-total_diem",
-                "total_time",
-                "thiSinh",
-            )[: vt_bgd.bgd_top_limit]
-        )
-
-    else:
-        annotate_kwargs = dict(
-            total_diem=Sum("diem"),
-            total_time=Sum("thoiGian"),
-        )
-        if prev_special_round:
-            annotate_kwargs["special_score"] = Sum("diem", filter=Q(vongThi=prev_special_round))
-
-        qs = (
-            PhieuChamDiem.objects.filter(
-                cuocThi=ct,
-                vongThi__is_bgd_round=False,
-            )
-            .values("thiSinh")
-            .annotate(**annotate_kwargs)
-        )
-
-        if prev_special_round:
-            qs = qs.filter(special_score__gt=0)
-
-        score_rows = list(
-            qs.order_by(
-                "-total_diem",
-                "total_time",
-                "thiSinh",
-            )[: vt_bgd.bgd_top_limit]
-        )
-
-    # ✅ nếu không có dữ liệu thì return luôn (tránh lỗi phía dưới)
-    if not score_rows:
-        return []
-
-    ts_ids = [row["thiSinh"] for row in score_rows]
-    contestants = list(ThiSinh.objects.filter(pk__in=ts_ids))
-    order_map = {ts_id: idx for idx, ts_id in enumerate(ts_ids)}
-    contestants.sort(key=lambda ts: order_map.get(ts.pk, 0))
-    return contestants
+    return locked_top(ct, vt_bgd)
 
 def _auto_login_bgd_as_judge(request, bgd):
     """
@@ -155,95 +71,31 @@ def _auto_login_bgd_as_judge(request, bgd):
 
 
 # ===== Helper: tạo QR đơn (tự chọn go / go-stars theo Top X) =====
-def _make_bgd_single_qr_image(bgd, request, ct, vt):
+def _bgd_qr_target_url(request, ct, vt, token):
     """
-    Sinh 1 ảnh PNG nền trắng, ở giữa là 1 QR của vòng thi BGD
-    và bên dưới có text (BGD + tên vòng).
-
-    - Nếu vt.bgd_top_limit == 10 => QR trỏ tới bgd-go-stars
-    - Ngược lại                  => QR trỏ tới bgd-go
+    URL BGD mở khi quét QR của vòng thi BGD:
+    - Nếu vt.bgd_top_limit == 10 => bgd-go-stars
+    - Ngược lại                  => bgd-go
     """
-    import qrcode
-    from qrcode.constants import ERROR_CORRECT_H
-    from PIL import Image, ImageDraw, ImageFont
-
-    if ct is None or vt is None:
-        raise ValueError("Thiếu cuộc thi (ct) hoặc vòng thi (vt) khi tạo QR BGD.")
+    view_name = "bgd-go-stars" if getattr(vt, "bgd_top_limit", None) == 10 else "bgd-go"
+    return request.build_absolute_uri(reverse(view_name, args=[ct.id, vt.id, token]))
 
-    # Chọn view đích theo cấu hình Top
-    if getattr(vt, "bgd_top_limit", None) == 10:
-        view_name = "bgd-go-stars"
-    else:
-        view_name = "bgd-go"
-
-    # URL chấm điểm của BGD cho vòng thi này
-    target_url = request.build_absolute_uri(
-        reverse(view_name, args=[ct.id, vt.id, bgd.token])
-    )
-
-    qr = qrcode.QRCode(
-        version=None,
-        error_correction=ERROR_CORRECT_H,
-        box_size=10,
-        border=4,
-    )
-    qr.add_data(target_url)
-    qr.make(fit=True)
-    qr_img = qr.make_image(fill_color="black", back_color="white").convert("RGB")
-
-    # Chuẩn bị "card" trắng chứa QR + label
-    padding = 40
-    label_height = 80  # đủ chỗ cho 2 dòng chữ
-    qr_w, qr_h = qr_img.size
-    card_w = qr_w + padding * 2
-    card_h = qr_h + padding * 2 + label_height
-
-    card = Image.new("RGB", (card_w, card_h), "white")
-    qr_x = (card_w - qr_w) // 2
-    qr_y = padding
-    card.paste(qr_img, (qr_x, qr_y))
-
-    draw = ImageDraw.Draw(card)
-    try:
-        font = ImageFont.truetype("arial.ttf", 24)
-    except Exception:
-        font = ImageFont.load_default()
-
-    # helper đo text, tương thích nhiều version Pillow
-    def measure(text: str):
-        if hasattr(draw, "textbbox"):
-            bbox = draw.textbbox((0, 0), text, font=font)
-            return bbox[2] - bbox[0], bbox[3] - bbox[1]
-        if hasattr(font, "getbbox"):
-            bbox = font.getbbox(text)
-            return bbox[2] - bbox[0], bbox[3] - bbox[1]
-        return font.getsize(text)
-
-    # # Hai dòng label: BGD + tên vòng
-    # line1 = f"BGD {bgd.maBGD}"
-    # line2 = vt.tenVongThi or ""
-
-    # w1, h1 = measure(line1)
-    # has_line2 = bool(line2.strip())
-    # if has_line2:
-    #     w2, h2 = measure(line2)
-    # else:
-    #     w2, h2 = 0, 0
-
-    # line_spacing = 4
-    # total_h = h1 + (h2 + line_spacing if has_line2 else 0)
-
-    # label_top = qr_y + qr_h + padding
-    # base_y = label_top + max((label_height - total_h) // 2, 0)
-
-    # x1 = (card_w - w1) // 2
-    # draw.text((x1, base_y), line1, fill="black", font=font)
-
-    # if has_line2:
-    #     x2 = (card_w - w2) // 2
-    #     draw.text((x2, base_y + h1 + line_spacing), line2, fill="black", font=font)
 
-    return card
+def _bgd_qr_card_url(request, ct_id, vt_id, token):
+    """URL đích của thẻ QR (ct, vt BGD, token đều phải tồn tại) hoặc None. Nhớ trên request: ETag và view dùng chung."""
+    if not hasattr(request, "_bgd_qr_url"):
+        url = None
+        ct = CuocThi.objects.filter(id=ct_id).only("id").first()
+        vt = (
+            VongThi.objects.filter(id=vt_id, cuocThi=ct, is_bgd_round=True)
+            .only("id", "bgd_top_limit")
+            .first()
+            if ct else None
+        )
+        if vt and BanGiamDoc.objects.filter(token=token).exists():
+            url = _bgd_qr_target_url(request, ct, vt, token)
+        request._bgd_qr_url = url
+    return request._bgd_qr_url
 
 
 def bgd_list(request):
@@ -369,16 +221,12 @@ def bgd_qr_index(request, token=None):
     def _go_url(tok):
         if not ct or not vt:
             return "#"
-        if getattr(vt, "bgd_top_limit", None) == 10:
-            view_name = "bgd-go-stars"
-        else:
-            view_name = "bgd-go"
-        return request.build_absolute_uri(
-            reverse(view_name, args=[ct.id, vt.id, tok])
-        )
+        return _bgd_qr_target_url(request, ct, vt, tok)
 
     for it in items:
         it["url"] = _go_url(it["token"])
+        # phiên bản ảnh -> ?v= trên src, trình duyệt cache vĩnh viễn đúng bản này
+        it["qr_v"] = card_key(it["url"], "png")[:16] if ct and vt else ""
 
     # Ưu tiên focus:
     # 1) token trong path (/bgd/qr/<token>/)
@@ -423,41 +271,95 @@ def bgd_qr_index(request, token=None):
     )
 
 
-def bgd_qr_png(request, ct_id: int, vt_id: int, token: str):
-    # Đảm bảo Pillow đã cài
-    try:
-        from PIL import Image  # noqa: F401
-    except Exception:
-        raise Http404("Thiếu thư viện pillow. Hãy cài: pip install pillow")
+def _bgd_qr_etag(request, ct_id: int, vt_id: int, token: str, fmt: str = "png"):
+    url = _bgd_qr_card_url(request, ct_id, vt_id, token)
+    return card_key(url, fmt) if url else None
 
-    ct = CuocThi.objects.filter(id=ct_id).only("id", "tenCuocThi").first()
-    if not ct:
-        raise Http404("Không tìm thấy cuộc thi tương ứng với mã QR này.")
 
-    vt = VongThi.objects.filter(
-        id=vt_id, cuocThi=ct, is_bgd_round=True
-    ).first()
-    if not vt:
-        raise Http404("Không tìm thấy vòng thi BGD tương ứng với mã QR này.")
+@condition(etag_func=_bgd_qr_etag)
+def bgd_qr_card(request, ct_id: int, vt_id: int, token: str, fmt: str = "png"):
+    """
+    Thẻ QR của 1 BGD cho 1 vòng BGD (tự chọn go / go-stars theo Top X), PNG hoặc SVG.
+    Thẻ lấy từ cache trên đĩa (core/qr_cards.py); ETag = hash đầu vào -> client có bản rồi
+    thì nhận 304, không đọc / vẽ gì. URL có ?v=<hash> (trang QR tự gắn) -> cache vĩnh viễn.
+    """
+    if fmt == "png":
+        # Đảm bảo Pillow đã cài (SVG không cần)
+        try:
+            from PIL import Image  # noqa: F401
+        except Exception:
+            raise Http404("Thiếu thư viện pillow. Hãy cài: pip install pillow")
+
+    url = _bgd_qr_card_url(request, ct_id, vt_id, token)
+    if not url:
+        raise Http404("Không tìm thấy cuộc thi / vòng thi BGD / Ban Giám Đốc tương ứng với mã QR này.")
+
+    key = card_key(url, fmt)
+    resp = HttpResponse(load_card(url, fmt), content_type=CARD_FORMATS[fmt])
+    if request.GET.get("v") == key[:16]:
+        # URL gắn đúng phiên bản: đổi host / Top X -> trang QR sinh ?v= khác
+        patch_cache_control(resp, public=True, max_age=31536000, immutable=True)
+    else:
+        # URL trần: Top X của vòng đổi thì ảnh đổi -> luôn hỏi lại (ETag)
+        patch_cache_control(resp, public=True, max_age=0, must_revalidate=True)
+    return resp
 
-    bgd = (
-        BanGiamDoc.objects.filter(token=token)
-        .only("token", "maBGD", "ten")
-        .first()
-    )
-    if not bgd:
-        raise Http404("Không tìm thấy Ban Giám Đốc tương ứng với mã QR này.")
 
-    # Ảnh PNG chứa 1 QR (tự chọn go / go-stars theo Top X)
-    img = _make_bgd_single_qr_image(bgd, request, ct, vt)
+class _ZipPipe:
+    """File chỉ-ghi không seek được: zipfile ghi vào, generator lấy ra từng đoạn."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
 
-    buf = BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
-    return HttpResponse(buf.getvalue(), content_type="image/png")
+
+def _stream_qr_zip(entries, fmt="png"):
+    """entries: [(tên file trong zip, URL đích)] -> các đoạn bytes của file zip."""
+    pipe = _ZipPipe()
+    # PNG đã nén sẵn -> ZIP_STORED; SVG nhỏ -> nén
+    method = zipfile.ZIP_STORED if fmt == "png" else zipfile.ZIP_DEFLATED
+    with zipfile.ZipFile(pipe, "w", method) as zf:
+        for (name, _), data in zip(entries, iter_cards((url for _, url in entries), fmt)):
+            zf.writestr(name, data)
+            yield pipe.drain()
+    yield pipe.drain()
+
+
+async def _astream(gen):
+    """
+    Generator đồng bộ -> async generator: mỗi đoạn lấy bằng sync_to_async (vẽ / đọc thẻ chạy
+    ở thread), ASGI gửi dần từng đoạn thay vì gom cả file vào bộ nhớ.
+    """
+    pull = sync_to_async(next, thread_sensitive=False)
+    try:
+        while (chunk := await pull(gen, None)) is not None:
+            yield chunk
+    finally:
+        # client ngắt giữa chừng: đóng zip / thread pool của iter_cards
+        await sync_to_async(gen.close, thread_sensitive=False)()
 
 
 def bgd_qr_zip_all(request):
+    """
+    Zip thẻ QR của mọi BGD cho MỌI vòng BGD của cuộc thi (?ct=..., mặc định như bgd_qr_index).
+    ?format=svg -> thẻ SVG (nhẹ, để in). Thẻ đã có trong cache đọc từ đĩa, còn lại vẽ
+    song song (core/qr_cards.py); zip stream dần: bộ nhớ chỉ giữ vài thẻ.
+    """
+    fmt = request.GET.get("format") or "png"
+    if fmt not in CARD_FORMATS:
+        return HttpResponseBadRequest("format phải là png hoặc svg.")
+
     bgds = list(
         BanGiamDoc.objects.order_by("maBGD").only("token", "maBGD", "ten")
     )
@@ -468,7 +370,12 @@ def bgd_qr_zip_all(request):
         )
 
     # Chọn cuộc thi dùng cho bộ QR này (giống logic bgd_qr_index)
-    ct = CuocThi.objects.filter(trangThai=True).order_by("-id").first()
+    ct = None
+    ct_param = request.GET.get("ct")
+    if ct_param:
+        ct = CuocThi.objects.filter(id=ct_param).first()
+    if not ct:
+        ct = CuocThi.objects.filter(trangThai=True).order_by("-id").first()
     if not ct:
         ct = CuocThi.objects.order_by("-id").first()
     if not ct:
@@ -477,33 +384,24 @@ def bgd_qr_zip_all(request):
             content_type="text/plain; charset=utf-8",
         )
 
-    vt = (
-        VongThi.objects.filter(cuocThi=ct, is_bgd_round=True)
-        .order_by("-id")
-        .first()
-    )
-    if not vt:
+    rounds = list(VongThi.objects.filter(cuocThi=ct, is_bgd_round=True).order_by("id"))
+    if not rounds:
         return HttpResponse(
             "Không tìm thấy vòng thi BGD phù hợp để sinh QR.",
             content_type="text/plain; charset=utf-8",
         )
 
-    zip_buf = BytesIO()
-    with zipfile.ZipFile(zip_buf, "w", zipfile.ZIP_DEFLATED) as zf:
-        for bgd in bgds:
-            # Mỗi file PNG chứa 1 QR (tự chọn go / go-stars theo Top X)
-            img = _make_bgd_single_qr_image(bgd, request, ct, vt)
-
-            img_bytes = BytesIO()
-            img.save(img_bytes, format="PNG")
-            img_bytes.seek(0)
-
-            filename = f"QR_{bgd.maBGD}.png"
-            zf.writestr(filename, img_bytes.getvalue())
-
-    zip_buf.seek(0)
-    resp = HttpResponse(zip_buf.getvalue(), content_type="application/zip")
-    resp["Content-Disposition"] = 'attachment; filename="bgd_qr_all.zip"'
+    # Mọi truy vấn / URL xong trước khi stream; mỗi vòng 1 thư mục trong zip
+    entries = [
+        (f"{vt.ma}/QR_{bgd.maBGD}.{fmt}", _bgd_qr_target_url(request, ct, vt, bgd.token))
+        for vt in rounds
+        for bgd in bgds
+    ]
+    chunks = _stream_qr_zip(entries, fmt)
+    if isinstance(request, ASGIRequest):
+        chunks = _astream(chunks)
+    resp = StreamingHttpResponse(chunks, content_type="application/zip")
+    resp["Content-Disposition"] = f'attachment; filename="bgd_qr_{ct.ma}.zip"'
     return resp
 
 
@@ -596,49 +494,16 @@ def bgd_battle_go(request, token: str):
     return redirect("battle")
 
 
-@csrf_exempt
-@require_http_methods(["POST"])
-def bgd_save_score(request):
-    try:
-        payload = json.loads(request.body.decode("utf-8"))
-    except Exception:
-        return HttpResponseBadRequest("Invalid JSON")
-
-    ts_id = payload.get("thiSinh_id")
-    raw_score = payload.get("score")
-
-    if not ts_id or raw_score is None:
-        return JsonResponse(
-            {"ok": False, "message": "Thiếu thông tin thí sinh hoặc điểm."},
-            status=400,
-        )
-
-    try:
-        score_val = float(raw_score)
-    except (TypeError, ValueError):
-        return JsonResponse(
-            {"ok": False, "message": "Điểm không hợp lệ."},
-            status=400,
-        )
-
-    # Chỉ cho phép 0..100
-    if score_val < 0:
-        score_val = 0
-    if score_val > 100:
-        score_val = 100
-
-    thi_sinh = ThiSinh.objects.filter(pk=ts_id).first()
-    if not thi_sinh:
-        return JsonResponse(
-            {"ok": False, "message": "Không tìm thấy thí sinh."},
-            status=404,
-        )
-
+def _bgd_score_context(request):
+    """
+    BGD / cuộc thi / vòng BGD / mode của phiên chấm (session do bgd_go / bgd_go_stars ghi).
+    -> ((bgd, ct, vt, mode), None) hoặc (None, JsonResponse lỗi).
+    """
     # Lấy BGD từ session
     bgd_token = request.session.get("bgd_token")
     bgd = BanGiamDoc.objects.filter(token=bgd_token).first()
     if not bgd:
-        return JsonResponse(
+        return None, JsonResponse(
             {
                 "ok": False,
                 "message": "BGD chưa được xác định trong phiên làm việc.",
@@ -664,7 +529,7 @@ def bgd_save_score(request):
             .first()
         )
     if not ct:
-        return JsonResponse(
+        return None, JsonResponse(
             {"ok": False, "message": "Không xác định được cuộc thi Chung Kết."},
             status=400,
         )
@@ -681,7 +546,7 @@ def bgd_save_score(request):
             .first()
         )
     if not vt:
-        return JsonResponse(
+        return None, JsonResponse(
             {
                 "ok": False,
                 "created": False,
@@ -690,96 +555,72 @@ def bgd_save_score(request):
             status=400,
         )
 
-    # --- 1) Chuẩn hoá điểm theo mode ---
-    if mode == "stars":
-        # Map 1–5 sao => 20–100 (nấc 20 điểm)
-        # Nếu 0 điểm thì cho về 0 (chưa chấm)
-        if score_val <= 0:
-            diem_int = 0
-        else:
-            star = int(round(score_val / 20.0))  # 0..5
-            if star < 1:
-                star = 1
-            if star > 5:
-                star = 5
-            diem_int = star * 20  # 20,40,60,80,100
-    else:
-        # mode "score": giữ nguyên 0..100 (chấm slider)
-        diem_int = int(round(score_val))
-
-    # --- 2) Lưu điểm thô của từng BGD vào BGDScore ---
-    bgd_score, created = BGDScore.objects.update_or_create(
-        bgd=bgd,
-        cuocThi=ct,
-        vongThi=vt,
-        thiSinh=thi_sinh,
-        defaults={"diem": diem_int},
-    )
+    return (bgd, ct, vt, mode), None
 
-    # Tạo / lấy bài thi tương ứng vòng BGD
-    bt_name = f"BGD - {vt.tenVongThi}"
-    bai_bgd, _ = BaiThi.objects.get_or_create(
-        vongThi=vt,
-        tenBaiThi=bt_name,
-        defaults={
-            "cachChamDiem": 100,
-            "phuongThucCham": "POINTS",
-        },
-    )
 
-    # --- 3) DÙNG CHUNG CHO CẢ 2 MODE: tính ĐIỂM TRUNG BÌNH mọi BGD, lưu 1 phiếu duy nhất ---
+@csrf_exempt
+@require_http_methods(["POST"])
+def bgd_save_score(request):
+    try:
+        payload = json.loads(request.body.decode("utf-8"))
+    except Exception:
+        return HttpResponseBadRequest("Invalid JSON")
+
+    ts_id = payload.get("thiSinh_id")
+    raw_score = payload.get("score")
 
-    # Lấy toàn bộ điểm của các BGD đã chấm cho thí sinh này
-    qs = BGDScore.objects.filter(cuocThi=ct, vongThi=vt, thiSinh=thi_sinh)
+    if not ts_id or raw_score is None:
+        return JsonResponse(
+            {"ok": False, "message": "Thiếu thông tin thí sinh hoặc điểm."},
+            status=400,
+        )
 
-    agg = qs.aggregate(
-        avg=Avg("diem"),
-        cnt=Count("bgd", distinct=True),
-    )
-    avg_val = agg.get("avg") or 0
-    bgd_count = int(agg.get("cnt") or 0)
+    try:
+        score_val = float(raw_score)
+    except (TypeError, ValueError):
+        return JsonResponse(
+            {"ok": False, "message": "Điểm không hợp lệ."},
+            status=400,
+        )
 
-    # Cho phép lưu số thực (ví dụ 78.5) nếu model dùng Float/DecimalField
-    avg_score = float(avg_val)
+    # Chỉ cho phép 0..100
+    if score_val < 0:
+        score_val = 0
+    if score_val > 100:
+        score_val = 100
+
+    thi_sinh = ThiSinh.objects.filter(pk=ts_id).first()
+    if not thi_sinh:
+        return JsonResponse(
+            {"ok": False, "message": "Không tìm thấy thí sinh."},
+            status=404,
+        )
+
+    ctx, error = _bgd_score_context(request)
+    if error:
+        return error
+    bgd, ct, vt, mode = ctx
+
+    # --- 1) Chuẩn hoá điểm theo mode ---
+    diem_int = normalize_score(score_val, mode)
 
     # Chọn 1 giám khảo ĐẠI DIỆN CỐ ĐỊNH cho vòng BGD,
     # đúng yêu cầu: lấy ADMIN nếu có, giống cách làm Top 10.
-    rep_judge = GiamKhao.objects.filter(role="ADMIN").order_by("maNV").first()
-    if not rep_judge:
-        # fallback: 1 giám khảo bất kỳ, nhưng cố định (mã nhỏ nhất)
-        rep_judge = GiamKhao.objects.order_by("maNV").first()
-
+    rep_judge = representative_judge()
     if not rep_judge:
         return JsonResponse(
             {
                 "ok": False,
-                "created": bool(created),
+                "created": False,
                 "message": "Không tìm thấy giám khảo đại diện để gắn phiếu chấm BGD.",
             },
             status=400,
         )
 
-    # Đảm bảo chỉ còn 1 phiếu đại diện:
-    # xoá các phiếu BGD cũ khác rep_judge cho thí sinh/vòng này
-    PhieuChamDiem.objects.filter(
-        thiSinh=thi_sinh,
-        cuocThi=ct,
-        vongThi=vt,
-        baiThi=bai_bgd,
-    ).exclude(giamKhao=rep_judge).delete()
-
-    # Tạo/ cập nhật phiếu chấm đại diện với điểm = TRUNG BÌNH từ BGDScore
-    phieu, phieu_created = PhieuChamDiem.objects.update_or_create(
-        thiSinh=thi_sinh,
-        giamKhao=rep_judge,
-        cuocThi=ct,
-        vongThi=vt,
-        baiThi=bai_bgd,
-        defaults={
-            "maCuocThi": ct.ma,
-            "diem": avg_score,
-            "thoiGian": 0,
-        },
+    # --- 2) DÙNG CHUNG CHO CẢ 2 MODE: lưu điểm thô + cộng vào tổng chạy,
+    #        phiếu đại diện = ĐIỂM TRUNG BÌNH mọi BGD (core/bgd_score.py) ---
+    created, avg_score, bgd_count, phieu_status = record_score(
+        ct, vt, bgd_test(vt), rep_judge, bgd, thi_sinh, diem_int,
     )
 
     return JsonResponse(
@@ -792,7 +633,98 @@ def bgd_save_score(request):
                 "last_bgd_score": diem_int,
                 "avg_score": avg_score,
                 "bgd_count": bgd_count,
-                "phieu_created": phieu_created,
+                "phieu_created": phieu_status == "created",
+            },
+        }
+    )
+
+
+# Số thí sinh tối đa trong 1 lần gửi hàng loạt (Top X thực tế chỉ vài chục)
+BGD_BATCH_MAX = 200
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+def bgd_save_scores(request):
+    """
+    Lưu cùng lúc mọi điểm của 1 BGD trong vòng (trang chấm sao gửi các thí sinh chưa lưu).
+    Body: {"scores": [{"thiSinh_id": "...", "score": 0..100}, ...]}
+    1 transaction: upsert BGDScore hàng loạt, tính lại TB các thí sinh liên quan bằng 1 câu
+    GROUP BY, upsert phiếu đại diện hàng loạt (core/bgd_score.record_scores).
+    Có mục sai / thí sinh không tồn tại -> không lưu mục nào.
+    """
+    try:
+        payload = json.loads(request.body.decode("utf-8"))
+    except Exception:
+        return HttpResponseBadRequest("Invalid JSON")
+
+    items = payload.get("scores") if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        return JsonResponse(
+            {"ok": False, "message": "Thiếu danh sách điểm."},
+            status=400,
+        )
+    if len(items) > BGD_BATCH_MAX:
+        return JsonResponse(
+            {"ok": False, "message": f"Tối đa {BGD_BATCH_MAX} thí sinh mỗi lần lưu."},
+            status=400,
+        )
+
+    raw_scores = {}  # trùng thí sinh: mục sau thắng
+    for item in items:
+        ts_id = item.get("thiSinh_id") if isinstance(item, dict) else None
+        raw_score = item.get("score") if isinstance(item, dict) else None
+        if not ts_id or raw_score is None:
+            return JsonResponse(
+                {"ok": False, "message": "Thiếu thông tin thí sinh hoặc điểm."},
+                status=400,
+            )
+        try:
+            score_val = float(raw_score)
+        except (TypeError, ValueError):
+            return JsonResponse(
+                {"ok": False, "message": f"Điểm không hợp lệ ({ts_id})."},
+                status=400,
+            )
+        # Chỉ cho phép 0..100
+        raw_scores[str(ts_id)] = min(100.0, max(0.0, score_val))
+
+    found = set(ThiSinh.objects.filter(pk__in=raw_scores).values_list("pk", flat=True))
+    missing = sorted(set(raw_scores) - found)
+    if missing:
+        return JsonResponse(
+            {"ok": False, "message": f"Không tìm thấy thí sinh: {', '.join(missing)}."},
+            status=404,
+        )
+
+    ctx, error = _bgd_score_context(request)
+    if error:
+        return error
+    bgd, ct, vt, mode = ctx
+
+    rep_judge = representative_judge()
+    if not rep_judge:
+        return JsonResponse(
+            {"ok": False, "message": "Không tìm thấy giám khảo đại diện để gắn phiếu chấm BGD."},
+            status=400,
+        )
+
+    scores = {ts_id: normalize_score(v, mode) for ts_id, v in raw_scores.items()}
+    results = record_scores(ct, vt, bgd_test(vt), rep_judge, bgd, scores)
+
+    return JsonResponse(
+        {
+            "ok": True,
+            "mode": mode,
+            "message": f"Đã lưu điểm BGD cho {len(results)} thí sinh.",
+            "results": {
+                ts_id: {
+                    "created": created,
+                    "score": scores[ts_id],
+                    "avg_score": avg_score,
+                    "bgd_count": bgd_count,
+                }
+                for ts_id, (created, avg_score, bgd_count, _) in results.items()
             },
         }
     )
@@ -0,0 +1,43 @@
+import asyncio
+
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+
+from .events import contest_channel, format_sse, hub
+from .models import CuocThi
+
+# Gửi comment giữ kết nối (proxy hay cắt kết nối im lặng quá lâu)
+KEEPALIVE_SECONDS = 15
+
+
+async def contest_events_view(request, ct_id: int):
+    """
+    GET /events/<ct_id>/  (text/event-stream, cần chạy ASGI)
+
+    Các event:
+      score -> {"maNV", "version"}            bảng xếp hạng của thí sinh vừa đổi
+      pair  -> {"pair_id"}                     cấu hình cặp đấu đổi
+    """
+    if not isinstance(request, ASGIRequest):
+        # WSGI (runserver / gunicorn sync) không giữ được stream async:
+        # 204 -> EventSource dừng kết nối lại, màn hình dùng cơ chế đồng bộ cũ
+        return HttpResponse(status=204)
+
+    if not await CuocThi.objects.filter(pk=ct_id).aexists():
+        return JsonResponse({"ok": False, "message": "Không tìm thấy cuộc thi."}, status=404)
+
+    async def stream():
+        with hub.subscribe(contest_channel(ct_id)) as sub:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    msg = await sub.get(timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                yield format_sse(msg)
+
+    resp = StreamingHttpResponse(stream(), content_type="text/event-stream")
+    resp["Cache-Control"] = "no-cache"
+    resp["X-Accel-Buffering"] = "no"  # nginx: không buffer stream
+    return resp
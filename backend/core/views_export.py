@@ -7,6 +7,7 @@ from decimal import Decimal, ROUND_HALF_UP
 from openpyxl.styles import Alignment, Font, PatternFill, Border, Side  # <- thêm Border, Side
 from .models import CuocThi, VongThi, BaiThi, ThiSinh, PhieuChamDiem
 from .models import SpecialRoundPairMember
+from .score_matrix import ContestScoreMatrix
 
 # --- helpers cho thời gian ---
 def _pick_time_value(obj):
@@ -97,28 +98,16 @@ def _flatten(ct: CuocThi):
     # Header đầy đủ
     columns = ['STT', 'Mã NV', 'Họ tên'] + info_titles + titles_per_exam + ['Tổng', 'Tổng thời gian']
 
-    # ==== Map điểm trung bình theo (maNV, baiThi_id)
-    score_qs = (
-        PhieuChamDiem.objects
-        .filter(cuocThi=ct)
-        .values("thiSinh__maNV", "baiThi_id")
-        .annotate(avg=Avg("diem"))
-    )
-    score_map = {(r["thiSinh__maNV"], r["baiThi_id"]): (float(r["avg"]) if r["avg"] is not None else "") for r in score_qs}
-
-    # ==== Map thời gian ưu tiên MIN theo (maNV, baiThi_id)
-    all_phieu = list(PhieuChamDiem.objects.filter(cuocThi=ct).select_related("thiSinh", "baiThi"))
-    time_map = {}
-    for p in all_phieu:
-        key = (getattr(p.thiSinh, "maNV", None), getattr(p.baiThi, "id", None))
-        if key[0] is None or key[1] is None:
-            continue
-        t = _pick_time_value(p)  # giây hoặc None
-        if t is None:
-            continue
-        cur = time_map.get(key)
-        if (cur is None) or (t < cur):
-            time_map[key] = t
+    # ==== Điểm TB + thời gian MIN theo (maNV, baiThi_id): ma trận điểm dùng chung
+    matrix = ContestScoreMatrix.for_contest(ct)
+
+    def _score_at(ma, bt_id):
+        v = matrix.value("avg", ma, bt_id)
+        return "" if v is None else v
+
+    def _time_at(ma, bt_id):
+        v = matrix.value("t_min", ma, bt_id)
+        return None if v is None else int(round(v))
 
     ts_qs = ThiSinh.objects.filter(cuocThi=ct).order_by("maNV").distinct()
     def _sv(x): return "" if x is None else str(x)
@@ -177,12 +166,12 @@ def _flatten(ct: CuocThi):
 
         # Vừa build row, vừa tính tổng
         for bt_id in bt_ids_in_order:
-            sc = score_map.get((ts.maNV, bt_id), "")
+            sc = _score_at(ts.maNV, bt_id)
             row.append(sc)
             if isinstance(sc, (int, float, Decimal)):
                 total_score += float(sc)
 
-            tm_seconds = time_map.get((ts.maNV, bt_id))
+            tm_seconds = _time_at(ts.maNV, bt_id)
             row.append(_fmt_mmss(tm_seconds))
             if tm_seconds is not None:
                 has_any_time = True
@@ -203,7 +192,7 @@ def _flatten(ct: CuocThi):
 
         if ts.maNV in special_members_ma and bt_special_ids:
             for bt_id in bt_special_ids:
-                sc_sp = score_map.get((ts.maNV, bt_id), "")
+                sc_sp = _score_at(ts.maNV, bt_id)
                 if isinstance(sc_sp, (int, float, Decimal)):
                     sp_has_score = True
                     sp_total += float(sc_sp)
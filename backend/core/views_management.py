@@ -3,32 +3,44 @@ from django.db.models import Avg, Count, Q
 from core.models import CuocThi, VongThi, BaiThi, ThiSinh, PhieuChamDiem
 from core.decorators import judge_required
 from core.views_ranking import _score_type
+from core.score_matrix import ContestScoreMatrix, score_bands
+import numpy as np
 # --- thêm import ở đầu file
 from django.http import JsonResponse
-from django.views.decorators.http import require_http_methods
-from django.core.cache import cache
+from django.views.decorators.http import require_http_methods, condition
+from django.utils.cache import patch_cache_control
+from core.shared_cache import RANKING_STATE_KEY, get_flag, set_flag, ranking_enabled
 import json
 
-RANKING_STATE_KEY = "ranking_enabled"  # True = mở, False = tắt
 
+def _ranking_state_etag(request):
+    enabled, stamp = get_flag(RANKING_STATE_KEY, True)
+    return f"rs-{int(bool(enabled))}-{stamp}"
+
+
+@judge_required
 @require_http_methods(["GET", "POST"])
+@condition(etag_func=_ranking_state_etag)
 def ranking_state(request):
     """
-    GET  -> {"enabled": true|false}
+    GET  -> {"enabled": true|false}   (có ETag: client gửi If-None-Match -> 304)
     POST -> body JSON {"enabled": true|false} -> lưu và trả lại trạng thái
+    Trạng thái lưu ở bảng RuntimeFlag, đọc qua cache dùng chung nên mọi worker thấy như nhau.
     """
     if request.method == "GET":
-        enabled = cache.get(RANKING_STATE_KEY, True)
-        return JsonResponse({"enabled": bool(enabled)})
+        resp = JsonResponse({"enabled": ranking_enabled()})
+        patch_cache_control(resp, private=True, no_cache=True)
+        return resp
 
     try:
         data = json.loads(request.body or "{}")
     except Exception:
         data = {}
     enabled = bool(data.get("enabled", True))
-    cache.set(RANKING_STATE_KEY, enabled, None)
+    set_flag(RANKING_STATE_KEY, enabled)
     return JsonResponse({"enabled": enabled})
 
+
 @judge_required
 def management_view(request):
     # A — Lấy danh sách cuộc thi đang hoạt động
@@ -66,44 +78,33 @@ def management_view(request):
         columns.append({"id": b.id, "code": b.ma, "title": f"{b.vongThi.tenVongThi} – {b.tenBaiThi}", "max": b_max})
         total_max += b_max
 
-    scores_qs = (
-        PhieuChamDiem.objects.filter(cuocThi=ct, baiThi_id__in=[b["id"] for b in columns])
-        .values("thiSinh__maNV", "baiThi_id")
-        .annotate(avg=Avg("diem"))
-    )
-    score_map = {(r["thiSinh__maNV"], r["baiThi_id"]): float(r["avg"]) for r in scores_qs}
+    # Điểm TB theo (thí sinh, bài) lấy từ ma trận điểm dùng chung
+    matrix = ContestScoreMatrix.for_contest(ct)
+    col_ids = [b["id"] for b in columns]
+    cols = matrix.columns(tests=col_ids)
 
-    ts_qs = (
-        ThiSinh.objects.filter(cuocThi=ct)
-        .order_by("maNV")
-        .distinct()
-    )
+    ts_map = {
+        ts.maNV: ts
+        for ts in ThiSinh.objects.filter(cuocThi=ct).distinct()
+    }
+    in_contest = np.array([ma in ts_map for ma in matrix.ts_ids], dtype=bool)
+    totals = matrix.totals("avg", cols)
 
     rows = []
-    for ts in ts_qs:
-        row_scores, total = [], 0.0
-        for col in columns:
-            val = score_map.get((ts.maNV, col["id"]), 0.0)
-            row_scores.append(val)
-            total += val
-        rows.append({"maNV": ts.maNV, "hoTen": ts.hoTen, "donVi": ts.donVi or "", "scores": row_scores, "total": total})
-
-    rows.sort(key=lambda r: (-r["total"], r["maNV"]))
-
-    # G — Điểm trung bình (bỏ người không thi)
-    valid_rows = [r for r in rows if r["total"] > 0]
-    avg_score = sum(r["total"] for r in valid_rows) / len(valid_rows) if valid_rows else 0
-
-    # B — Phân bố điểm
-    score_ranges = {"100-90": 0, "89-60": 0, "59-0": 0}
-    for r in valid_rows:
-        avg = r["total"] / total_max * 100 if total_max > 0 else 0
-        if avg >= 90:
-            score_ranges["100-90"] += 1
-        elif avg >= 60:
-            score_ranges["89-60"] += 1
-        else:
-            score_ranges["59-0"] += 1
+    # tổng ↓, mã NV ↑
+    for i in matrix.order(totals, rows=in_contest):
+        ma = matrix.ts_ids[i]
+        ts = ts_map[ma]
+        rows.append({
+            "maNV": ma,
+            "hoTen": ts.hoTen,
+            "donVi": ts.donVi or "",
+            "scores": matrix.row_values("avg", ma, col_ids),
+            "total": float(totals[i]),
+        })
+
+    # G — Điểm trung bình (bỏ người không thi) + B — Phân bố điểm
+    avg_score, score_ranges = score_bands(totals[in_contest], total_max)
 
     range_total = sum(score_ranges.values()) or 1
     sr_pcts = {
@@ -129,22 +130,3 @@ def management_view(request):
         "sr_pcts": sr_pcts,
         "active_contests": active_contests,
     })
-
-@judge_required
-@require_http_methods(["GET", "POST"])
-def ranking_state(request):
-    """
-    GET  -> {"enabled": true|false}
-    POST -> body JSON {"enabled": true|false} -> lưu và trả lại trạng thái
-    """
-    if request.method == "GET":
-        enabled = cache.get(RANKING_STATE_KEY, True)
-        return JsonResponse({"enabled": bool(enabled)})
-
-    try:
-        data = json.loads(request.body or "{}")
-    except Exception:
-        data = {}
-    enabled = bool(data.get("enabled", True))
-    cache.set(RANKING_STATE_KEY, enabled, None)
-    return JsonResponse({"enabled": enabled})
@@ -6,6 +6,10 @@ from django.http import JsonResponse, QueryDict
 import json
 from .models import CuocThi, VongThi, BaiThi, BaiThiTimeRule, BaiThiTemplateSection, BaiThiTemplateItem, GiamKhao, GiamKhaoBaiThi
 from django.db.models import Avg, Min
+from .score_matrix import ContestScoreMatrix
+from .time_rules import rescore_time_test
+from .bgd_top import clear_top, lock_top
+from .invalidation import bus, structure_key
 from .models import (
     CuocThi,
     VongThi,
@@ -177,9 +181,33 @@ def organize_view(request, ct_id=None):
                 vt.bgd_top_limit = top_limit
                 vt.save(update_fields=["is_bgd_round", "bgd_top_limit"])
 
+                # Bắt đầu lấy Top = chốt Top X ngay lúc này; tắt BGD thì bỏ danh sách đã chốt
+                if is_on:
+                    n = lock_top(vt.cuocThi, vt)
+                    messages.success(
+                        request,
+                        f"Đã cập nhật chế độ BGD cho vòng “{vt.tenVongThi}” và chốt Top {top_limit} ({n} thí sinh)."
+                    )
+                else:
+                    clear_top(vt)
+                    messages.success(
+                        request,
+                        f"Đã cập nhật chế độ BGD cho vòng “{vt.tenVongThi}”."
+                    )
+                return redirect(request.path)
+
+            # Tính lại Top X đã chốt của vòng BGD (khi điểm vòng trước thay đổi)
+            if action == "lock_vt_bgd_top":
+                vt_id = request.POST.get("vongThi_id")
+                vt = VongThi.objects.select_related("cuocThi").filter(id=vt_id, is_bgd_round=True).first()
+                if not vt:
+                    messages.error(request, "Vòng thi BGD không tồn tại.")
+                    return redirect(request.path)
+
+                n = lock_top(vt.cuocThi, vt)
                 messages.success(
                     request,
-                    f"Đã cập nhật chế độ BGD cho vòng “{vt.tenVongThi}”."
+                    f"Đã tính lại Top {vt.bgd_top_limit} cho vòng “{vt.tenVongThi}” ({n} thí sinh)."
                 )
                 return redirect(request.path)
 
@@ -206,49 +234,15 @@ def organize_view(request, ct_id=None):
                 # Tìm vòng trước trong cùng Cuộc Thi
 
 
-                score_qs = (
-                    PhieuChamDiem.objects
-                    .filter(cuocThi=vt.cuocThi)
-                    .exclude(vongThi__is_special_bonus_round=True)
-                    .values("thiSinh_id", "baiThi_id")
-                    .annotate(avg=Avg("diem"))
-                )
-
-                total_by_id = {}
-                for r in score_qs:
-                    tid = r["thiSinh_id"]
-                    total_by_id[tid] = total_by_id.get(tid, 0.0) + float(r["avg"] or 0.0)
-
-                time_bt_qs = (
-                    PhieuChamDiem.objects
-                    .filter(cuocThi=vt.cuocThi)
-                    .exclude(vongThi__is_special_bonus_round=True)
-                    .values("thiSinh_id", "baiThi_id")
-                    .annotate(min_time=Min("thoiGian"))
-                )
-
-                total_time_by_id = {}
-                has_time_by_id = {}
-                for r in time_bt_qs:
-                    tid = r["thiSinh_id"]
-                    sec = r["min_time"]
-                    if sec is None:
-                        continue
-                    total_time_by_id[tid] = total_time_by_id.get(tid, 0) + int(sec)
-                    has_time_by_id[tid] = True
-
-                ranked = [
-                    {
-                        "thiSinh": tid,
-                        "total_diem": total,
-                        "total_time_sec": (total_time_by_id.get(tid) if has_time_by_id.get(tid) else None),
-                    }
-                    for tid, total in total_by_id.items()
-                ]
-                ranked.sort(
-                    key=lambda x: (-x["total_diem"], x["total_time_sec"] is None, x["total_time_sec"], x["thiSinh"])
+                # Tổng TB theo bài + tổng thời gian (MIN mỗi bài), bỏ các vòng đặc biệt
+                matrix = ContestScoreMatrix.for_contest(vt.cuocThi)
+                cols = matrix.columns(special=False)
+                ranked = matrix.order(
+                    matrix.totals("avg", cols),
+                    matrix.time_totals("t_min", cols),
+                    rows=matrix.has_scores(cols),
                 )
-                s_ids = [r["thiSinh"] for r in ranked[:20]]
+                s_ids = [matrix.ts_ids[i] for i in ranked[:20]]
 
 
                 if len(s_ids) < 2:
@@ -345,24 +339,31 @@ def organize_view(request, ct_id=None):
             # --------------------------------------------------
             # Lưu cấu hình thang thời gian (từ popup TIME)
             # --------------------------------------------------
-            if action == "config_time_rules":
+            if action in ("config_time_rules", "time_rules_preview"):
                 import json
+                preview = action == "time_rules_preview"
                 btid = request.POST.get("baiThi_id")
                 raw = request.POST.get("time_rules_json") or "[]"
 
                 try:
-                    bt = BaiThi.objects.get(id=btid)
+                    bt = BaiThi.objects.select_related("vongThi").get(id=btid)
                 except BaiThi.DoesNotExist:
+                    if preview:
+                        return JsonResponse({"ok": False, "error": "Bài thi không tồn tại."}, status=404)
                     messages.error(request, "Bài thi không tồn tại.")
                     return redirect(request.path)
 
                 if bt.phuongThucCham != "TIME":
+                    if preview:
+                        return JsonResponse({"ok": False, "error": "Bài thi này không dùng phương thức chấm theo thời gian."}, status=400)
                     messages.error(request, "Bài thi này không dùng phương thức chấm theo thời gian.")
                     return redirect(request.path)
 
                 try:
                     rows = json.loads(raw)
                 except Exception:
+                    if preview:
+                        return JsonResponse({"ok": False, "error": "Dữ liệu cấu hình không hợp lệ."}, status=400)
                     messages.error(request, "Dữ liệu cấu hình không hợp lệ.")
                     return redirect(request.path)
 
@@ -379,6 +380,14 @@ def organize_view(request, ct_id=None):
                         continue
                     cleaned.append((s, e, sc))
 
+                # Vòng đặc biệt: điểm người thua đã bị đặt 0 theo cặp -> không chấm lại tự động
+                rescore = not bt.vongThi.is_special_bonus_round
+
+                if preview:
+                    # Chỉ xem trước (KHÔNG lưu): bao nhiêu phiếu / thứ hạng sẽ đổi với thang mới
+                    summary = rescore_time_test(bt, cleaned) if rescore else None
+                    return JsonResponse({"ok": True, "rescore": rescore, **(summary or {})})
+
                 from django.db import transaction
                 with transaction.atomic():
                     bt.time_rules.all().delete()
@@ -386,8 +395,18 @@ def organize_view(request, ct_id=None):
                         BaiThiTimeRule(baiThi=bt, start_seconds=s, end_seconds=e, score=sc)
                         for (s, e, sc) in cleaned
                     ])
-
-                messages.success(request, f"Đã lưu {len(cleaned)} dòng thang thời gian cho {bt.ma}.")
+                    # bulk_create không bắn signal -> tự báo cấu trúc cuộc thi đã đổi
+                    bus.bump(structure_key(bt.vongThi.cuocThi_id))
+                    # Phiếu đã chấm theo thang cũ -> tính lại theo thang mới
+                    summary = rescore_time_test(bt, cleaned, apply=True) if rescore else None
+
+                msg = f"Đã lưu {len(cleaned)} dòng thang thời gian cho {bt.ma}."
+                if summary and summary["changed"]:
+                    msg += (
+                        f" Chấm lại {summary['changed']}/{summary['rows']} phiếu,"
+                        f" {summary['ranks_changed']} thí sinh đổi hạng."
+                    )
+                messages.success(request, msg)
                 return redirect(request.path)
 
             # --------------------------------------------------
@@ -537,6 +556,7 @@ def organize_view(request, ct_id=None):
                             )
                         )
                     BaiThiTemplateItem.objects.bulk_create(items_to_create)
+                    bus.bump(structure_key(bt.vongThi.cuocThi_id))
 
 
                 messages.success(
@@ -748,6 +768,7 @@ def organize_view(request, ct_id=None):
         Prefetch(
             "vong_thi",
             queryset=VongThi.objects.prefetch_related(
+                "bgd_top",
                 "bai_thi__time_rules",
                 "bai_thi__template_sections__items",
                 Prefetch(
@@ -1,8 +1,20 @@
+import hashlib
+import json
+
 from django.shortcuts import render
-from django.db.models import Avg
-from .models import CuocThi, VongThi, BaiThi, ThiSinh, PhieuChamDiem
-from django.db.models import Q
-from django.core.cache import cache
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+from .models import CuocThi, VongThi, BaiThi, ContestStanding
+from .search import fold_text
+from .shared_cache import ranking_enabled, get_or_set
+from .standings import (
+    ranked_standings, standings_page,
+    rebuild_contest_standings, contest_has_data, standings_signature,
+)
+# Số dòng tối đa mỗi trang của /ranking/api/?limit=
+PAGE_LIMIT_MAX = 200
+
+
 def _score_type(bt) -> str:
     v = getattr(bt, "phuongThucCham", None)
     if v is None:
@@ -12,52 +24,19 @@ def _score_type(bt) -> str:
         return "TIME"
     return "POINTS"
 
-def ranking_view(request):
-    # Fallback server-side: nếu tắt, render trang thông báo
-    if not cache.get("ranking_enabled", True):
-        return render(request, "ranking/disabled.html", {
-            "title": "Xếp hạng — đang tắt",
-        })
-
-    ct_id = request.GET.get("ct")
-    # ===== Lọc theo tên & đơn vị (dùng nút trượt) =====
-    ten = (request.GET.get("ten") or "").strip()
-    don_vi = (request.GET.get("don_vi") or "").strip()
-    use_filter = request.GET.get("use_filter") == "1"
-    # ten / don_vi luôn giữ để hiển thị lại trong ô input
-    # chỉ khi use_filter = True mới áp vào query
-    # ================================================
-
-    # ================================
-
-    cuoc_this = CuocThi.objects.filter(trangThai=True).order_by("-id")
-
-    if not cuoc_this.exists():
-        return render(request, "ranking/index.html", {
-            "cuoc_this": cuoc_this, "selected_ct": None,
-            "groups": [], "rows": [], "total_max": 0,
-            "title": "Xếp hạng theo Cuộc thi",
-            "filter_name": ten,
-            "filter_unit": don_vi,
-            "is_filtered": False,
-        })
-
-
-    selected_ct = cuoc_this.filter(id=ct_id).first() if ct_id else None
-    if selected_ct is None:
-        selected_ct = cuoc_this.first()
-
-    # 2) Lấy vòng + bài
-    vongs = list(VongThi.objects.filter(cuocThi=selected_ct).order_by("id"))
+def _build_groups(ct):
+    """
+    Cấu trúc cột của bảng xếp hạng: danh sách vòng, mỗi vòng gồm các bài thi.
+    Trả về (groups, total_max).
+    """
+    vongs = list(VongThi.objects.filter(cuocThi=ct).order_by("id"))
     bai_list = (
         BaiThi.objects.filter(vongThi__in=vongs)
         .select_related("vongThi").prefetch_related("time_rules")
         .order_by("vongThi_id", "id")
     )
 
-    # Gom theo vòng
     groups = []
-    group_index_by_vong = {}
     running_test_index = 0
     total_max = 0
 
@@ -81,7 +60,6 @@ def ranking_view(request):
             g_max += (b_max or 0)
 
         if tests:
-            group_index_by_vong[vt.id] = len(groups)
             groups.append({
                 "vong_id": vt.id,
                 "vong_name": vt.tenVongThi,
@@ -90,113 +68,108 @@ def ranking_view(request):
             })
             total_max += g_max
 
-    # === (MỚI) Tính tổng thời gian SAU khi đã có toàn bộ groups/bai_list ===
-    time_test_ids = [b.id for b in bai_list if _score_type(b) == "TIME"]
+    return groups, total_max
 
-    time_sum_map = {}
-    if time_test_ids:
-        time_qs = (
-            PhieuChamDiem.objects
-            .filter(cuocThi=selected_ct, baiThi_id__in=time_test_ids)
-            .values("thiSinh__maNV", "baiThi_id")
-            .annotate(t_avg=Avg("thoiGian"))   # đổi tên field nếu DB bạn khác
-        )
-        for r in time_qs:
-            if r["t_avg"] is None:
-                continue
-            key = r["thiSinh__maNV"]
-            time_sum_map[key] = time_sum_map.get(key, 0.0) + float(r["t_avg"])
 
-    # 3) Map điểm
-    all_test_ids = [t["id"] for g in groups for t in g["tests"]]
-    score_qs = list(
-        PhieuChamDiem.objects
-        .filter(cuocThi=selected_ct, baiThi_id__in=all_test_ids)
-        .values("thiSinh__maNV", "baiThi_id")
-        .annotate(avg=Avg("diem"))
+def _groups_schema(groups) -> str:
+    """
+    Mã ngắn đại diện cho cấu trúc cột (vòng/bài/điểm tối đa/tiêu đề).
+    Client so sánh với mã đang giữ: khác nhau -> header đã đổi, phải tải lại trang.
+    """
+    raw = json.dumps(
+        [[g["vong_id"], g["vong_name"], [[t["id"], t["title"], t["max"]] for t in g["tests"]]] for g in groups],
+        ensure_ascii=False, default=str,
     )
-    score_map = {(r["thiSinh__maNV"], r["baiThi_id"]): float(r["avg"]) for r in score_qs}
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
 
-    # Đếm số bài thi đã được chấm của từng thí sinh
-    # (mỗi cặp thí sinh–bài thi tính 1 lần)
-    done_count_map = {}
-    for r in score_qs:
-        key = r["thiSinh__maNV"]
-        done_count_map[key] = done_count_map.get(key, 0) + 1
 
-    total_tests = len(all_test_ids)
+def _standing_row(st, groups, total_tests):
+    """1 dòng ContestStanding -> dict hiển thị (dùng chung cho trang HTML và API)."""
+    ts = st.thiSinh
+    per_test = st.per_test or {}
+    groups_view = []
+    for g in groups:
+        g_scores = [float(per_test.get(str(t["id"]), 0.0)) for t in g["tests"]]
+        groups_view.append({"scores": g_scores, "total": sum(g_scores)})
 
-    # 4) Thí sinh
-    ts_m2m = ThiSinh.objects.filter(cuocThi=selected_ct)
-    ts_scored = ThiSinh.objects.filter(phieuchamdiem__cuocThi=selected_ct)
-    ts_qs_base = (
-        ThiSinh.objects
-        .filter(Q(pk__in=ts_m2m.values("pk")) | Q(pk__in=ts_scored.values("pk")))
-        .distinct().order_by("maNV")
-    )
+    return {
+        "maNV": ts.maNV,
+        "hoTen": ts.hoTen,
+        "donVi": ts.donVi or "",
+        "groups_view": groups_view,
+        "total": st.total,
+        "total_time": st.total_time,  # None nếu không có TIME
+        "done": st.done,
+        "total_tests": total_tests,
+    }
+
+
+def ranking_view(request):
+    # Fallback server-side: nếu tắt, render trang thông báo
+    if not ranking_enabled():
+        return render(request, "ranking/disabled.html", {
+            "title": "Xếp hạng — đang tắt",
+        })
 
-    # 4.1. Tạo LIST đầy đủ cho tất cả thí sinh (không lọc)
-    rows_all = []
-    for ts in ts_qs_base:
-        groups_view = []
-        total_sum = 0.0
-        for g in groups:
-            g_scores = []
-            g_sum = 0.0
-            for t in g["tests"]:
-                val = score_map.get((ts.maNV, t["id"]), 0.0)
-                g_scores.append(val)
-                g_sum += val
-            groups_view.append({"scores": g_scores, "total": g_sum})
-            total_sum += g_sum
-
-        done = done_count_map.get(ts.maNV, 0)
-
-        rows_all.append({
-            "maNV": ts.maNV,
-            "hoTen": ts.hoTen,
-            "donVi": ts.donVi or "",
-            "groups_view": groups_view,
-            "total": total_sum,
-            "total_time": time_sum_map.get(ts.maNV),  # None nếu không có TIME
-            "done": done,
-            "total_tests": total_tests,
+    ct_id = request.GET.get("ct")
+    # ===== Lọc theo tên & đơn vị (dùng nút trượt) =====
+    ten = (request.GET.get("ten") or "").strip()
+    don_vi = (request.GET.get("don_vi") or "").strip()
+    use_filter = request.GET.get("use_filter") == "1"
+    # ten / don_vi luôn giữ để hiển thị lại trong ô input
+    # chỉ khi use_filter = True mới áp vào query
+    # ================================================
+
+    # ================================
+
+    cuoc_this = CuocThi.objects.filter(trangThai=True).order_by("-id")
+
+    if not cuoc_this.exists():
+        return render(request, "ranking/index.html", {
+            "cuoc_this": cuoc_this, "selected_ct": None,
+            "groups": [], "rows": [], "total_max": 0,
+            "title": "Xếp hạng theo Cuộc thi",
+            "filter_name": ten,
+            "filter_unit": don_vi,
+            "is_filtered": False,
         })
 
-    # Sort: điểm ↓, tổng thời gian ↑ (nếu có), mã NV ↑
-    def _row_sort_key(r):
-        total = r["total"]
-        t = r.get("total_time")
-        t_key = t if t is not None else float("inf")
-        return (-total, t_key, r["maNV"])
-
-    rows_all.sort(key=_row_sort_key)
-
-    # 4.2. Gán RANK GLOBAL cho toàn bộ list
-    for idx, r in enumerate(rows_all, start=1):
-        r["rank"] = idx
-
-    # 4.3. Áp điều kiện lọc TRÊN LIST (không thay đổi rank)
-    ten_filter = ten if use_filter else ""
-    don_vi_filter = don_vi if use_filter else ""
-
-    if use_filter and (ten_filter or don_vi_filter):
-        lf = ten_filter.lower()
-        lu = don_vi_filter.lower()
-
-        def _match(row):
-            ok = True
-            if lf:
-                ok = ok and (lf in (row["hoTen"] or "").lower())
-            if lu:
-                ok = ok and (lu in (row["donVi"] or "").lower())
-            return ok
-
-        rows = [r for r in rows_all if _match(r)]
-        is_filtered = True
-    else:
-        rows = rows_all
-        is_filtered = False
+
+    selected_ct = cuoc_this.filter(id=ct_id).first() if ct_id else None
+    if selected_ct is None:
+        selected_ct = cuoc_this.first()
+
+    # 2) Lấy vòng + bài, gom theo vòng
+    groups, total_max = _build_groups(selected_ct)
+
+    all_test_ids = [t["id"] for g in groups for t in g["tests"]]
+    total_tests = len(all_test_ids)
+
+    # 3) Đọc bảng xếp hạng tính sẵn (ContestStanding), hạng tính bằng RANK() trong SQL:
+    #    điểm ↓, tổng thời gian ↑ (None xuống cuối), mã NV ↑. Đồng điểm & đồng thời gian
+    #    -> cùng hạng (giống /ranking/api/), thứ tự trong nhóm đồng hạng theo mã NV.
+    if not ContestStanding.objects.filter(cuocThi=selected_ct).exists() and contest_has_data(selected_ct):
+        # Chưa có dòng nào mà đã có dữ liệu (dữ liệu cũ đã được migration 0003 dựng sẵn;
+        # còn lại là dữ liệu ghi lách signal) -> dựng lại 1 lần
+        rebuild_contest_standings(selected_ct)
+
+    # Lọc theo tên (không dấu trên search_key: "nguyen" khớp "Nguyễn") / đơn vị chạy trong SQL,
+    # sau khi xếp hạng -> không đổi hạng, chỉ đọc các dòng khớp
+    is_filtered = use_filter and bool(ten or don_vi)
+    standings = ranked_standings(
+        selected_ct,
+        name=fold_text(ten) if is_filtered else None,
+        unit=don_vi if is_filtered else None,
+    )
+
+    rows = []
+    standing_version = 0
+    for st in standings:
+        row = _standing_row(st, groups, total_tests)
+        row["rank"] = st.rank
+        rows.append(row)
+        # version lấy theo đúng các dòng vừa đọc: client gửi lại làm ?since=
+        standing_version = max(standing_version, st.version)
 
     return render(request, "ranking/index.html", {
         "cuoc_this": cuoc_this,
@@ -208,7 +181,108 @@ def ranking_view(request):
         "filter_name": ten,
         "filter_unit": don_vi,
         "is_filtered": is_filtered,
+        "standing_version": standing_version,
+        "schema": _groups_schema(groups),
     })
 
 
+def _api_row(st, groups, total_tests):
+    row = _standing_row(st, groups, total_tests)
+    return {
+        "maNV": row["maNV"],
+        "hoTen": row["hoTen"],
+        "donVi": row["donVi"],
+        "groups": row["groups_view"],
+        "total": row["total"],
+        "total_time": row["total_time"],
+        "done": row["done"],
+        "total_tests": row["total_tests"],
+    }
+
+
+def _int_param(request, name, default):
+    try:
+        return int(request.GET.get(name) or default)
+    except ValueError:
+        return default
+
 
+@require_GET
+def ranking_api_view(request):
+    """
+    API cho màn hình xếp hạng tự cập nhật (ranking.js), thay cho reload cả trang.
+
+    1) Delta: GET /ranking/api/?ct=<id>&since=<version>&n=<số dòng client đang có>
+       -> {
+            ok, enabled, ct, version, schema,
+            rows:  [các dòng có version > since],
+            order: [maNV theo thứ tự xếp hạng],   # chỉ gửi khi thứ tự có thể đã đổi
+            ranks: [hạng tương ứng từng phần tử của order]
+          }
+       since=0 (hoặc bỏ trống) -> trả toàn bộ.
+
+    2) Phân trang: GET /ranking/api/?ct=<id>&limit=50&after=<cursor>
+       -> {ok, enabled, ct, version, schema, rows: [.. kèm rank, pos], next: cursor | null}
+       cursor là chuỗi mờ (khoá sắp xếp của dòng cuối trang), gửi lại nguyên văn làm ?after=.
+       Hạng là hạng toàn cuộc thi; mỗi trang = 1 câu keyset + 1 câu đếm hạng dòng đầu.
+    """
+    if not ranking_enabled():
+        return JsonResponse({"ok": True, "enabled": False})
+
+    ct = CuocThi.objects.filter(trangThai=True, id=request.GET.get("ct") or 0).first()
+    if ct is None:
+        return JsonResponse({"ok": False, "message": "Không tìm thấy cuộc thi."}, status=404)
+
+    groups, _ = _build_groups(ct)
+    total_tests = sum(len(g["tests"]) for g in groups)
+
+    version, count = standings_signature(ct)
+    if count == 0 and contest_has_data(ct):
+        # như ranking_view: cuộc thi chưa có dòng nào (migration 0003 đã dựng sẵn dữ liệu cũ)
+        rebuild_contest_standings(ct)
+        version, count = standings_signature(ct)
+
+    data = {
+        "ok": True,
+        "enabled": True,
+        "ct": ct.id,
+        "version": version,
+        "schema": _groups_schema(groups),
+        "rows": [],
+    }
+
+    if request.GET.get("limit"):
+        limit = min(max(_int_param(request, "limit", 50), 1), PAGE_LIMIT_MAX)
+        after = request.GET.get("after") or None
+        page, next_after = standings_page(ct, after=after, limit=limit)
+        for st in page:
+            row = _api_row(st, groups, total_tests)
+            row["rank"] = st.rank
+            row["pos"] = st.pos
+            data["rows"].append(row)
+        data["next"] = next_after
+        return JsonResponse(data)
+
+    since = _int_param(request, "since", 0)
+    known = _int_param(request, "n", -1)
+
+    changed = []
+    if version > since:
+        changed = list(
+            ContestStanding.objects
+            .filter(cuocThi=ct, version__gt=since)
+            .select_related("thiSinh")
+        )
+    data["rows"] = [_api_row(st, groups, total_tests) for st in changed]
+
+    # Thứ tự + hạng: 1 câu đọc (mã NV, RANK()) trên index xếp hạng,
+    # dùng chung giữa mọi màn hình / worker cho tới khi bảng xếp hạng đổi
+    ranked = get_or_set(
+        f"ranking:order:{ct.id}:{version}:{count}",
+        lambda: list(ranked_standings(ct).values_list("thiSinh_id", "rank")),
+    )
+    # Có dòng đổi hoặc số dòng lệch (thí sinh bị xoá khỏi cuộc thi) -> gửi thứ tự mới
+    if changed or known != len(ranked):
+        data["order"] = [ma for ma, _ in ranked]
+        data["ranks"] = [rank for _, rank in ranked]
+    return JsonResponse(data)
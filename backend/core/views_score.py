@@ -1,10 +1,12 @@
 
 from django.shortcuts import render, get_object_or_404
 from django.http import JsonResponse, HttpResponseBadRequest
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import require_http_methods, condition
+from django.utils.cache import patch_cache_control
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.db import transaction
-from django.db.models import Avg, Q, Max
+from django.utils import timezone
+from django.db.models import Q
 from core.decorators import judge_required
 from .models import (
     CuocThi,
@@ -14,17 +16,19 @@ from .models import (
     GiamKhao,
     PhieuChamDiem,
     ThiSinhCuocThi,
-    BaiThiTemplateItem,
-    BaiThiTemplateSection,
-    GiamKhaoBaiThi,
-    BanGiamDoc,
-    SpecialRoundPairMember,
-    SpecialRoundScoreLog,
-    compute_special_round_pair_result
+    ScoreSubmissionKey,
+    is_bgd_member,
+    is_chung_ket,
 )
+from .contest_schema import contest_schema, score_type
+from .score_write import upsert_sheets
+from .search import contest_suggest_index, fold_text, search_thi_sinh
+from .time_rules import parse_seconds as _parse_seconds
+from .invalidation import LocalCache, bus, judge_key, structure_key
 
 import json
-import unicodedata
+import time
+from datetime import timedelta
 
 BGD_SESSION_KEYS = ("bgd_mode", "bgd_ct_id", "bgd_ct_name", "bgd_token")
 
@@ -110,148 +114,122 @@ def _active_competition():
 
 def _judge_is_admin(judge: GiamKhao | None) -> bool:
     return bool(judge and str(getattr(judge, "role", "")).upper() == "ADMIN")
-def _normalize_no_diacritics(s: str) -> str:
-    """
-    Bỏ dấu + lowercase + bỏ khoảng trắng để so sánh tên cuộc thi.
-    'Chung Kết' -> 'chungket', 'CK' -> 'ck'
-    """
-    if not s:
-        return ""
-    s = unicodedata.normalize("NFD", s)
-    s = "".join(ch for ch in s if unicodedata.category(ch) != "Mn")
-    return s.lower().strip().replace(" ", "")
 
 
-def _is_chung_ket(ct: CuocThi | None) -> bool:
-    """
-    Kiểm tra 1 Cuộc thi có phải 'Chung Kết' / 'Chung Ket' / 'CK' (không phân biệt hoa/thường, có/không dấu).
-    """
-    if not ct:
-        return False
-    norm = _normalize_no_diacritics(getattr(ct, "tenCuocThi", ""))
-    return norm in {"chungket", "ck"}
+# Chỉ mục phân công theo (cuộc thi, giám khảo), bỏ khi phân công / cấu trúc cuộc thi đổi
+_assignments = LocalCache(bus, max_entries=256)
 
 
-def _judge_is_bgd(judge: GiamKhao | None) -> bool:
+def _build_assignment_index(ct_id, judge_id=None):
     """
-    Giám khảo đồng thời là BGD nếu:
-      - có bản ghi BanGiamDoc trùng maBGD = maNV
-      - ưu tiên khớp thêm họ tên (không phân biệt hoa/thường).
+    1 câu cho bài thi + 1 câu cho vòng: {"rounds": [...], "test_ids": set}.
+    rounds: [{"id", "tenVongThi", "tests": [{"id", "ma", "tenBaiThi"}]}] theo thứ tự id.
+    judge_id=None -> mọi bài (ADMIN / BGD); có judge_id -> chỉ bài được phân công,
+    và chỉ các vòng có ít nhất 1 bài.
     """
-    if not judge:
-        return False
-    try:
-        qs = BanGiamDoc.objects.filter(maBGD=judge.maNV)
-        if not qs.exists():
-            return False
-        if qs.filter(ten__iexact=judge.hoTen).exists():
-            return True
-        # fallback: chỉ cần đúng mã
-        return True
-    except Exception:
-        return False
+    bts = BaiThi.objects.filter(vongThi__cuocThi_id=ct_id)
+    if judge_id is not None:
+        bts = bts.filter(giam_khao_duoc_chi_dinh__giamKhao_id=judge_id)
+    by_round = {}
+    for b in bts.order_by("id").values("id", "ma", "tenBaiThi", "vongThi_id"):
+        by_round.setdefault(b.pop("vongThi_id"), []).append(b)
+
+    rounds = []
+    for vt in VongThi.objects.filter(cuocThi_id=ct_id).order_by("id").values("id", "tenVongThi"):
+        tests = by_round.get(vt["id"], [])
+        if tests or judge_id is None:
+            rounds.append({**vt, "tests": tests})
+    return {
+        "rounds": rounds,
+        "test_ids": {t["id"] for r in rounds for t in r["tests"]},
+    }
 
-def _assigned_bai_qs(ct: CuocThi, judge: GiamKhao | None, vt: VongThi | None = None, bgd_active: bool = False):
+
+def _assignment_index(ct: CuocThi | None, judge: GiamKhao | None, bgd_active: bool = False):
     """
-    Trả về queryset BaiThi theo cuộc thi/vòng thi.
+    Vòng → bài thi giám khảo được chấm, cache trong tiến trình.
     - ADMIN: thấy tất cả.
     - BGD: CHỈ khi bgd_active=True (đi từ QR) VÀ cuộc thi là 'Chung Kết' → thấy tất cả.
     - JUDGE thường: chỉ thấy những bài được phân công (GiamKhaoBaiThi).
+    Dùng cho dropdown vòng/bài, form chấm và kiểm tra quyền trước khi lưu.
     """
-    base = BaiThi.objects.filter(vongThi__cuocThi=ct)
-    if vt:
-        base = base.filter(vongThi=vt)
+    if not ct or not judge:
+        return {"rounds": [], "test_ids": set()}
+    sees_all = _judge_is_admin(judge) or (bgd_active and is_bgd_member(judge) and is_chung_ket(ct))
+    if sees_all:
+        return _assignments.get(
+            f"assign:{ct.id}:*", [structure_key(ct.id)],
+            lambda: _build_assignment_index(ct.id),
+        )
+    return _assignments.get(
+        f"assign:{ct.id}:{judge.pk}", [structure_key(ct.id), judge_key(judge.pk)],
+        lambda: _build_assignment_index(ct.id, judge.pk),
+    )
 
-    if not judge:
-        return base.none()
 
-    if _judge_is_admin(judge):
-        return base
+def _round_options(index, judge):
+    """Dropdown vòng: ADMIN thấy mọi vòng, người khác chỉ vòng có bài được chấm."""
+    is_admin = _judge_is_admin(judge)
+    return [
+        {"id": r["id"], "tenVongThi": r["tenVongThi"]}
+        for r in index["rounds"]
+        if r["tests"] or is_admin
+    ]
 
-    # 🔒 Chỉ nới quyền BGD khi vào đúng luồng QR và là cuộc thi Chung Kết
-    if bgd_active and _judge_is_bgd(judge) and _is_chung_ket(ct):
-        return base
 
-    return base.filter(giam_khao_duoc_chi_dinh__giamKhao=judge)
+def _round_tests(index, vt_id):
+    for r in index["rounds"]:
+        if str(r["id"]) == str(vt_id):
+            return list(r["tests"])
+    return []
 
 
 # after
 def _load_form_data(selected_ts, ct, request):
     """
     Trả về (structure, total_max) để render form chấm điểm.
-    structure: [{vong, bai_list:[{id, code, ten, max, type, current}]}]
+    structure: [{vong (dict vòng của contest_schema), bai_list:[{id, code, ten, max, type, current}]}]
     total_max: int
     """
     if not ct:
         return [], 0
     
     judge = _current_judge(request)
-    vongs = list(VongThi.objects.filter(cuocThi=ct).order_by("id"))
     bai_by_vong = []
     total_max = 0
 
-    # điểm hiện có của thí sinh (ưu tiên GK hiện tại)
-    score_map = {}
-    if selected_ts:
-        judge = _current_judge(request)
-        qs = PhieuChamDiem.objects.filter(thiSinh=selected_ts, cuocThi=ct)
-        score_map_avg = {
-            r["baiThi_id"]: float(r["avg"])
-            for r in qs.values("baiThi_id").annotate(avg=Avg("diem"))
-        }
-        score_map_gk = {
-            p.baiThi_id: p.diem
-            for p in qs
-            if judge and p.giamKhao_id == getattr(judge, "pk", None)
-        }
-        score_map.update(score_map_avg)
-        score_map.update(score_map_gk)
+    # điểm hiện có của thí sinh (ưu tiên GK hiện tại), 1 câu
+    sheet = _current_sheet(selected_ts, ct, getattr(judge, "pk", None)) if selected_ts else {}
 
-        time_map = {p.baiThi_id: getattr(p, "thoiGian", 0) for p in qs}
+    # Cấu trúc cuộc thi đã biên dịch (cache, không truy vấn theo từng bài)
+    schema = contest_schema(ct)
+    allowed_ids = _assignment_index(ct, judge, _bgd_active(request))["test_ids"]
 
-    for vt in vongs:
+    for vt in schema.rounds:
         bais = []
-        
-        bgd_on = _bgd_active(request)
-        for bt in (
-            _assigned_bai_qs(ct, judge, vt=vt, bgd_active=bgd_on)
-            .order_by("id")
-            .prefetch_related("time_rules", "template_sections__items")
-        ):
-
-            if _is_time(bt):
-                rules = list(bt.time_rules.all()) if hasattr(bt, "time_rules") else []
-                this_max = 20
-                b_type = "TIME"
-                rules_payload = [{"s": r.start_seconds, "e": r.end_seconds, "score": r.score} for r in rules]
+
+        for t in vt["tests"]:
+            if t["id"] not in allowed_ids:
+                continue
+
+            if t["type"] == "TIME":
+                rules_payload = [{"s": r[0], "e": r[1], "score": r[2]} for r in t["rules"]]
                 rules_json = json.dumps(rules_payload, ensure_ascii=False)
             else:
-                # TEMPLATE: tổng điểm = tổng item.max_score
-                if _is_template(bt):
-                    this_max = sum(
-                        i.max_score
-                        for s in bt.template_sections.all()
-                        for i in s.items.all()
-                    )
-                    b_type = "TEMPLATE"
-                else:  # POINTS
-                    this_max = bt.cachChamDiem
-                    b_type = "POINTS"
                 rules_json = "[]"
 
-
             # ➕ QUAN TRỌNG: cộng vào tổng tối đa
-            total_max += this_max
+            total_max += t["max"]
 
             bais.append({
-                "id": bt.id,
-                "code": bt.ma,
-                "ten": f"{vt.tenVongThi} – {bt.tenBaiThi}",
-                "max": this_max,
-                "type": b_type,
+                "id": t["id"],
+                "code": t["ma"],
+                "ten": f"{vt['tenVongThi']} – {t['tenBaiThi']}",
+                "max": t["max"],
+                "type": t["type"],
                 "rules": rules_json,
-                "current": score_map.get(bt.id, 0.0) if selected_ts else None,
-                "time_current": (time_map.get(bt.id) if selected_ts and _is_time(bt) else None),
+                "current": sheet.get(t["id"], (0.0, None))[0] if selected_ts else None,
+                "time_current": sheet.get(t["id"], (0.0, None))[1] if t["type"] == "TIME" else None,
             })
         bai_by_vong.append({"vong": vt, "bai_list": bais})
 
@@ -259,68 +237,74 @@ def _load_form_data(selected_ts, ct, request):
     # 🔒 luôn trả về tuple
     return bai_by_vong, total_max
 
+def _current_sheet(thi_sinh, ct, judge_id, test_ids=None):
+    """
+    Phiếu hiện tại của 1 thí sinh trong cuộc thi (1 câu) -> {bt_id: (điểm, thời gian)}.
+    Điểm: phiếu của giám khảo đang chấm nếu có, không thì TB các giám khảo.
+    Thời gian: của phiếu giám khảo đang chấm nếu có, không thì của phiếu khác.
+    """
+    qs = PhieuChamDiem.objects.filter(thiSinh=thi_sinh, cuocThi=ct)
+    if test_ids is not None:
+        qs = qs.filter(baiThi_id__in=test_ids)
+
+    by_test = {}
+    for bt_id, gk_id, diem, thoi_gian in qs.values_list("baiThi_id", "giamKhao_id", "diem", "thoiGian"):
+        by_test.setdefault(bt_id, []).append((gk_id, float(diem), thoi_gian))
+
+    sheet = {}
+    for bt_id, rows in by_test.items():
+        mine = next((r for r in rows if r[0] == judge_id), None)
+        if mine:
+            sheet[bt_id] = (mine[1], mine[2])
+        else:
+            sheet[bt_id] = (sum(r[1] for r in rows) / len(rows), rows[-1][2])
+    return sheet
+
+
 # ==== Helpers xác định loại chấm ====
 def _score_type(bt) -> str:
-    v = getattr(bt, "phuongThucCham", None)
-    if v is None:
-        return "POINTS"
-    s = str(v).strip().upper()
-    # Nếu model lưu dạng số: 0=POINTS, 1=TEMPLATE, 2=TIME (bạn có thể đổi nếu mapping khác)
-    if s in {"TIME", "2"}:
-        return "TIME"
-    if s in {"TEMPLATE", "1"}:
-        return "TEMPLATE"
-    return "POINTS"
+    return score_type(getattr(bt, "phuongThucCham", None))
 
 def _is_template(bt) -> bool:
     return _score_type(bt) == "TEMPLATE"
 
+def _time_result(schema, spec, is_done, raw_time):
+    """
+    Quy đổi 1 lần chấm bài TIME -> (diem, thoiGian lưu) theo thang đã biên dịch
+    trong schema (core/time_rules.py). Thời gian nhập sai -> ValueError.
+    """
+    index = schema.time_index(spec["id"])
+    if not is_done:
+        return index.result(False, 0)
 
-def _is_time(bt) -> bool:
-    return _score_type(bt) == "TIME"
-
-
-def _is_points(bt) -> bool:
-    return _score_type(bt) == "POINTS"
+    seconds = _parse_seconds(raw_time)
+    if seconds is None or seconds < 0:
+        raise ValueError(f"Bài {spec['ma']}: thời gian không hợp lệ (mm:ss hoặc giây).")
+    return index.result(True, seconds)
 
-def _parse_seconds(v):
-    if v is None:
-        return None
-    s = str(v).strip()
-    if not s:
-        return None
-    if ":" in s:
-        try:
-            m, sec = s.split(":")
-            return int(m)*60 + int(sec)
-        except Exception:
-            return None
-    try:
-        return int(float(s))
-    except Exception:
-        return None
 
-def _resolve_thi_sinh_from_query(q: str):
+def _resolve_thi_sinh_from_query(q: str, base=None):
     if not q:
         return None
+    base = ThiSinh.objects.all() if base is None else base
     raw = q.strip()
     # Nếu người dùng chọn từ suggestion kiểu "TS001 — Nguyễn Văn A"
     if "—" in raw:
         maybe_code = raw.split("—", 1)[0].strip()
-        ts = ThiSinh.objects.filter(maNV__iexact=maybe_code).first()
+        ts = base.filter(maNV__iexact=maybe_code).first()
         if ts:
             return ts
     # Thử mã NV (tách token đầu)
     token = raw.split()[0]
-    ts = ThiSinh.objects.filter(maNV__iexact=token).first()
+    ts = base.filter(maNV__iexact=token).first()
     if ts:
         return ts
     # Cuối cùng thử khớp tên (exact trước)
-    ts = ThiSinh.objects.filter(hoTen__iexact=raw).first()
+    ts = base.filter(hoTen__iexact=raw).first()
     if ts:
         return ts
-    # Cho “tên chứa” để tăng độ linh hoạt (lấy người đầu)
-    return ThiSinh.objects.filter(hoTen__icontains=raw).order_by("maNV").first()
+    # Cho “tên chứa” (không dấu) để tăng độ linh hoạt (lấy người khớp tốt nhất)
+    return search_thi_sinh(base, raw).first()
 
 
 
@@ -374,42 +358,29 @@ def score_view(request):
             }, status=400)
 
         try:
-            bt_obj = BaiThi.objects.get(pk=int(bt_id), vongThi=vt_obj)
+            bt_obj = BaiThi.objects.select_related("vongThi").get(pk=int(bt_id), vongThi=vt_obj)
         except BaiThi.DoesNotExist:
             return JsonResponse({
                 "ok": False,
                 "message": "Bài thi không hợp lệ trong vòng đã chọn."
             }, status=400)
 
-        bai_qs = (
-            _assigned_bai_qs(ct, judge, vt=vt_obj, bgd_active=_bgd_active(request))
-            .filter(pk=bt_obj.pk)
-            .prefetch_related("time_rules", "template_sections__items")
-        )
-
-        if not bai_qs.exists():
+        if bt_obj.pk not in _assignment_index(ct, judge, _bgd_active(request))["test_ids"]:
             return JsonResponse({
                 "ok": False,
                 "message": "Bạn không được phân công chấm bài thi này."
             }, status=403)
 
-        bai_map = {b.id: b for b in bai_qs}
-
-        def _tpl_max(b):
-            return sum(i.max_score for s in b.template_sections.all() for i in s.items.all())
-
-        limit_map = {}
-        for b in bai_qs:
-            if _is_template(b):
-                limit_map[b.id] = _tpl_max(b)
-            elif _is_points(b):
-                limit_map[b.id] = b.cachChamDiem
-            else:  # TIME
-                limit_map[b.id] = 0
-
-
+        # Loại chấm / điểm tối đa / rule thời gian lấy từ schema đã cache
+        schema = contest_schema(ct)
+        spec = schema.test(bt_obj.pk)
+        if spec is None:
+            return JsonResponse({
+                "ok": False,
+                "message": "Bài thi không hợp lệ trong vòng đã chọn."
+            }, status=400)
+        bai_map = {bt_obj.pk: bt_obj}
 
-        created = updated = 0
         errors = []
         saved_scores = {}  # {bt_id: điểm_đã_lưu}
 
@@ -420,6 +391,23 @@ def score_view(request):
         incoming_ids.update(int(k) for k in (done or {}).keys()   if str(k).isdigit())
         incoming_ids.update(int(k) for k in (times or {}).keys()  if str(k).isdigit())
 
+        # Khoá idempotency theo bài do score.js sinh TRƯỚC lần gửi đầu (cùng key hàng đợi offline
+        # dùng lại): lần gửi trước đã ghi mà mất phản hồi -> trả kết quả cũ, không ghi lại
+        keys = {
+            int(k): _submission_key(v)
+            for k, v in (payload.get("keys") or {}).items()
+            if str(k).isdigit() and int(k) in incoming_ids and _submission_key(v)
+        }
+        applied = _applied_submissions(judge, keys.values())
+        if keys and all(key in applied for key in keys.values()):
+            return JsonResponse({
+                "ok": True,
+                "message": "Điểm này đã được lưu trước đó.",
+                "errors": [],
+                "saved_scores": {btid: applied[key]["diem"] for btid, key in keys.items()},
+                "replayed": True,
+            })
+
         if incoming_ids:
             existed_qs = PhieuChamDiem.objects.filter(
                 thiSinh=thi_sinh, cuocThi=ct, baiThi_id__in=list(incoming_ids)
@@ -435,149 +423,82 @@ def score_view(request):
                 }, status=409)
 
 
-        with transaction.atomic():
-            # 1) POINTS
-            for s_id, raw in scores.items():
-                try:
-                    btid = int(s_id)
-                except ValueError:
-                    continue
-
-                bt = bai_map.get(btid)
-                # Cho phép nhập điểm cho cả POINTS và TEMPLATE (điểm tổng)
-                if not bt or not (_is_points(bt) or _is_template(bt)):
-                    continue
-
-                diem = None
-                try:
-                    diem = int(raw)
-                except (TypeError, ValueError):
-                    errors.append(f"Bài {bt.ma}: điểm không hợp lệ.")
-                    continue
-
-                maxp = limit_map.get(btid, 0)
-                if diem is None or diem < 0 or diem > maxp:
-                    errors.append(f"Bài {bt.ma}: 0..{maxp}.")
-                    continue
-
-                extra = {}
-                if _is_template(bt):
-                    t = tpl_times.get(str(btid)) or tpl_times.get(btid)
-                    sec = _parse_seconds(t)
-                    if sec is not None and sec >= 0:
-                        extra["thoiGian"] = int(sec)
-
-                obj, was_created = PhieuChamDiem.objects.update_or_create(
-                    thiSinh=thi_sinh, baiThi=bt, cuocThi=ct,
-                    defaults=dict(vongThi=bt.vongThi, diem=diem, giamKhao=judge, **extra)
-                )
-                created += int(was_created)
-                updated += int(not was_created)
-                saved_scores[btid] = diem
-
-                # Áp dụng bonus 100/0 cho vòng đặc biệt (nếu đủ 2 người trong cặp đã chấm)
-                _apply_special_round_bonus_if_ready(
-                    bt=bt,
-                    thi_sinh=thi_sinh,
-                    judge=judge,
-                    raw_total=diem,
-                    raw_time=int(extra.get("thoiGian", 0)) if extra.get("thoiGian") is not None else 0,
-                )
-
-
-            # 2) TIME (chuẩn hóa theo yêu cầu)
-            for bt in bai_qs:
-                if not _is_time(bt):
-                    continue
-                btid = bt.id
-                has_input = (
-                    str(btid) in (done or {}) or btid in (done or {})
-                    or str(btid) in (times or {}) or btid in (times or {})
-                )
-                if not has_input:
-                    continue
-
-                # Tính mốc thời gian
-                max_end = bt.time_rules.aggregate(max_end=Max("end_seconds"))["max_end"] or 0
-                allowed_max = max_end + 30          # mốc cuối + 30s: ngưỡng cho phép
-                capped_time = allowed_max + 1       # mốc cuối + 30s + 1s: thời gian mặc định khi không hoàn thành
-
-
-                is_done = bool(done.get(str(btid)) or done.get(btid))
-
-                if not is_done:
-                    # Không tick Hoàn thành → coi là không hoàn thành
-                    diem = 0
-                    stored_time = int(capped_time)
-
-                    obj, was_created = PhieuChamDiem.objects.update_or_create(
-                        thiSinh=thi_sinh, baiThi=bt, cuocThi=ct,
-                        defaults=dict(
-                            vongThi=bt.vongThi,
-                            diem=diem,
-                            thoiGian=stored_time,
-                            giamKhao=judge
-                        )
-                    )
-                    created += int(was_created); updated += int(not was_created)
-                    saved_scores[btid] = diem
-
-                    _apply_special_round_bonus_if_ready(
-                        bt=bt,
-                        thi_sinh=thi_sinh,
-                        judge=judge,
-                        raw_total=diem,
-                        raw_time=stored_time,
-                    )
-                    continue
-
-                # ĐANG TICK → LƯU thời gian + điểm
-                raw_t = times.get(str(btid)) or times.get(btid)
-                seconds = _parse_seconds(raw_t)
-                if seconds is None or seconds < 0:
-                    errors.append(f"Bài {bt.ma}: thời gian không hợp lệ (mm:ss hoặc giây).")
-                    continue
-
-                try:
-                    seconds = int(seconds or 0)
-                except Exception:
-                    seconds = 0
-
-                if seconds > allowed_max:
-                    # Quá thời gian cho phép → coi như không hoàn thành: điểm = 0
-                    diem = 0
-                    stored_time = int(capped_time)
-                else:
-                    # bonus theo rule; không match thì bonus = 0
-                    bonus = 0
-                    for r in bt.time_rules.all():
-                        if r.start_seconds <= seconds <= r.end_seconds:
-                            bonus = int(r.score)
-                            break
-                    diem = min(20, 10 + bonus)   # tổng = 10 + bonus (kẹp 20)
-                    stored_time = int(seconds or 0)
-
-                obj, was_created = PhieuChamDiem.objects.update_or_create(
-                    thiSinh=thi_sinh, baiThi=bt, cuocThi=ct,
-                    defaults=dict(
-                        vongThi=bt.vongThi,
-                        diem=diem,
-                        thoiGian=stored_time,
-                        giamKhao=judge
-                    )
-                )
-                created += int(was_created); updated += int(not was_created)
-                saved_scores[btid] = diem
-
-                _apply_special_round_bonus_if_ready(
-                    bt=bt,
-                    thi_sinh=thi_sinh,
-                    judge=judge,
-                    raw_total=diem,
-                    raw_time=stored_time,
-                )
+        # Quyền chấm đã kiểm tra ở trên (_assignment_index); gom phiếu rồi ghi 1 lần
+        rows = []  # (thí sinh, bài, điểm, thời gian | None = giữ thời gian cũ)
+
+        # 1) POINTS
+        for s_id, raw in scores.items():
+            try:
+                btid = int(s_id)
+            except ValueError:
+                continue
 
+            bt = bai_map.get(btid)
+            # Cho phép nhập điểm cho cả POINTS và TEMPLATE (điểm tổng)
+            if not bt or spec["type"] == "TIME":
+                continue
 
+            diem = None
+            try:
+                diem = int(raw)
+            except (TypeError, ValueError):
+                errors.append(f"Bài {bt.ma}: điểm không hợp lệ.")
+                continue
+
+            maxp = spec["max"]
+            if diem is None or diem < 0 or diem > maxp:
+                errors.append(f"Bài {bt.ma}: 0..{maxp}.")
+                continue
+
+            thoi_gian = None
+            if spec["type"] == "TEMPLATE":
+                t = tpl_times.get(str(btid)) or tpl_times.get(btid)
+                sec = _parse_seconds(t)
+                if sec is not None and sec >= 0:
+                    thoi_gian = int(sec)
+
+            rows.append((thi_sinh, bt, diem, thoi_gian))
+            saved_scores[btid] = diem
+
+
+        # 2) TIME (chuẩn hóa theo yêu cầu)
+        for bt in bai_map.values():
+            if spec["type"] != "TIME":
+                continue
+            btid = bt.id
+            has_input = (
+                str(btid) in (done or {}) or btid in (done or {})
+                or str(btid) in (times or {}) or btid in (times or {})
+            )
+            if not has_input:
+                continue
+
+            is_done = bool(done.get(str(btid)) or done.get(btid))
+            raw_t = times.get(str(btid)) or times.get(btid)
+            try:
+                diem, stored_time = _time_result(schema, spec, is_done, raw_t)
+            except ValueError as e:
+                errors.append(str(e))
+                continue
+
+            rows.append((thi_sinh, bt, diem, stored_time))
+            saved_scores[btid] = diem
+
+        # 3) Ghi: upsert theo (thí sinh, giám khảo, bài) + khoá idempotency cùng transaction;
+        #    vòng đặc biệt chạy sau commit
+        with transaction.atomic():
+            statuses = upsert_sheets(ct, judge, rows)
+            _record_submissions(judge, {
+                keys[bt.pk]: {
+                    "status": statuses[(thi_sinh.pk, bt.pk)],
+                    "diem": diem,
+                    "thoiGian": thoi_gian,
+                }
+                for _, bt, diem, thoi_gian in rows
+                if bt.pk in keys
+            })
+        if keys:
+            _prune_submission_keys()
 
         if errors:
             return JsonResponse({
@@ -593,9 +514,9 @@ def score_view(request):
                 "errors": errors,
                 "saved_scores": saved_scores,
                 "debug": {
-                    "count_all": len(bai_qs),
-                    "count_points": sum(1 for b in bai_qs if _is_points(b)),
-                    "count_time": sum(1 for b in bai_qs if _is_time(b)),
+                    "count_all": len(bai_map),
+                    "count_points": int(spec["type"] != "TIME"),
+                    "count_time": int(spec["type"] == "TIME"),
                 }
             })
 
@@ -631,19 +552,16 @@ def score_view(request):
             return JsonResponse([], safe=False)
 
         ct_id = request.GET.get("ct")
-        ct = CuocThi.objects.filter(trangThai=True, id=ct_id).first()
-        if not ct:
-            # Chưa chọn CT hoặc CT không hợp lệ/không bật -> không gợi ý
+        if not str(ct_id or "").isdigit():
             return JsonResponse([], safe=False)
 
-        qs = (
-            ThiSinh.objects
-            .filter(cuocThi=ct)
-            .filter(Q(maNV__icontains=query) | Q(hoTen__icontains=query))
-            .order_by("maNV")
-            .values("maNV", "hoTen")[:20]
-        )
-        return JsonResponse(list(qs), safe=False)
+        # Chỉ mục gợi ý trong bộ nhớ (core/search.py): không dấu, khớp đầu mã /
+        # đầu từ trong tên lên trước, không truy vấn DB mỗi lần gõ
+        index = contest_suggest_index(int(ct_id))
+        if not index.active:
+            # CT không hợp lệ/không bật -> không gợi ý
+            return JsonResponse([], safe=False)
+        return JsonResponse(index.lookup(query, limit=20), safe=False)
 
 
 
@@ -655,11 +573,7 @@ def score_view(request):
         base_qs = ThiSinh.objects.all()
         if ct_for_suggest:
             base_qs = base_qs.filter(cuocThi=ct_for_suggest)  # ← lọc theo mact ở ThiSinh
-        suggestions = list(
-            base_qs.filter(
-                Q(maNV__icontains=query) | Q(hoTen__icontains=query)
-            ).order_by("maNV").values("maNV", "hoTen")[:20]
-        )
+        suggestions = list(search_thi_sinh(base_qs, query).values("maNV", "hoTen")[:20])
 
 
 
@@ -691,16 +605,12 @@ def score_view(request):
     judge_for_render = _current_judge(request)
     if ct:
         # Chỉ vòng có bài hợp lệ với judge
-        vt_qs = VongThi.objects.filter(cuocThi=ct).order_by("id")
-        rounds = []
-        for vt in vt_qs:
-            if _judge_is_admin(judge_for_render) or _assigned_bai_qs(ct, judge_for_render, vt=vt, bgd_active=_bgd_active(request)).exists():
-                rounds.append({"id": vt.id, "tenVongThi": vt.tenVongThi})
+        index = _assignment_index(ct, judge_for_render, _bgd_active(request))
+        rounds = _round_options(index, judge_for_render)
         if vt_param:
             selected_vt = VongThi.objects.filter(cuocThi=ct, id=vt_param).first()
             if selected_vt:
-                tests_qs = _assigned_bai_qs(ct, judge_for_render, vt=selected_vt, bgd_active=_bgd_active(request)).order_by("id")
-                tests = list(tests_qs.values("id", "ma", "tenBaiThi"))
+                tests = _round_tests(index, selected_vt.id)
                 if bt_param:
                     selected_bt = BaiThi.objects.filter(vongThi=selected_vt, id=bt_param).first()
 
@@ -714,7 +624,7 @@ def score_view(request):
         if selected_vt:
             structure = [
                 blk for blk in structure
-                if getattr(blk.get("vong"), "id", None) == selected_vt.id
+                if blk["vong"]["id"] == selected_vt.id
             ]
 
         # lọc đúng 1 bài thi
@@ -748,22 +658,11 @@ def score_view(request):
             if ct_obj:
                 judge = _current_judge(request)
                 # Chỉ những vòng có ít nhất 1 bài hợp lệ với judge
-                vt_qs = (VongThi.objects
-                         .filter(cuocThi=ct_obj)
-                         .order_by("id"))
-                rounds = []
-                for vt in vt_qs:
-                    if _judge_is_admin(judge) or _assigned_bai_qs(ct_obj, judge, vt=vt, bgd_active=_bgd_active(request)).exists():
-                        rounds.append({"id": vt.id, "tenVongThi": vt.tenVongThi})
-                data["rounds"] = rounds
+                index = _assignment_index(ct_obj, judge, _bgd_active(request))
+                data["rounds"] = _round_options(index, judge)
 
                 if vt_id:
-                    vt_obj = VongThi.objects.filter(cuocThi=ct_obj, id=vt_id).first()
-                    if vt_obj:
-                        tests_qs = _assigned_bai_qs(ct_obj, judge, vt=vt_obj, bgd_active=_bgd_active(request)).order_by("id")
-                        data["tests"] = list(
-                            tests_qs.values("id", "ma", "tenBaiThi")
-                        )
+                    data["tests"] = _round_tests(index, vt_id)
         return JsonResponse(data)
 
     return render(request, "score/index.html", {
@@ -793,10 +692,334 @@ def score_view(request):
 
 
     
+# Số mục tối đa trong 1 lần gửi /score/bulk/
+BULK_MAX_ENTRIES = 500
+# Khoá idempotency được giữ bao lâu (hàng đợi offline phải gửi lại trong khoảng này)
+SUBMISSION_KEY_TTL = timedelta(days=2)
+_next_key_prune = 0.0
+
+
+def _submission_key(raw):
+    return str(raw).strip()[:64] if raw else ""
+
+
+def _applied_submissions(judge, keys):
+    """{key: result} của các khoá idempotency đã áp dụng (chưa hết hạn) trong keys."""
+    keys = set(keys) - {""}
+    if not keys:
+        return {}
+    return dict(
+        ScoreSubmissionKey.objects.filter(
+            giamKhao=judge, key__in=keys, expires_at__gt=timezone.now(),
+        ).values_list("key", "result")
+    )
+
+
+def _record_submissions(judge, results):
+    """results: {key: {"status", "diem", "thoiGian"}} -> lưu khoá (gọi trong transaction ghi phiếu)."""
+    expires_at = timezone.now() + SUBMISSION_KEY_TTL
+    ScoreSubmissionKey.objects.bulk_create(
+        [
+            ScoreSubmissionKey(giamKhao=judge, key=key, result=result, expires_at=expires_at)
+            for key, result in results.items()
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def _prune_submission_keys():
+    """Xoá khoá đã hết hạn, tối đa 10 phút 1 lần mỗi tiến trình."""
+    global _next_key_prune
+    now = time.monotonic()
+    if now < _next_key_prune:
+        return
+    _next_key_prune = now + 600
+    ScoreSubmissionKey.objects.filter(expires_at__lt=timezone.now()).delete()
+
+
+def _bulk_find_thi_sinh(codes):
+    """
+    Tra nhiều thí sinh 1 lần: khớp mã NV hoặc họ tên, không phân biệt hoa/thường và dấu
+    (so trên search_key = "<mã NV> <họ tên>" đã fold_text). -> {fold_text(code): ThiSinh}
+    Mã NV khớp trước họ tên.
+    """
+    keys = {fold_text(c) for c in codes if c} - {""}
+    if not keys:
+        return {}
+    q = Q()
+    for k in keys:
+        # đầu search_key = mã NV (index tiền tố), cuối = họ tên (pg_trgm trên PostgreSQL)
+        q |= Q(search_key=k) | Q(search_key__startswith=f"{k} ") | Q(search_key__endswith=f" {k}")
+    by_code, by_name = {}, {}
+    for ts in ThiSinh.objects.filter(q).order_by("maNV"):
+        code = fold_text(ts.maNV)
+        if code in keys:
+            by_code.setdefault(code, ts)
+        name = fold_text(ts.hoTen)
+        if name in keys:
+            by_name.setdefault(name, ts)
+    return {**by_name, **by_code}
+
+
+@judge_required
+@require_http_methods(["POST"])
+def score_bulk_view(request):
+    """
+    POST /score/bulk/  — lưu nhiều phiếu (nhiều thí sinh × nhiều bài) trong 1 request.
+
+    Body:
+      {"ct_id": 1, "force": false, "entries": [
+          {"thiSinh": "NV001", "bt_id": 3, "score": 8},                  # POINTS / TEMPLATE
+          {"thiSinh": "NV001", "bt_id": 4, "score": 30, "time": "1:05"},  # TEMPLATE + thời gian
+          {"thiSinh": "NV002", "bt_id": 5, "done": true, "time": "0:45"}, # TIME
+      ]}
+    Mỗi mục có thể kèm "key" (idempotency, do client sinh): mục có key đã áp dụng
+    thì không ghi lại mà trả kết quả cũ kèm "replayed": true — hàng đợi offline
+    của score.js gửi lại bao nhiêu lần cũng chỉ ghi 1 lần.
+
+    Kiểm tra theo tập (vài câu cho cả lô, không theo từng mục): thí sinh, bài
+    thuộc cuộc thi & được phân công, giới hạn điểm, phiếu đã có. Các mục hợp lệ
+    được ghi bằng 1 câu upsert trên khoá (thí sinh, giám khảo, bài thi).
+    Mục trùng (thí sinh, bài) trong cùng lô: mục sau thắng.
+
+    Trả về results theo đúng thứ tự gửi lên:
+      {"i", "ok", "status": created|updated|already_scored|duplicate|error,
+       "message", "diem", "thoiGian"}
+    """
+    try:
+        payload = json.loads(request.body.decode("utf-8"))
+    except Exception:
+        return HttpResponseBadRequest("Invalid JSON")
+
+    entries = payload.get("entries")
+    if not isinstance(entries, list) or not entries:
+        return JsonResponse({"ok": False, "message": "Không có mục nào để lưu."}, status=400)
+    if len(entries) > BULK_MAX_ENTRIES:
+        return JsonResponse({
+            "ok": False,
+            "message": f"Tối đa {BULK_MAX_ENTRIES} mục mỗi lần gửi.",
+        }, status=400)
+
+    ct_id = payload.get("ct_id")
+    ct = _pick_competition(int(ct_id)) if ct_id else _active_competition()
+    if not ct:
+        return JsonResponse({"ok": False, "message": "Chưa có cuộc thi hợp lệ."}, status=400)
+
+    judge = _current_judge(request)
+    if not judge:
+        return JsonResponse({"ok": False, "message": "Bạn chưa đăng nhập giám khảo."}, status=401)
+
+    force = bool(payload.get("force"))
+    results = [{"i": i, "ok": False, "status": "error"} for i in range(len(entries))]
+
+    def fail(i, message, status="error"):
+        results[i].update(status=status, message=message)
+
+    # --- 1) Chuẩn hoá đầu vào ---
+    keys = {
+        i: _submission_key(e.get("key"))
+        for i, e in enumerate(entries)
+        if isinstance(e, dict) and e.get("key")
+    }
+    applied = _applied_submissions(judge, keys.values())
+
+    parsed = []  # (i, ts_code, bt_id, entry)
+    for i, e in enumerate(entries):
+        if not isinstance(e, dict):
+            fail(i, "Mục không hợp lệ.")
+            continue
+        if keys.get(i) in applied:
+            results[i].update(applied[keys[i]], ok=True, replayed=True)
+            continue
+        ts_code = str(e.get("thiSinh") or "").strip()
+        try:
+            bt_id = int(e.get("bt_id"))
+        except (TypeError, ValueError):
+            fail(i, "Thiếu bài thi.")
+            continue
+        if not ts_code:
+            fail(i, "Thiếu thí sinh.")
+            continue
+        parsed.append((i, ts_code, bt_id, e))
+
+    # --- 2) Tra cứu theo tập ---
+    ts_map = _bulk_find_thi_sinh({code for _, code, _, _ in parsed})
+    bt_ids = {bt_id for _, _, bt_id, _ in parsed}
+    allowed_ids = _assignment_index(ct, judge, _bgd_active(request))["test_ids"]
+    schema = contest_schema(ct)
+    bai_map = {
+        b.id: b
+        for b in BaiThi.objects.filter(pk__in=bt_ids & allowed_ids & set(schema.tests)).select_related("vongThi")
+    }
+    # Bài có trong cuộc thi nhưng không được phân công -> báo lỗi rõ hơn
+    unassigned = (bt_ids - set(bai_map)) & set(schema.tests)
+
+    # --- 3) Tính điểm từng mục (không truy vấn) ---
+    pending = {}  # (ts_id, bt_id) -> (i, thi_sinh, bt, diem, thoiGian | None)
+    for i, ts_code, bt_id, e in parsed:
+        thi_sinh = ts_map.get(fold_text(ts_code))
+        if not thi_sinh:
+            fail(i, "Không tìm thấy thí sinh.")
+            continue
+        bt = bai_map.get(bt_id)
+        if not bt:
+            if bt_id in unassigned:
+                fail(i, "Bạn không được phân công chấm bài thi này.")
+            else:
+                fail(i, "Bài thi không hợp lệ trong cuộc thi này.")
+            continue
+
+        spec = schema.tests[bt_id]
+        thoi_gian = None
+        if spec["type"] == "TIME":
+            try:
+                diem, thoi_gian = _time_result(schema, spec, bool(e.get("done")), e.get("time"))
+            except ValueError as ex:
+                fail(i, str(ex))
+                continue
+        else:
+            try:
+                diem = int(e.get("score"))
+            except (TypeError, ValueError):
+                fail(i, f"Bài {bt.ma}: điểm không hợp lệ.")
+                continue
+            maxp = spec["max"]
+            if spec["type"] == "TEMPLATE":
+                sec = _parse_seconds(e.get("time"))
+                if sec is not None and sec >= 0:
+                    thoi_gian = int(sec)
+            if diem < 0 or diem > maxp:
+                fail(i, f"Bài {bt.ma}: 0..{maxp}.")
+                continue
+
+        key = (thi_sinh.pk, bt.id)
+        if key in pending:
+            fail(pending[key][0], "Bị thay bởi mục sau cùng thí sinh / bài thi.", status="duplicate")
+        pending[key] = (i, thi_sinh, bt, diem, thoi_gian)
+
+    # --- 4) Phiếu đã có (1 câu) ---
+    existing = {}  # (ts_id, bt_id) -> {giamKhao_id: thoiGian}
+    if pending:
+        for r in PhieuChamDiem.objects.filter(
+            cuocThi=ct,
+            thiSinh_id__in={ts for ts, _ in pending},
+            baiThi_id__in={bt for _, bt in pending},
+        ).values("thiSinh_id", "baiThi_id", "giamKhao_id", "thoiGian"):
+            existing.setdefault((r["thiSinh_id"], r["baiThi_id"]), {})[r["giamKhao_id"]] = r["thoiGian"]
+
+    to_save = []  # (thí sinh, bài, điểm, thời gian)
+    for key, (i, thi_sinh, bt, diem, thoi_gian) in list(pending.items()):
+        had = existing.get(key, {})
+        if had and not force:
+            fail(i, "Thí sinh này đã được chấm điểm bài này.", status="already_scored")
+            del pending[key]
+            continue
+        if thoi_gian is None:
+            # POINTS / TEMPLATE không gửi thời gian: giữ thời gian cũ của phiếu
+            thoi_gian = had.get(judge.pk, 0)
+        to_save.append((thi_sinh, bt, diem, thoi_gian))
+        results[i].update(
+            ok=True,
+            status="updated" if judge.pk in had else "created",
+            diem=diem,
+            thoiGian=thoi_gian,
+        )
+        pending[key] = (i, thi_sinh, bt, diem, thoi_gian)
+
+    # --- 5) Ghi 1 lần (upsert + khoá idempotency cùng transaction; vòng đặc biệt sau commit) ---
+    if to_save:
+        with transaction.atomic():
+            upsert_sheets(ct, judge, to_save)
+            _record_submissions(judge, {
+                keys[i]: {k: results[i][k] for k in ("status", "diem", "thoiGian")}
+                for i, *_ in pending.values()
+                if keys.get(i)
+            })
+
+    if keys:
+        _prune_submission_keys()
+
+    saved = sum(1 for r in results if r["ok"])
+    return JsonResponse({
+        "ok": saved == len(entries),
+        "message": f"Đã lưu {saved}/{len(entries)} mục.",
+        "saved": saved,
+        "results": results,
+    })
+
+
+def _schema_etag(request, ct_id: int):
+    return f"sc-{ct_id}-{contest_schema(ct_id).digest}"
+
+
+@judge_required
+@require_http_methods(["GET"])
+@condition(etag_func=_schema_etag)
+def score_schema_view(request, ct_id: int):
+    """
+    GET -> cấu trúc chấm của cuộc thi (vòng → bài → loại chấm, điểm tối đa, rule, mẫu chấm).
+    ETag = digest nội dung: client giữ bản cũ, gửi If-None-Match -> 304 khi chưa đổi.
+    """
+    ct = get_object_or_404(CuocThi, pk=ct_id)
+    schema = contest_schema(ct)
+    resp = JsonResponse({"ok": True, "digest": schema.digest, **schema.as_dict()})
+    patch_cache_control(resp, private=True, no_cache=True)
+    return resp
+
+
+@judge_required
+@require_http_methods(["GET"])
+def score_sheet_view(request):
+    """
+    GET /score/sheet/?ct=<id>&ts=<mã NV>  (hoặc q=<"mã — tên" / tên> như ô tìm kiếm)
+    -> phiếu hiện tại của thí sinh cho các bài giám khảo được chấm, không render template:
+      {"ok", "digest", "ts": {maNV, hoTen, donVi, chiNhanh},
+       "sheets": {"<bt_id>": {"current": điểm, "time": giây | null}}}
+    Cấu trúc bài (loại chấm, max, rule) client lấy 1 lần từ /score/schema/<ct_id>/;
+    digest đổi -> client tải lại schema. Lưu điểm vẫn POST JSON về /score/.
+    """
+    ct_id = request.GET.get("ct")
+    ct = CuocThi.objects.filter(trangThai=True, id=ct_id).first() if str(ct_id or "").isdigit() else None
+    if not ct:
+        return JsonResponse({"ok": False, "message": "Chưa có cuộc thi hợp lệ."}, status=400)
+
+    judge = _current_judge(request)
+    if not judge:
+        return JsonResponse({"ok": False, "message": "Bạn chưa đăng nhập giám khảo."}, status=401)
+
+    members = ThiSinh.objects.filter(cuocThi=ct)
+    code = (request.GET.get("ts") or "").strip()
+    if code:
+        thi_sinh = members.filter(Q(maNV__iexact=code) | Q(hoTen__iexact=code)).first()
+    else:
+        thi_sinh = _resolve_thi_sinh_from_query(request.GET.get("q") or "", members)
+    if not thi_sinh:
+        return JsonResponse({"ok": False, "message": "Không tìm thấy thí sinh trong cuộc thi này."}, status=404)
+
+    allowed_ids = _assignment_index(ct, judge, _bgd_active(request))["test_ids"]
+    sheet = _current_sheet(thi_sinh, ct, judge.pk, allowed_ids)
+    resp = JsonResponse({
+        "ok": True,
+        "digest": contest_schema(ct).digest,
+        "ts": {
+            "maNV": thi_sinh.maNV,
+            "hoTen": thi_sinh.hoTen,
+            "donVi": thi_sinh.donVi or "",
+            "chiNhanh": thi_sinh.chiNhanh or "",
+        },
+        "sheets": {
+            str(bt_id): {"current": current, "time": thoi_gian}
+            for bt_id, (current, thoi_gian) in sheet.items()
+        },
+    })
+    patch_cache_control(resp, private=True, no_store=True)
+    return resp
+
+
 @judge_required
 @require_http_methods(["GET", "POST"])
 def score_template_api(request, btid: int):
-    bt = get_object_or_404(BaiThi.objects.prefetch_related("template_sections__items"), pk=btid)
+    bt = get_object_or_404(BaiThi.objects.select_related("vongThi__cuocThi"), pk=btid)
     if str(bt.phuongThucCham).upper() != "TEMPLATE":
         return JsonResponse({"ok": False, "message": "Bài thi này không phải chấm theo mẫu."}, status=400)
 
@@ -811,10 +1034,8 @@ def score_template_api(request, btid: int):
     # BGD (đồng thời là Giám khảo) trong 'Chung Kết': cũng luôn được
     # Admin: luôn được
     # BGD: CHỈ khi đi từ QR (/score/bgd/) và là 'Chung Kết'
-    bgd_on = _bgd_active(request)
-    if not (_judge_is_admin(judge) or (bgd_on and _judge_is_bgd(judge) and _is_chung_ket(ct_of_bt))):
-        if not GiamKhaoBaiThi.objects.filter(giamKhao=judge, baiThi=bt).exists():
-            return JsonResponse({"ok": False, "message": "Bạn không được phân công chấm bài này."}, status=403)
+    if bt.id not in _assignment_index(ct_of_bt, judge, _bgd_active(request))["test_ids"]:
+        return JsonResponse({"ok": False, "message": "Bạn không được phân công chấm bài này."}, status=403)
 
 
     if request.method == "GET":
@@ -823,47 +1044,10 @@ def score_template_api(request, btid: int):
             if not _is_template(bt):
                 return JsonResponse({"ok": False, "message": "Bài thi này không phải chấm theo mẫu."}, status=400)
 
-            sections = []
-            total_max = 0
-
-            # Lấy danh sách section theo 2 cách để tránh lệ thuộc related_name
-            try:
-                sec_qs = bt.template_sections.all().order_by("stt", "id")
-            except Exception:
-                try:
-                    sec_qs = BaiThiTemplateSection.objects.filter(baiThi=bt).order_by("stt", "id")
-                except Exception:
-                    return JsonResponse({"ok": False, "message": "Không tìm thấy quan hệ sections cho bài thi này."}, status=500)
-
-            for s in sec_qs:
-                # Lấy danh sách item theo 2 cách (an toàn với related_name)
-                try:
-                    item_qs = s.items.all().order_by("stt", "id")
-                except Exception:
-                    try:
-
-                        item_qs = BaiThiTemplateItem.objects.filter(section=s).order_by("stt", "id")
-                    except Exception:
-                        return JsonResponse({"ok": False, "message": f"Không tìm thấy items cho section {getattr(s,'id','?')}."}, status=500)
-
-                items = []
-                for i in item_qs:
-                    items.append({
-                        "id": i.id,
-                        "stt": getattr(i, "stt", None),
-                        "content": getattr(i, "content", ""),
-                        "max": int(getattr(i, "max_score", 0) or 0),
-                        "note": getattr(i, "note", "") or "",
-                    })
-                    total_max += int(getattr(i, "max_score", 0) or 0)
-
-                sections.append({
-                    "id": s.id,
-                    "stt": getattr(s, "stt", None),
-                    "title": getattr(s, "title", ""),
-                    "note": getattr(s, "note", "") or "",
-                    "items": items,
-                })
+            # Mục lớn / mục con đã sắp theo stt trong schema
+            spec = contest_schema(ct_of_bt).test(bt.id)
+            sections = spec["sections"]
+            total_max = spec["max"]
 
             return JsonResponse({
                 "ok": True,
@@ -915,10 +1099,8 @@ def score_template_api(request, btid: int):
         return JsonResponse({"ok": False, "message": "Bạn chưa đăng nhập giám khảo."}, status=401)
 
     # Map max cho từng item
-    max_map = {}
-    for s in bt.template_sections.all():
-        for i in s.items.all():
-            max_map[i.id] = int(i.max_score or 0)
+    spec = contest_schema(ct_of_bt).test(bt.id)
+    max_map = {i["id"]: i["max"] for sec in spec["sections"] for i in sec["items"]}
 
     errors = []
     total = 0
@@ -962,88 +1144,11 @@ def score_template_api(request, btid: int):
         except ValueError:
             total_seconds = 0
 
-    with transaction.atomic():
-        obj, created = PhieuChamDiem.objects.update_or_create(
-            thiSinh=thi_sinh, giamKhao=judge, baiThi=bt,
-            defaults=dict(
-                cuocThi=ct,
-                vongThi=bt.vongThi,
-                diem=total,
-                thoiGian=total_seconds,  # 👈 lưu thời gian hoàn thành (raw để so sánh)
-            )
-        )
-
-        # Nếu là vòng đặc biệt, thử áp dụng điểm thưởng (special_bonus_score) 100/0
-        _apply_special_round_bonus_if_ready(
-            bt=bt,
-            thi_sinh=thi_sinh,
-            judge=judge,
-            raw_total=total,
-            raw_time=total_seconds,
-        )
+    # upsert theo (thí sinh, giám khảo, bài); vòng đặc biệt (100/0) chạy sau commit
+    upsert_sheets(ct, judge, [(thi_sinh, bt, total, total_seconds)])
 
     return JsonResponse({
         "ok": True,
         "saved_total": total,
         "message": f"Đã lưu {total} điểm cho {bt.ma} (TEMPLATE).",
     })
-    
-# views_score.py
-def _apply_special_round_bonus_if_ready(bt, thi_sinh, judge, raw_total, raw_time):
-    """
-    Vòng đặc biệt (pair):
-    - Chỉ chạy nếu vongThi.is_special_bonus_round == True.
-    - Ghi log (SpecialRoundScoreLog) mỗi lần chấm.
-    - Tổng hợp cả CẶP bằng compute_special_round_pair_result(...) để biết winner/loser.
-    - ÁP DỤNG MỚI:
-        * Winner: GIỮ NGUYÊN điểm raw đã chấm (KHÔNG đè = 100).
-        * Loser : set = 0 cho mọi phiếu của bài đó trong cặp.
-    """
-    vt = getattr(bt, "vongThi", None)
-    if not vt or not getattr(vt, "is_special_bonus_round", False):
-        return
-
-    ct = getattr(vt, "cuocThi", None)
-    if not ct or not thi_sinh:
-        return
-
-    # 2) Lấy cặp của thí sinh này trong vòng hiện tại (lấy trước để có pair_member)
-    pair_member = SpecialRoundPairMember.objects.filter(
-        pair__vongThi=vt, pair__cuocThi=ct, thiSinh=thi_sinh
-    ).select_related("pair").first()
-    if not pair_member:
-        return
-
-    # 1) Ghi lại log raw (điểm + thời gian) cho lần chấm này
-    SpecialRoundScoreLog.objects.update_or_create(
-        cuocThi=ct,
-        vongThi=vt,
-        baiThi=bt,
-        pair_member=pair_member,
-        giamKhao=judge,
-        defaults=dict(raw_score=raw_total, raw_time=raw_time),
-    )
-
-
-    result_map = compute_special_round_pair_result(ct, vt, bt, pair_member.pair)
-
-    # CHỐT: chưa đủ dữ liệu để kết luận thì KHÔNG set 0 cho ai cả
-    if not result_map or len(result_map) < 2:
-        return
-
-    members = SpecialRoundPairMember.objects.filter(pair=pair_member.pair).values_list("thiSinh_id", flat=True)
-    for ts_id in members:
-        is_winner = (result_map.get(ts_id, 0) == 100)
-
-
-        # Tập phiếu của thí sinh ts_id trong BÀI hiện tại
-        qs = PhieuChamDiem.objects.filter(
-            cuocThi=ct, vongThi=vt, baiThi=bt, thiSinh_id=ts_id
-        )
-
-        if is_winner:
-            # KHÔNG can thiệp: để nguyên điểm raw đã chấm
-            continue
-        else:
-            # Loser => 0 điểm
-            qs.update(diem=0)
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import tempfile
 import dj_database_url
 from pathlib import Path
 
@@ -138,6 +139,56 @@ DATABASES = {
     )
 }
 
+# Cache
+# - "default": LocMem riêng từng tiến trình (dữ liệu tạm, không cần chia sẻ)
+# - "shared" : dùng chung giữa các worker gunicorn (bản sao cờ runtime như ranking_enabled —
+#              gốc ở bảng RuntimeFlag nên cull / evict không làm mất —, dữ liệu xếp hạng
+#              đã tính, fragment đã render). Chọn bằng SHARED_CACHE_URL:
+#     (trống)               -> file trên đĩa (1 máy, không cần dịch vụ ngoài)
+#     file:///duong/dan     -> file trên đĩa, thư mục chỉ định
+#     db://                 -> bảng DB "core_shared_cache" (chạy `python manage.py createcachetable` 1 lần)
+#     redis://host:6379/0   -> Redis (cần cài thêm gói `redis`)
+def _shared_cache_config(url):
+    url = (url or "").strip()
+    if url.startswith(("redis://", "rediss://")):
+        return {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": url,
+            "KEY_PREFIX": "btv",
+        }
+    if url.startswith("db://"):
+        return {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "core_shared_cache",
+        }
+    location = url[len("file://"):] if url.startswith("file://") else ""
+    return {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": location or os.path.join(tempfile.gettempdir(), "btv-shared-cache"),
+        "OPTIONS": {"MAX_ENTRIES": 5000},
+    }
+
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "shared": _shared_cache_config(os.getenv("SHARED_CACHE_URL")),
+}
+
+# Bus báo huỷ cache trong tiến trình (core/invalidation.py):
+#   "db" = poll bảng InvalidationEvent, tối đa mỗi INVALIDATION_POLL_MS 1 lần
+#   "pg" = như "db" + LISTEN/NOTIFY của PostgreSQL để báo ngay (cần psycopg v3)
+INVALIDATION_TRANSPORT = os.getenv("INVALIDATION_TRANSPORT", "db")
+INVALIDATION_POLL_MS = int(os.getenv("INVALIDATION_POLL_MS", "200"))
+# Mỗi lần poll đọc lại event của N giây gần nhất: bắt event id nhỏ commit muộn (phải > độ trễ commit)
+INVALIDATION_RESCAN_S = int(os.getenv("INVALIDATION_RESCAN_S", "10"))
+
+# Số tiến trình vẽ thẻ QR BGD khi xuất zip (core/qr_cards.py); 0 = vẽ ngay trong request
+QR_RENDER_WORKERS = int(os.getenv("QR_RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Thư mục lưu thẻ QR đã vẽ (file đặt tên theo hash đầu vào, xoá lúc nào cũng được)
+QR_CACHE_DIR = os.getenv("QR_CACHE_DIR", os.path.join(BASE_DIR, "qr_cache"))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
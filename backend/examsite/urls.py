@@ -9,7 +9,8 @@ from core.views_home import home_view, manage_view
 from core.views_auth import login_view, logout_view
 from core.views_organize import organize_view, competition_list_view
 from core.views_score import score_view
-from core.views_ranking import ranking_view
+from core.views_ranking import ranking_view, ranking_api_view
+from core.views_events import contest_events_view
 from core.views_management import management_view, ranking_state
 from core.views_export import (
     export_page,
@@ -21,7 +22,7 @@ from core import views_score
 from core.views_admin import import_view, upload_avatars_view
 from core.views_bgd import (
     bgd_qr_index,
-    bgd_qr_png,
+    bgd_qr_card,
     bgd_go,
     bgd_go_stars,
     bgd_battle_go,
@@ -29,6 +30,7 @@ from core.views_bgd import (
     bgd_qr_zip_all,
     bgd_list,
     bgd_save_score,
+    bgd_save_scores,
 )
 from core.views_battle import (
     battle_view,
@@ -53,6 +55,9 @@ urlpatterns = [
 
     path("score/", score_view),
     path("score/template/<int:btid>/", views_score.score_template_api, name="score_template_api"),
+    path("score/bulk/", views_score.score_bulk_view, name="score-bulk"),
+    path("score/schema/<int:ct_id>/", views_score.score_schema_view, name="score-schema"),
+    path("score/sheet/", views_score.score_sheet_view, name="score-sheet"),
     path("score/bgd/", score_bgd_view, name="score-bgd"),
 
     path("organize/competitions/", competition_list_view, name="competition-list"),
@@ -63,6 +68,8 @@ urlpatterns = [
     path("admin/", admin.site.urls),
 
     path("ranking/", ranking_view),
+    path("ranking/api/", ranking_api_view, name="ranking-api"),
+    path("events/<int:ct_id>/", contest_events_view, name="contest-events"),
     path("management/", management_view, name="management"),
     path("management/ranking-state", ranking_state, name="ranking-state"),
 
@@ -78,7 +85,8 @@ urlpatterns = [
     path("bgd/", bgd_list, name="bgd-list"),
     path("bgd/qr/", bgd_qr_index, name="bgd-qr"),
     path("bgd/qr/<str:token>/", bgd_qr_index, name="bgd-qr-one"),
-    path("bgd/qr/<int:ct_id>/<int:vt_id>/<str:token>.png", bgd_qr_png, name="bgd-qr-png"),
+    path("bgd/qr/<int:ct_id>/<int:vt_id>/<str:token>.png", bgd_qr_card, {"fmt": "png"}, name="bgd-qr-png"),
+    path("bgd/qr/<int:ct_id>/<int:vt_id>/<str:token>.svg", bgd_qr_card, {"fmt": "svg"}, name="bgd-qr-svg"),
     path("bgd/qr-all.zip", bgd_qr_zip_all, name="bgd-qr-all"),
 
     path("bgd/go/<int:ct_id>/<int:vt_id>/<str:token>/", bgd_go, name="bgd-go"),
@@ -89,6 +97,7 @@ urlpatterns = [
     ),
     path("bgd/battle/<str:token>/", bgd_battle_go, name="bgd-battle-go"),
     path("bgd/api/save-score/", bgd_save_score, name="bgd-save-score"),
+    path("bgd/api/save-scores/", bgd_save_scores, name="bgd-save-scores"),
 
     # Battle
     path("battle/", battle_view, name="battle"),